@@ -0,0 +1,422 @@
+"""
+Headless HTTP API for MiaChat, serving the chat core as JSON and
+Server-Sent-Events endpoints on one asyncio event loop.
+
+    python api_server.py --port 8080
+
+    POST /v1/chat              {"messages": [...], "provider": "gpt", "model": "gpt-3.5-turbo", "stream": true, "session_id": ...}
+    POST /v1/quick-replies     {"messages": [...]}
+    POST /v1/demo-bookings     {"name": ..., "email": ..., ...}  (optional Idempotency-Key header)
+    GET  /v1/demo-bookings/<booking_id>
+    GET  /v1/integrations/<type>
+    GET  /v1/features/<name>
+    GET  /healthz
+    GET  /metrics
+
+Clients keep the transcript and send it with every request as an
+OpenAI-format message list. Chat replies stream as "delta" events followed
+by one "done" event carrying the full text and token usage; send
+"stream": false to get a single JSON reply instead. Replies answered
+locally by the intent router use no tokens and name the matched "intent".
+With "model": "auto" each message goes to the provider's fast or strong
+model by its complexity, and the reply names the "model" it was sent to.
+
+Demo bookings need an email and are confirmed as soon as they are in the
+outbox; the reply's "booking_id" can then be polled for the delivery
+status. A demo request in chat without an email is answered with a prompt
+for one, and the next message giving it books the demo.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from http import HTTPStatus
+from urllib.parse import unquote
+
+from conversation import Conversation
+from chat_core import (
+    AUTO_MODEL,
+    EMAIL_PATTERN,
+    PROVIDER_MODELS,
+    aget_chat_response,
+    answer_locally,
+    agenerate_quick_replies,
+    get_booking_status,
+    get_context_manager,
+    get_feature_info,
+    get_integration_info,
+    get_metrics,
+    get_system_prompt_tokens,
+    handle_demo_booking,
+    resolve_model
+)
+
+# Largest request body accepted, in bytes
+MAX_BODY_BYTES = 1024 * 1024
+
+# Seconds an idle keep-alive connection is held open
+KEEP_ALIVE_TIMEOUT = 15
+
+# Value of Access-Control-Allow-Origin for browser widgets; empty disables CORS
+CORS_ORIGIN = os.getenv("MIACHAT_API_CORS_ORIGIN", "*")
+
+logger = logging.getLogger("miachat.api")
+
+
+class HTTPError(Exception):
+    """
+    Error turned into a JSON error response
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    def __init__(self, method, path, headers, body):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        try:
+            payload = json.loads(self.body or b"{}")
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Request body must be JSON")
+        if not isinstance(payload, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Request body must be a JSON object")
+        return payload
+
+    @property
+    def keep_alive(self):
+        return self.headers.get("connection", "").lower() != "close"
+
+
+async def read_request(reader):
+    """
+    Parse one HTTP/1.1 request, returning None when the client has closed
+    the connection
+    """
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    try:
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+    if length < 0:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return Request(method.upper(), target.split("?", 1)[0], headers, body)
+
+
+def _headers(status, content_type, extra=()):
+    lines = [f"HTTP/1.1 {status.value} {status.phrase}", f"Content-Type: {content_type}"]
+    if CORS_ORIGIN:
+        lines.append(f"Access-Control-Allow-Origin: {CORS_ORIGIN}")
+    lines.extend(extra)
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def send_json(writer, status, payload, keep_alive=True):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    writer.write(_headers(status, "application/json", [
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}"
+    ]) + body)
+    await writer.drain()
+
+
+async def send_events(writer, events):
+    """
+    Stream (event, data) pairs as Server-Sent Events, then close
+    """
+    writer.write(_headers(HTTPStatus.OK, "text/event-stream", ["Cache-Control: no-cache", "Connection: close"]))
+    await writer.drain()
+    async for event, data in events:
+        writer.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+        await writer.drain()
+
+
+def _messages(payload, require_user_turn=False):
+    """
+    Validate an OpenAI-format message list from a request body
+    """
+    messages = payload.get("messages")
+    if not isinstance(messages, list):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "messages must be a list")
+    for message in messages:
+        if (not isinstance(message, dict) or message.get("role") not in ("user", "assistant")
+                or not isinstance(message.get("content"), str)):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Each message needs a user or assistant role and string content")
+    if require_user_turn and (not messages or messages[-1]["role"] != "user"):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "messages must end with a user message")
+    return [{"role": message["role"], "content": message["content"]} for message in messages]
+
+
+def _window(messages, model, reserved_tokens=0):
+    """
+    Fit a request's transcript into the model's token budget. API
+    transcripts are not kept, so no summary is scheduled for them.
+    """
+    return get_context_manager().window(Conversation(messages), model, reserved_tokens=reserved_tokens, refresh_summary=False)
+
+
+async def chat(request, writer):
+    payload = request.json()
+    provider = payload.get("provider", "gpt")
+    if provider not in PROVIDER_MODELS:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"provider must be one of {', '.join(PROVIDER_MODELS)}")
+    model = payload.get("model", PROVIDER_MODELS[provider][0])
+    models = PROVIDER_MODELS[provider] + [AUTO_MODEL]
+    if model not in models:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"model must be one of {', '.join(models)}")
+    messages = _messages(payload, require_user_turn=True)
+    model = resolve_model(provider, model, messages[-1]["content"])
+    history = _window(messages, model, reserved_tokens=get_system_prompt_tokens())
+
+    # Demo requests made in chat are booked under the client's session id;
+    # the booking is a local SQLite commit, kept off the event loop
+    local_answer = await asyncio.to_thread(
+        answer_locally, history, session_id=str(payload.get("session_id") or uuid.uuid4().hex)
+    )
+    if local_answer is not None:
+        reply = {"text": local_answer["text"], "usage": {}, "intent": local_answer["intent"]}
+        if "booking_id" in local_answer.get("booking", {}):
+            reply["booking_id"] = local_answer["booking"]["booking_id"]
+        if not payload.get("stream", True):
+            await send_json(writer, HTTPStatus.OK, reply, request.keep_alive)
+            return request.keep_alive
+
+        async def local_events():
+            yield "delta", {"text": reply["text"]}
+            yield "done", reply
+
+        await send_events(writer, local_events())
+        return False
+
+    usage = {}
+    deltas = aget_chat_response(history, provider, model, on_usage=usage.update)
+    metrics = get_metrics()
+
+    def observe_ttft(start):
+        ttft = time.perf_counter() - start
+        metrics.observe("miachat_time_to_first_token_seconds", ttft, provider=provider)
+
+    if not payload.get("stream", True):
+        start = time.perf_counter()
+        chunks = []
+        async for delta in deltas:
+            if not chunks:
+                observe_ttft(start)
+            chunks.append(delta)
+        await send_json(writer, HTTPStatus.OK, {"text": "".join(chunks), "usage": usage, "model": model}, request.keep_alive)
+        return request.keep_alive
+
+    async def events():
+        start = time.perf_counter()
+        chunks = []
+        async for delta in deltas:
+            if not chunks:
+                observe_ttft(start)
+            chunks.append(delta)
+            yield "delta", {"text": delta}
+        yield "done", {"text": "".join(chunks), "usage": usage, "model": model}
+
+    try:
+        await send_events(writer, events())
+    finally:
+        await deltas.aclose()
+    return False
+
+
+async def quick_replies(request, writer):
+    messages = _messages(request.json())
+    replies = await agenerate_quick_replies(_window(messages, "gpt-3.5-turbo"))
+    await send_json(writer, HTTPStatus.OK, {"quick_replies": replies}, request.keep_alive)
+    return request.keep_alive
+
+
+async def demo_bookings(request, writer):
+    payload = request.json()
+    if not isinstance(payload.get("email"), str) or not EMAIL_PATTERN.fullmatch(payload["email"]):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "A valid email is required to book a demo")
+    # The outbox insert is a local SQLite commit, kept off the event loop
+    result = await asyncio.to_thread(
+        handle_demo_booking, payload, session_id="api", idempotency_key=request.headers.get("idempotency-key")
+    )
+    status = HTTPStatus.OK if result["status"] == "success" else HTTPStatus.INTERNAL_SERVER_ERROR
+    await send_json(writer, status, result, request.keep_alive)
+    return request.keep_alive
+
+
+async def demo_booking_status(request, writer, booking_id):
+    delivery = (await asyncio.to_thread(get_booking_status, [booking_id])).get(booking_id)
+    if delivery is None:
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"Unknown booking {booking_id}")
+    await send_json(writer, HTTPStatus.OK, {"booking_id": booking_id, **delivery}, request.keep_alive)
+    return request.keep_alive
+
+
+async def integrations(request, writer, integration_type):
+    await send_json(writer, HTTPStatus.OK, {
+        "integration_type": integration_type,
+        "integrations": get_integration_info(integration_type)
+    }, request.keep_alive)
+    return request.keep_alive
+
+
+async def features(request, writer, feature_name):
+    await send_json(writer, HTTPStatus.OK, get_feature_info(feature_name), request.keep_alive)
+    return request.keep_alive
+
+
+async def health(request, writer):
+    await send_json(writer, HTTPStatus.OK, {"status": "ok"}, request.keep_alive)
+    return request.keep_alive
+
+
+async def prometheus(request, writer):
+    body = get_metrics().render().encode("utf-8")
+    writer.write(_headers(HTTPStatus.OK, "text/plain; version=0.0.4; charset=utf-8", [
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if request.keep_alive else 'close'}"
+    ]) + body)
+    await writer.drain()
+    return request.keep_alive
+
+
+# Exact routes, then prefix routes whose remaining path is passed along
+ROUTES = {
+    ("POST", "/v1/chat"): chat,
+    ("POST", "/v1/quick-replies"): quick_replies,
+    ("POST", "/v1/demo-bookings"): demo_bookings,
+    ("GET", "/healthz"): health,
+    ("GET", "/metrics"): prometheus
+}
+PREFIX_ROUTES = {
+    ("GET", "/v1/demo-bookings/"): demo_booking_status,
+    ("GET", "/v1/integrations/"): integrations,
+    ("GET", "/v1/features/"): features
+}
+
+
+def route_label(request):
+    """
+    The route a request matched, for metric labels: the path of an exact
+    route, the prefix of a prefix route, or "other"
+    """
+    if (request.method, request.path) in ROUTES:
+        return request.path
+    for method, prefix in PREFIX_ROUTES:
+        if request.method == method and request.path.startswith(prefix):
+            return prefix
+    return "other"
+
+
+async def dispatch(request, writer):
+    """
+    Run the handler for a request, returning whether to keep the
+    connection open
+    """
+    if request.method == "OPTIONS" and CORS_ORIGIN:
+        writer.write(_headers(HTTPStatus.NO_CONTENT, "text/plain", [
+            "Access-Control-Allow-Methods: GET, POST, OPTIONS",
+            "Access-Control-Allow-Headers: Content-Type",
+            "Content-Length: 0"
+        ]))
+        await writer.drain()
+        return request.keep_alive
+
+    handler = ROUTES.get((request.method, request.path))
+    if handler is not None:
+        return await handler(request, writer)
+    for (method, prefix), handler in PREFIX_ROUTES.items():
+        if request.method == method and request.path.startswith(prefix) and len(request.path) > len(prefix):
+            return await handler(request, writer, unquote(request.path[len(prefix):]))
+    raise HTTPError(HTTPStatus.NOT_FOUND, f"No route for {request.method} {request.path}")
+
+
+async def handle_connection(reader, writer):
+    metrics = get_metrics()
+    try:
+        keep_alive = True
+        while keep_alive:
+            try:
+                request = await asyncio.wait_for(read_request(reader), KEEP_ALIVE_TIMEOUT)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                break
+            except HTTPError as exc:
+                await send_json(writer, exc.status, {"error": str(exc)}, keep_alive=False)
+                break
+            if request is None:
+                break
+
+            try:
+                keep_alive = await dispatch(request, writer)
+                status = HTTPStatus.OK
+            except HTTPError as exc:
+                status = exc.status
+                await send_json(writer, status, {"error": str(exc)}, request.keep_alive)
+                keep_alive = request.keep_alive
+            except ConnectionError:
+                # The client went away mid-response
+                status = HTTPStatus.OK
+                keep_alive = False
+            except Exception:
+                logger.exception("Error handling %s %s", request.method, request.path)
+                metrics.inc("miachat_errors_total", stage="api_server", provider="none")
+                status = HTTPStatus.INTERNAL_SERVER_ERROR
+                keep_alive = False
+                try:
+                    await send_json(writer, status, {"error": "Internal server error"}, keep_alive=False)
+                except ConnectionError:
+                    pass
+            metrics.inc("miachat_api_requests_total", method=request.method, route=route_label(request), status=status.value)
+    except Exception:
+        logger.exception("Error on API connection")
+        metrics.inc("miachat_errors_total", stage="api_server", provider="none")
+    finally:
+        writer.close()
+
+
+async def serve(host, port):
+    server = await asyncio.start_server(handle_connection, host, port, limit=MAX_BODY_BYTES)
+    addresses = ", ".join(f"{sock.getsockname()[0]}:{sock.getsockname()[1]}" for sock in server.sockets)
+    print(f"MiaChat API listening on {addresses}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless MiaChat HTTP/SSE API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    asyncio.run(serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
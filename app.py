@@ -1,13 +1,35 @@
 import streamlit as st
-import openai
-from dotenv import load_dotenv
+from streamlit.errors import StreamlitAPIException
+from conversation import Conversation
+from history_search import HistoryIndex, format_snippet
+from metrics import TurnTrace
+from chat_core import (
+    AUTO_MODEL,
+    PROVIDER_MODELS,
+    answer_locally,
+    generate_quick_replies,
+    get_background_executor,
+    get_chat_response,
+    get_context_manager,
+    get_conversation_store,
+    get_booking_status,
+    get_hedger,
+    get_intent_router,
+    get_metrics,
+    get_model_router,
+    get_prefetcher,
+    get_response_cache,
+    get_system_prompt_tokens,
+    get_trace_sink,
+    prefetch_chat_responses,
+    resolve_model,
+    take_prefetched_response
+)
+import html
 import os
-
-# Load environment variables
-load_dotenv()
-
-# Configure OpenAI
-openai.api_key = os.getenv("OPENAI_API_KEY")
+import time
+import uuid
+from contextlib import nullcontext
 
 # Configure Streamlit theme
 st.set_page_config(
@@ -17,421 +39,97 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS for dark theme
-st.markdown("""
-<style>
-    /* Main theme colors */
-    :root {
-        --background-color: #1E1E1E;
-        --secondary-bg: #2D2D2D;
-        --text-color: #E0E0E0;
-        --yellow-brand: #FFD700;
-        --accent-color: #4A4A4A;
-        --success-color: #4CAF50;
-        --error-color: #FF5252;
-    }
-
-    /* Global styles */
-    .main {
-        background-color: var(--background-color);
-        color: var(--text-color);
-        padding: 2rem;
-    }
-
-    .stApp {
-        background-color: var(--background-color);
-    }
-
-    /* Sidebar styling */
-    .css-1d391kg {
-        background-color: var(--secondary-bg);
-    }
-
-    .sidebar .sidebar-content {
-        background-color: var(--secondary-bg);
-    }
-
-    /* Headers */
-    h1, h2, h3 {
-        color: var(--yellow-brand) !important;
-        font-weight: 600;
-    }
-
-    /* Text areas */
-    .stTextArea textarea {
-        background-color: var(--secondary-bg);
-        color: var(--text-color);
-        border: 1px solid var(--accent-color);
-        border-radius: 5px;
-    }
-
-    .stTextArea textarea:focus {
-        border-color: var(--yellow-brand);
-        box-shadow: 0 0 0 1px var(--yellow-brand);
-    }
-
-    /* Chat messages */
-    .chat-message {
-        padding: 1.5rem;
-        border-radius: 0.5rem;
-        margin-bottom: 1rem;
-        background-color: #000000;
-        border-left: 5px solid var(--yellow-brand);
-        color: #000000;
-    }
-
-    .user-message {
-        background-color: #FFFFFF;
-        border-left: 5px solid var(--yellow-brand);
-        color: #000000;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-    }
-
-    .assistant-message {
-        background-color: #F5F5F5;
-        border-left: 5px solid #FFB700;
-        color: #000000;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-    }
-
-    /* Message headers */
-    .chat-message b {
-        color: #000000;
-        font-size: 1.1rem;
-        margin-bottom: 0.5rem;
-        display: block;
-        font-weight: 600;
-    }
-
-    /* Message content */
-    .chat-message div:last-child {
-        margin-top: 0.5rem;
-        line-height: 1.5;
-        color: #000000;
-    }
-
-    /* Buttons */
-    .stButton button {
-        background-color: var(--yellow-brand);
-        color: #000000;
-        border: none;
-        padding: 0.5rem 1rem;
-        border-radius: 5px;
-        font-weight: 500;
-        transition: all 0.3s ease;
-    }
-
-    .stButton button:hover {
-        background-color: #FFE44D;
-        transform: translateY(-2px);
-        box-shadow: 0 4px 8px rgba(255, 215, 0, 0.2);
-    }
-
-    /* Quick replies */
-    .quick-reply-container {
-        display: flex;
-        gap: 0.5rem;
-        flex-wrap: wrap;
-        margin-top: 1rem;
-    }
-
-    .quick-reply {
-        background-color: var(--secondary-bg);
-        color: var(--yellow-brand);
-        border: 1px solid var(--yellow-brand);
-        border-radius: 20px;
-        padding: 0.5rem 1rem;
-        cursor: pointer;
-        transition: all 0.2s;
-    }
-
-    .quick-reply:hover {
-        background-color: var(--yellow-brand);
-        color: var(--background-color);
-    }
-
-    /* Input container */
-    .input-container {
-        background-color: var(--secondary-bg);
-        padding: 1rem;
-        border-radius: 5px;
-        margin-top: 1rem;
-    }
-
-    /* Selectbox */
-    .stSelectbox {
-        background-color: var(--secondary-bg);
-    }
-
-    .stSelectbox > div > div {
-        background-color: var(--secondary-bg);
-        color: var(--text-color);
-    }
-
-    /* Tabs */
-    .stTabs [data-baseweb="tab-list"] {
-        background-color: var(--secondary-bg);
-    }
-
-    .stTabs [data-baseweb="tab"] {
-        color: var(--text-color);
-    }
-
-    .stTabs [aria-selected="true"] {
-        color: var(--yellow-brand);
-    }
+# Stylesheet for the whole app, injected as one style element per run
+STYLESHEET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "miachat.css")
 
-    /* Status messages */
-    .success-message {
-        color: var(--success-color);
-        background-color: rgba(76, 175, 80, 0.1);
-        padding: 0.5rem;
-        border-radius: 4px;
-    }
+@st.cache_resource
+def load_stylesheet():
+    """
+    Read the stylesheet once per process rather than on every rerun
+    """
+    with open(STYLESHEET_PATH, encoding="utf-8") as f:
+        return f.read()
 
-    .error-message {
-        color: var(--error-color);
-        background-color: rgba(255, 82, 82, 0.1);
-        padding: 0.5rem;
-        border-radius: 4px;
-    }
+st.html(f"<style>{load_stylesheet()}</style>")
 
-    /* Input area */
-    .stTextInput input {
-        color: #000000;
-        background-color: #FFFFFF;
-        border: 1px solid var(--yellow-brand);
-    }
+# Messages shown in the transcript before "Load earlier" paging
+TRANSCRIPT_PAGE_SIZE = 50
 
-    .stTextInput input:focus {
-        border-color: var(--yellow-brand);
-        box-shadow: 0 0 0 1px var(--yellow-brand);
-    }
+# Saved chats shown per sidebar page
+HISTORY_PAGE_SIZE = 10
 
-    /* Title styling */
-    .title {
-        font-family: 'Arial', sans-serif;
-        font-weight: 700;
-        color: var(--yellow-brand);
-        text-align: center;
-        margin-bottom: 2rem;
-    }
+# Search hits shown in the sidebar
+HISTORY_SEARCH_LIMIT = 8
 
-    .mia-branding {
-        font-size: 2.5rem;
-        letter-spacing: 1px;
-    }
-</style>
-""", unsafe_allow_html=True)
-
-# Yellow.ai Platform Configuration
-YELLOW_AI_CONFIG = {
-    "channels": [
-        "WhatsApp",
-        "Facebook Messenger",
-        "Instagram",
-        "Web Chat",
-        "IVR",
-        "SMS"
-    ],
-    "features": {
-        "customer_support": {
-            "name": "Customer Support Automation",
-            "description": "AI-driven customer support with intelligent routing"
-        },
-        "sales_automation": {
-            "name": "Sales Automation",
-            "description": "Lead generation and sales process automation"
-        },
-        "hr_automation": {
-            "name": "HR Process Automation",
-            "description": "Streamline HR workflows and employee engagement"
-        },
-        "demo_booking": {
-            "name": "Demo Booking",
-            "description": "Schedule product demonstrations and sales calls"
-        }
-    },
-    "integrations": {
-        "crm": ["Salesforce", "HubSpot"],
-        "erp": ["SAP", "Oracle"],
-        "ticketing": ["Zendesk", "Freshdesk"],
-        "communication": ["Twilio", "MessageBird"]
-    }
-}
-
-# System Prompt
-YELLOW_AI_PROMPT = """You are MiaChat, an AI assistant specifically trained for Yellow.ai platform support.
-
-Key Capabilities:
-1. Provide comprehensive information about Yellow.ai's products and services
-2. Guide users through Yellow.ai's features and capabilities:
-   - Conversational AI Bots
-   - Omnichannel Support
-   - Orch LLM (Proprietary orchestration engine)
-   - Customer Experience Automation
-   - Live Agent Handoff
-   - AI-Powered Analytics
-   - Enterprise System Integrations
-   - Generative AI Capabilities
-
-3. Assist with demo booking and platform inquiries
-4. Explain technical concepts in an accessible manner
-5. Provide integration guidance
-6. Share analytics and reporting capabilities
-
-Guidelines:
-- Maintain a professional and helpful tone
-- Provide accurate platform information
-- Guide users through demo booking process
-- Explain technical features clearly
-- Handle complex queries with detailed responses
-- Facilitate smooth handoffs when needed
-
-Remember: You are Mia, an expert in Yellow.ai's platform and should focus on helping users understand and utilize its capabilities effectively. Always introduce yourself as Mia and maintain a friendly, professional demeanor."""
+# Seconds between delivery status refreshes while a demo request is pending
+BOOKING_STATUS_REFRESH_SECONDS = 5
 
 # ----------------------------
 # Helper Functions
 # ----------------------------
 
-def get_chat_response(message, conversation_history, api_provider, model):
-    """
-    Get response from OpenAI API or Claude API with Yellow.ai context
-    """
-    if api_provider == "gpt":
-        try:
-            messages = [{"role": "system", "content": YELLOW_AI_PROMPT}]
-            
-            # Convert conversation history to OpenAI format
-            for msg in conversation_history.split("\n"):
-                if msg.startswith("User:"):
-                    messages.append({"role": "user", "content": msg[5:].strip()})
-                elif msg.startswith("Assistant:"):
-                    messages.append({"role": "assistant", "content": msg[10:].strip()})
-            
-            # Add the current message
-            messages.append({"role": "user", "content": message})
-            
-            # Call OpenAI API
-            response = openai.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=150
-            )
-            
-            return response.choices[0].message.content
-            
-        except Exception as e:
-            return f"Error: {str(e)}"
-    else:
-        # Simulate Claude response for demo
-        return f"[CLAUDE-{model}] You said: {message}"
-
-def generate_quick_replies(conversation_context):
+def stream_chat_response(placeholder, deltas):
     """
-    Generate contextual quick replies based on Yellow.ai platform features in first person
+    Render streamed deltas progressively into a placeholder and measure
+    time-to-first-token and tokens/sec for the turn
     """
-    if not conversation_context:
-        # Initial quick replies for new chat in first person
-        return [
-            "Hi Mia, tell me about Yellow.ai",
-            "I'd like to book a demo with you",
-            "Can you show me the integration options?"
-        ]
+    start = time.perf_counter()
+    first_token_at = None
+    chunks = []
     
-    try:
-        # Construct a prompt that generates first-person quick replies for Yellow.ai
-        prompt = f"""Based on this conversation about Yellow.ai platform, generate 3 likely follow-up questions or actions from the user's perspective in first person (using I, my, me).
-        The assistant's name is Mia, so include personal addressing where appropriate.
-
-        Focus on Yellow.ai's key features:
-        - Conversational AI capabilities
-        - Omnichannel support
-        - Integration options
-        - Demo booking
-        - Platform features
-        
-        Current Conversation:
-        {conversation_context}
-        
-        Generate 3 short, specific quick replies in first person that a user would naturally say. Examples:
-        - "Mia, can you tell me more about..."
-        - "I'd like your help with..."
-        - "Could you explain to me..."
-        - "Show me how to..."
-        - "Help me understand..."
-        
-        Make responses conversational and personal, addressing Mia directly where appropriate.
-        """
-        
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are an AI that generates first-person quick reply suggestions from the user's perspective, addressing the AI assistant named Mia."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=100
-        )
-        
-        suggestions = response.choices[0].message.content.strip().split("\n")
-        return [s.strip().strip('123.-*') for s in suggestions if s.strip()][:3]
-        
-    except Exception as e:
-        return [
-            "Mia, tell me more about the features",
-            "Help me set up integrations",
-            "I'd like to schedule a demo"
-        ]
-
-def handle_demo_booking(user_info):
-    """
-    Handle Yellow.ai platform demo booking requests
-    """
-    try:
-        # In a real implementation, this would integrate with Yellow.ai's booking system
-        return {
-            "status": "success",
-            "message": "Thank you for your interest in Yellow.ai! Your demo request has been received.",
-            "next_steps": [
-                "Our team will contact you shortly to schedule the demo",
-                "You'll receive an email confirmation",
-                "Feel free to ask any questions about Yellow.ai while you wait"
-            ]
-        }
-    except Exception as e:
-        return {
-            "status": "error",
-            "message": f"Error booking demo: {str(e)}",
-            "next_steps": [
-                "Please try again later",
-                "Contact our support team for assistance"
-            ]
-        }
-
-def get_integration_info(integration_type):
-    """
-    Provide information about Yellow.ai's integration capabilities
-    """
-    return YELLOW_AI_CONFIG["integrations"].get(integration_type, [])
+    for delta in deltas:
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+        chunks.append(delta)
+        placeholder.markdown(format_message_html("assistant", "".join(chunks) + "▌"), unsafe_allow_html=True)
+    
+    end = time.perf_counter()
+    text = "".join(chunks)
+    placeholder.markdown(format_message_html("assistant", text), unsafe_allow_html=True)
+    
+    # Each streamed chunk carries roughly one token
+    generation_time = end - (first_token_at or end)
+    metrics = {
+        "ttft": (first_token_at or end) - start,
+        "total_time": end - start,
+        "tokens": len(chunks),
+        "tokens_per_sec": len(chunks) / generation_time if generation_time > 0 else 0.0
+    }
+    return text, metrics
 
-def get_feature_info(feature_name):
+def format_message_html(role, text):
     """
-    Get detailed information about Yellow.ai platform features
+    Build the chat bubble markup for a single message. The text is escaped
+    and kept on one line so consecutive bubbles form a single HTML block.
     """
-    return YELLOW_AI_CONFIG["features"].get(feature_name, {
-        "name": "Feature not found",
-        "description": "Information not available"
-    })
+    body = html.escape(text).replace("\n", "<br>")
+    if role == "user":
+        return f"<div class='chat-message user-message'><div><b>You:</b></div><div>{body}</div></div>"
+    return f"<div class='chat-message assistant-message'><div><b>Assistant:</b></div><div>{body}</div></div>"
+
+# Process-wide resources shared with the API server through chat_core
+background_executor = get_background_executor()
+response_cache = get_response_cache()
+metrics = get_metrics()
+trace_sink = get_trace_sink()
+conversation_store = get_conversation_store()
+context_manager = get_context_manager()
+intent_router = get_intent_router()
+prefetcher = get_prefetcher()
+model_router = get_model_router()
+hedger = get_hedger()
 
 # ----------------------------
 # Initialize Session State
 # ----------------------------
+if "session_id" not in st.session_state:
+    # Kept in the URL so a returning user gets their saved chats back
+    st.session_state.session_id = st.query_params.get("session") or uuid.uuid4().hex
+    st.query_params["session"] = st.session_state.session_id
 if "conversation" not in st.session_state:
-    st.session_state.conversation = []
+    st.session_state.conversation = Conversation()
 if "quick_replies" not in st.session_state:
-    st.session_state.quick_replies = generate_quick_replies("")
+    st.session_state.quick_replies = generate_quick_replies([])
 if "input_message" not in st.session_state:
     st.session_state.input_message = ""
 if "api_provider" not in st.session_state:
@@ -439,14 +137,274 @@ if "api_provider" not in st.session_state:
 if "model" not in st.session_state:
     st.session_state.model = "gpt-3.5-turbo"
 if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
+    # Saved chats keyed by conversation id, in the order they were started.
+    # With a conversation store only their titles and versions are kept here,
+    # loaded by sync_session_state below.
+    st.session_state.chat_history = {}
+    # Their ids in the same order, so a sidebar page is a slice
+    st.session_state.chat_order = []
+if "history_index" not in st.session_state:
+    # Search index of chats kept in memory; the conversation store has its own
+    st.session_state.history_index = HistoryIndex() if conversation_store is None else None
+if "history_page" not in st.session_state:
+    st.session_state.history_page = 0
+if "transcript_window" not in st.session_state:
+    st.session_state.transcript_window = TRANSCRIPT_PAGE_SIZE
+if "input_counter" not in st.session_state:
+    st.session_state.input_counter = 0
 if "demo_requests" not in st.session_state:
     st.session_state.demo_requests = []
+if "booking_statuses" not in st.session_state:
+    # Last known delivery status by booking id; delivered and failed are final
+    st.session_state.booking_statuses = {}
+if "pending_message" not in st.session_state:
+    st.session_state.pending_message = None
+if "turn_metrics" not in st.session_state:
+    st.session_state.turn_metrics = []
+
+# ----------------------------
+# Shared Session State
+# ----------------------------
+# With a conversation store, the session's open conversation, chat history,
+# quick replies and demo requests live in the store rather than in this
+# process, so any worker process can serve the session. Each run compares
+# the session's committed version with the one loaded here, and changes are
+# committed only on top of the version they were made from.
+
+def load_session_state():
+    """
+    Load the session as last committed by any worker process. A message
+    still waiting for its reply is carried over to the loaded conversation.
+    """
+    session_id = st.session_state.session_id
+    session = conversation_store.load_session(session_id)
+    st.session_state.chat_history = conversation_store.load_history(session_id)
+    st.session_state.chat_order = list(st.session_state.chat_history)
+    st.session_state.demo_requests = conversation_store.load_demo_requests(session_id)
+    if session is not None:
+        conversation = (
+            conversation_store.load_conversation(session["conversation_id"])
+            or Conversation(conversation_id=session["conversation_id"])
+        )
+        if st.session_state.get("pending_message") is not None:
+            conversation.append("user", st.session_state.pending_message)
+        st.session_state.conversation = conversation
+        st.session_state.current_timestamp = session["title"]
+        st.session_state.transcript_window = TRANSCRIPT_PAGE_SIZE
+        st.session_state.quick_replies = conversation.quick_replies or generate_quick_replies(
+            context_manager.window(conversation, "gpt-3.5-turbo", refresh_summary=False)
+        )
+    st.session_state.session_version = session["version"] if session is not None else 0
+
+def sync_session_state():
+    """
+    Reload the session if another worker process committed a newer version
+    of it, then mark the open conversation as in use (reloading it if it was
+    unloaded while idle). Returns True when the session was reloaded.
+    """
+    if conversation_store is None:
+        return False
+    commit = st.session_state.get("session_commit")
+    if commit is not None and not commit.done():
+        # This process's own commit is still queued; check once it is applied
+        reloaded = False
+    else:
+        st.session_state.session_commit = None
+        reloaded = (
+            (commit is not None and commit.result() is None)
+            or st.session_state.get("session_version") != conversation_store.session_version(st.session_state.session_id)
+        )
+    if reloaded:
+        load_session_state()
+    conversation_store.touch(st.session_state.conversation)
+    return reloaded
+
+def commit_session_state():
+    """
+    Publish the session's open conversation to the other worker processes.
+    The commit is queued behind the conversation's messages and assumed to
+    succeed; if one of the other processes committed first, its state wins
+    and is loaded instead, on this run if the previous commit lost or on a
+    later one for this commit.
+    """
+    if conversation_store is None:
+        return
+    previous = st.session_state.get("session_commit")
+    # Normally applied long ago; only waits when the writer is still on it
+    if previous is not None and previous.result() is None:
+        st.session_state.session_commit = None
+        load_session_state()
+        return
+    st.session_state.session_commit = conversation_store.commit_session(
+        st.session_state.session_id,
+        st.session_state.conversation.id,
+        st.session_state.get("current_timestamp", "Untitled Chat"),
+        st.session_state.session_version
+    )
+    st.session_state.session_version += 1
+
+sync_session_state()
 
 # ----------------------------
 # Sidebar: Chat History & Settings
 # ----------------------------
 
+def render_performance_panel():
+    """
+    Show the current session's turn timings, token usage and the process-wide
+    cache and error counters
+    """
+    turns = st.session_state.turn_metrics
+    if not turns:
+        st.caption("No turns yet in this session.")
+        return
+    
+    cols = st.columns(2)
+    cols[0].metric("Turns", len(turns))
+    cols[1].metric("Avg TTFT", f"{sum(turn['ttft'] for turn in turns) / len(turns) * 1000:.0f} ms")
+    cols = st.columns(2)
+    cols[0].metric("Avg tokens/sec", f"{sum(turn['tokens_per_sec'] for turn in turns) / len(turns):.1f}")
+    session_tokens = sum(
+        usage["prompt_tokens"] + usage["completion_tokens"]
+        for turn in turns for usage in turn.get("usage", {}).values()
+    )
+    cols[1].metric("Tokens used", session_tokens)
+    
+    last_spans = turns[-1].get("spans")
+    if last_spans:
+        st.caption("Last turn stages (ms)")
+        st.table({"stage": list(last_spans), "ms": list(last_spans.values())})
+    
+    if response_cache is not None:
+        st.caption(f"Response cache hit rate: {response_cache.hit_rate():.0%}")
+    if intent_router is not None:
+        st.caption(f"LLM bypass rate (all sessions): {intent_router.bypass_rate():.0%}")
+    if st.session_state.model == AUTO_MODEL:
+        routed = model_router.stats
+        st.caption(
+            f"Auto model (all sessions): {routed['fast']} fast, {routed['strong']} strong, "
+            f"{routed['downgraded']} kept fast for latency"
+        )
+    if prefetcher is not None:
+        st.caption(
+            f"Prefetch hit rate (all sessions): {prefetcher.hit_rate():.0%}, "
+            f"wasted tokens: {prefetcher.stats['wasted_tokens']}"
+        )
+    if hedger is not None:
+        st.caption(
+            f"Hedged calls (all sessions): {hedger.hedge_rate():.0%}, "
+            f"p99 first token saved: {hedger.p99_saved() * 1000:.0f} ms"
+        )
+    errors = metrics.counter_value("miachat_errors_total", stage="chat_response", provider=st.session_state.api_provider)
+    st.caption(f"Chat errors ({st.session_state.api_provider}, all sessions): {errors}")
+
+def demo_requests_pending():
+    """
+    Whether any of the session's bookings was still pending when last looked up
+    """
+    statuses = st.session_state.booking_statuses
+    return any(
+        statuses.get(request["booking_id"], {"status": "pending"})["status"] == "pending"
+        for request in st.session_state.demo_requests if "booking_id" in request
+    )
+
+def render_demo_requests():
+    """
+    List the session's demo requests, newest first, with their delivery
+    status from the booking outbox. Only bookings still pending are looked
+    up. Returns True while any of them is pending.
+    """
+    requests = st.session_state.demo_requests
+    statuses = st.session_state.booking_statuses
+    unsettled = [
+        request["booking_id"] for request in requests
+        if "booking_id" in request and statuses.get(request["booking_id"], {"status": "pending"})["status"] == "pending"
+    ]
+    if unsettled:
+        found = get_booking_status(unsettled)
+        for booking_id in unsettled:
+            # A booking missing from the outbox will not be delivered from it
+            statuses[booking_id] = found.get(booking_id, {"status": "received"})
+    for request in reversed(requests):
+        delivery = statuses.get(request.get("booking_id"), {"status": "received"})
+        requested_at = time.strftime("%b %d, %H:%M", time.localtime(request["requested_at"]))
+        st.caption(f"{requested_at}: {delivery['status']}")
+    return demo_requests_pending()
+
+@st.fragment(run_every=BOOKING_STATUS_REFRESH_SECONDS)
+def poll_demo_requests():
+    """
+    render_demo_requests, refreshed on a timer. Once nothing is pending the
+    whole script reruns, which renders the list without the timer.
+    """
+    if not render_demo_requests():
+        st.rerun()
+
+def prefetch_quick_replies():
+    """
+    Prefetch the answers to the quick replies now on screen, replacing the
+    session's earlier prefetches
+    """
+    prefetch_chat_responses(
+        st.session_state.session_id,
+        st.session_state.conversation,
+        st.session_state.quick_replies,
+        st.session_state.api_provider,
+        st.session_state.model
+    )
+
+def save_current_chat():
+    """
+    Save the current conversation to the chat history if it's not empty. A
+    dict lookup on its id and version replaces comparing every stored
+    transcript. New messages are queued to the conversation store, if any.
+    Returns True when the chat was not in the history yet.
+    """
+    conversation = st.session_state.conversation
+    if len(conversation) == 0:
+        return False
+    saved_chat = st.session_state.chat_history.get(conversation.id)
+    if saved_chat is None or saved_chat["version"] != conversation.version:
+        chat = {
+            "timestamp": saved_chat["timestamp"] if saved_chat else st.session_state.get("current_timestamp", "Untitled Chat"),
+            "version": conversation.version
+        }
+        if conversation_store is not None:
+            conversation_store.save_conversation(st.session_state.session_id, conversation, chat["timestamp"])
+        else:
+            chat["conversation"] = conversation
+            st.session_state.history_index.add(conversation.id, conversation.messages)
+        st.session_state.chat_history[conversation.id] = chat
+        if saved_chat is None:
+            st.session_state.chat_order.append(conversation.id)
+    return saved_chat is None
+
+def search_chat_history(query):
+    """
+    Saved chats of this session matching the query, best first
+    """
+    if conversation_store is not None:
+        return conversation_store.search(st.session_state.session_id, query, limit=HISTORY_SEARCH_LIMIT)
+    return st.session_state.history_index.search(query, limit=HISTORY_SEARCH_LIMIT)
+
+def open_chat(chat_id):
+    """
+    Make a saved chat the current one. Chats in the conversation store are
+    loaded by id, so no other transcript is read.
+    """
+    chat = st.session_state.chat_history[chat_id]
+    conversation = chat["conversation"] if "conversation" in chat else conversation_store.load_conversation(chat_id)
+    st.session_state.conversation = conversation
+    st.session_state.transcript_window = TRANSCRIPT_PAGE_SIZE
+    # Suggestions are saved with the conversation, so reopening it is free
+    st.session_state.quick_replies = conversation.quick_replies or generate_quick_replies(
+        context_manager.window(conversation, "gpt-3.5-turbo", refresh_summary=False)
+    )
+    st.session_state.current_timestamp = chat["timestamp"]
+    commit_session_state()
+    prefetch_quick_replies()
+    st.rerun()
+
 with st.sidebar:
     st.markdown('<h1 class="title mia-branding">MiaChat</h1>', unsafe_allow_html=True)
     st.markdown("---")
@@ -454,208 +412,275 @@ with st.sidebar:
     st.subheader("Settings")
     api_provider = st.selectbox(
         "Select AI Provider",
-        options=["gpt", "claude"],
+        options=list(PROVIDER_MODELS),
         index=0,
         help="Choose between OpenAI's GPT or Anthropic's Claude"
     )
     st.session_state.api_provider = api_provider
 
-    model_options = {
-        "gpt": ["gpt-3.5-turbo", "gpt-4"],
-        "claude": ["claude-v1", "claude-plus"]
-    }
     model = st.selectbox(
         "Select Model",
-        options=model_options[api_provider],
-        help="Choose the AI model to power your chat"
+        options=PROVIDER_MODELS[api_provider] + [AUTO_MODEL],
+        format_func=lambda option: "Auto (by question)" if option == AUTO_MODEL else option,
+        help="Choose the AI model to power your chat, or Auto to send simple questions to the faster model"
     )
     st.session_state.model = model
     
     st.markdown("---")
     st.subheader("Chat History")
     
-    # Save current conversation if it's not empty
-    if len(st.session_state.conversation) > 0:
-        current_chat = {
-            "messages": st.session_state.conversation,
-            "timestamp": st.session_state.get("current_timestamp", "Untitled Chat")
-        }
-        if current_chat not in st.session_state.chat_history:
-            st.session_state.chat_history.append(current_chat)
+    save_current_chat()
+    
+    query = st.text_input(
+        "Search chats",
+        key="history_query",
+        placeholder="Search your chats",
+        label_visibility="collapsed"
+    )
+    if query.strip():
+        hits = [hit for hit in search_chat_history(query) if hit["conversation_id"] in st.session_state.chat_history]
+        if not hits:
+            st.caption("No chats match your search.")
+        for hit in hits:
+            chat = st.session_state.chat_history[hit["conversation_id"]]
+            label = f"{chat['timestamp']}: {format_snippet(hit['snippet'])}"
+            if st.button(label, key=f"search_hit_{hit['conversation_id']}", use_container_width=True):
+                open_chat(hit["conversation_id"])
+        st.markdown("---")
     
-    # Display chat history
-    for idx, chat in enumerate(st.session_state.chat_history):
+    # Display one page of chat history, newest first, without touching the rest
+    total_chats = len(st.session_state.chat_order)
+    page_count = max(1, -(-total_chats // HISTORY_PAGE_SIZE))
+    page = min(st.session_state.history_page, page_count - 1)
+    page_end = total_chats - page * HISTORY_PAGE_SIZE
+    page_start = max(0, page_end - HISTORY_PAGE_SIZE)
+    
+    for idx in range(page_end - 1, page_start - 1, -1):
+        chat_id = st.session_state.chat_order[idx]
+        chat = st.session_state.chat_history[chat_id]
         if st.button(f"Chat {idx + 1}: {chat['timestamp']}", key=f"history_{idx}", use_container_width=True):
-            st.session_state.conversation = chat["messages"]
-            st.session_state.quick_replies = generate_quick_replies("\n".join(
-                [f"{msg['sender'].capitalize()}: {msg['text']}" for msg in chat["messages"]]
-            ))
+            open_chat(chat_id)
+    
+    if page_count > 1:
+        nav_cols = st.columns(2)
+        if nav_cols[0].button("Newer", key="history_newer", disabled=page == 0, use_container_width=True):
+            st.session_state.history_page = page - 1
+            st.rerun()
+        if nav_cols[1].button("Older", key="history_older", disabled=page == page_count - 1, use_container_width=True):
+            st.session_state.history_page = page + 1
             st.rerun()
     
     if st.button("New Chat", use_container_width=True):
-        st.session_state.conversation = []
-        st.session_state.quick_replies = generate_quick_replies("")
+        st.session_state.conversation = Conversation()
+        st.session_state.quick_replies = generate_quick_replies([])
         st.session_state.input_message = ""
         st.session_state.current_timestamp = "New Chat"
+        st.session_state.history_page = 0
+        st.session_state.transcript_window = TRANSCRIPT_PAGE_SIZE
+        commit_session_state()
+        prefetch_quick_replies()
         st.rerun()
+    
+    if st.session_state.demo_requests:
+        st.markdown("---")
+        st.subheader("Demo Requests")
+        if demo_requests_pending():
+            poll_demo_requests()
+        else:
+            render_demo_requests()
+    
+    st.markdown("---")
+    if st.toggle("Show performance", key="show_performance"):
+        render_performance_panel()
 
 # ----------------------------
 # Main Chat Area
 # ----------------------------
 
-st.markdown(
+def rerun_chat_area():
     """
-    <style>
-    .chat-message {
-        padding: 1.5rem;
-        border-radius: 0.5rem;
-        margin-bottom: 1rem;
-        display: flex;
-        flex-direction: column;
-    }
-    .user-message {
-        background-color: #e6f3ff;
-        border-left: 5px solid #2b6cb0;
-    }
-    .assistant-message {
-        background-color: #f0f0f0;
-        border-left: 5px solid #718096;
-    }
-    .quick-reply-container {
-        display: flex;
-        gap: 0.5rem;
-        flex-wrap: wrap;
-        margin-top: 1rem;
-    }
-    .stButton > button {
-        background-color: #2b6cb0;
-        color: white;
-        border: none;
-        border-radius: 0.5rem;
-        padding: 0.5rem 1rem;
-        font-weight: 500;
-        transition: all 0.2s;
-    }
-    .stButton > button:hover {
-        background-color: #2c5282;
-        transform: translateY(-1px);
-    }
-    .input-container {
-        display: flex;
-        align-items: flex-start;
-        gap: 0.5rem;
-        border-radius: 0.5rem;
-    }
-    /* Hide 'Press Enter to apply' text */
-    .st-emotion-cache-1gulkj5 {
-        display: none;
-    }
-    </style>
-    """,
-    unsafe_allow_html=True
-)
-
-# Chat Container
-chat_container = st.container()
-with chat_container:
-    for msg in st.session_state.conversation:
-        if msg["sender"] == "user":
-            st.markdown(
-                f"""<div class='chat-message user-message'>
-                    <div><b>You:</b></div>
-                    <div>{msg['text']}</div>
-                </div>""",
-                unsafe_allow_html=True
-            )
-        else:
-            st.markdown(
-                f"""<div class='chat-message assistant-message'>
-                    <div><b>Assistant:</b></div>
-                    <div>{msg['text']}</div>
-                </div>""",
-                unsafe_allow_html=True
-            )
-
-# Quick Replies (shown before user input)
-if st.session_state.quick_replies:
-    quick_reply_cols = st.columns(3)
-    for idx, reply in enumerate(st.session_state.quick_replies):
-        if quick_reply_cols[idx].button(
-            reply,
-            key=f"quick_reply_{idx}",
-            use_container_width=True
-        ):
-            # Process the quick reply as user input
-            st.session_state.conversation.append({"sender": "user", "text": reply})
-            conversation_context = "\n".join(
-                [f"{msg['sender'].capitalize()}: {msg['text']}" for msg in st.session_state.conversation]
-            )
-            
-            # Get bot response
-            bot_response = get_chat_response(
-                message=reply,
-                conversation_history=conversation_context,
-                api_provider=st.session_state.api_provider,
-                model=st.session_state.model
-            )
-            st.session_state.conversation.append({"sender": "assistant", "text": bot_response})
-            
-            # Generate new quick replies based on the updated conversation
-            st.session_state.quick_replies = generate_quick_replies(conversation_context)
-            
-            # Clear both the session state and input message
-            st.session_state.input_message = ""
-            st.rerun()
-
-# Input Area with improved styling
-st.markdown("<div class='input-container'>", unsafe_allow_html=True)
-cols = st.columns([5, 1])
-with cols[0]:
-    # Use an empty default value and get the current input from session state
-    input_message = st.text_input(
-        "Your message",
-        value="",  # Set empty default value
-        key=f"input_message_field_{st.session_state.get('input_counter', 0)}",  # Dynamic key to force refresh
-        placeholder="Type your message here or select a suggestion above...",
-        label_visibility="collapsed",
-        on_change=lambda: handle_message(st.session_state[f"input_message_field_{st.session_state.get('input_counter', 0)}"]) if st.session_state[f"input_message_field_{st.session_state.get('input_counter', 0)}"].strip() else None
-    )
-with cols[1]:
-    send_button = st.button("Send", use_container_width=True)
-st.markdown("</div>", unsafe_allow_html=True)
+    Rerun only the chat fragment, or the whole app when the fragment is
+    running as part of a full-app run
+    """
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
 
-# Initialize input counter if not exists
-if "input_counter" not in st.session_state:
-    st.session_state.input_counter = 0
+def render_transcript(conversation):
+    """
+    Render the most recent window of the conversation as a single markdown
+    element, reusing each message's cached HTML
+    """
+    rendered = conversation.rendered_html
+    for msg in conversation.messages[len(rendered):]:
+        rendered.append(format_message_html(msg["role"], msg["content"]))
+    
+    start = max(0, len(rendered) - st.session_state.transcript_window)
+    if start > 0 and st.button(f"Load earlier messages ({start} more)", key="load_earlier", use_container_width=True):
+        st.session_state.transcript_window += TRANSCRIPT_PAGE_SIZE
+        rerun_chat_area()
+    if rendered:
+        st.markdown("\n".join(rendered[start:]), unsafe_allow_html=True)
 
 def handle_message(message):
     if message.strip():
         # Add user message to conversation
-        st.session_state.conversation.append({"sender": "user", "text": message})
+        st.session_state.conversation.append("user", message)
         
-        # Build conversation context
-        conversation_context = "\n".join(
-            [f"{msg['sender'].capitalize()}: {msg['text']}" for msg in st.session_state.conversation]
-        )
+        # Queue the message so its reply streams into the chat container
+        st.session_state.pending_message = message
         
-        # Get bot response
-        bot_response = get_chat_response(
-            message=message,
-            conversation_history=conversation_context,
-            api_provider=st.session_state.api_provider,
+        # Increment the counter to force a new text input widget
+        st.session_state.input_counter += 1
+
+@st.fragment
+def chat_area():
+    """
+    Transcript, quick replies and input. Interacting with any of them reruns
+    only this fragment, so the sidebar and styles are not rebuilt per turn.
+    """
+    # Fragment reruns skip the top of the script, so check for changes made
+    # by other worker processes here too; a reload repaints the sidebar
+    if sync_session_state():
+        st.rerun()
+    
+    # Trace the stages of a turn when one is queued
+    trace = None
+    if st.session_state.pending_message is not None:
+        trace = TurnTrace(
+            metrics,
+            trace_sink,
+            session_id=st.session_state.session_id,
+            conversation_id=st.session_state.conversation.id,
+            provider=st.session_state.api_provider,
             model=st.session_state.model
         )
-        st.session_state.conversation.append({"sender": "assistant", "text": bot_response})
+    
+    # Chat Container
+    chat_container = st.container()
+    with chat_container:
+        with trace.span("render_transcript") if trace else nullcontext():
+            render_transcript(st.session_state.conversation)
+    
+    # Quick Replies (shown before user input)
+    if st.session_state.quick_replies:
+        quick_reply_cols = st.columns(3)
+        for idx, reply in enumerate(st.session_state.quick_replies):
+            if quick_reply_cols[idx].button(
+                reply,
+                key=f"quick_reply_{idx}",
+                use_container_width=True
+            ):
+                # Process the quick reply as user input; the reply streams on rerun
+                st.session_state.conversation.append("user", reply)
+                st.session_state.pending_message = reply
+                
+                # Clear both the session state and input message
+                st.session_state.input_message = ""
+                rerun_chat_area()
+    
+    # Input Area with improved styling
+    st.markdown("<div class='input-container'>", unsafe_allow_html=True)
+    cols = st.columns([5, 1])
+    with cols[0]:
+        # Use an empty default value and get the current input from session state
+        input_message = st.text_input(
+            "Your message",
+            value="",  # Set empty default value
+            key=f"input_message_field_{st.session_state.input_counter}",  # Dynamic key to force refresh
+            placeholder="Type your message here or select a suggestion above...",
+            label_visibility="collapsed",
+            on_change=lambda: handle_message(st.session_state[f"input_message_field_{st.session_state.input_counter}"]) if st.session_state[f"input_message_field_{st.session_state.input_counter}"].strip() else None
+        )
+    with cols[1]:
+        send_button = st.button("Send", use_container_width=True)
+    st.markdown("</div>", unsafe_allow_html=True)
+    
+    # Handle manual message input from send button
+    if send_button and input_message.strip():
+        handle_message(input_message)
+        rerun_chat_area()
+    
+    # Stream the reply to a message queued by handle_message or a quick reply.
+    # This runs after the quick replies are drawn so the previous suggestions
+    # stay visible while the new ones are generated alongside the reply.
+    if st.session_state.pending_message is not None:
+        st.session_state.pending_message = None
+        conversation = st.session_state.conversation
         
-        # Generate new quick replies
-        st.session_state.quick_replies = generate_quick_replies(conversation_context)
+        # Generate new quick replies in parallel with the chat completion. The
+        # window is a fresh list, so the reply appended below is not picked up.
+        quick_replies_future = background_executor.submit(
+            trace.traced,
+            "quick_replies",
+            generate_quick_replies,
+            context_manager.window(conversation, "gpt-3.5-turbo", refresh_summary=False),
+            on_usage=trace.usage_recorder("quick_replies")
+        )
         
-        # Increment the counter to force a new text input widget
-        st.session_state.input_counter += 1
+        with chat_container, trace.span("chat_response"):
+            # With the auto model, the message decides between the fast and strong model
+            model = resolve_model(st.session_state.api_provider, st.session_state.model, conversation.messages[-1]["content"])
+            history = context_manager.window(conversation, model, reserved_tokens=get_system_prompt_tokens())
+            # Demo, integration and feature questions the router is sure about
+            # are answered from the config; everything else goes to the model
+            local_answer = answer_locally(history, session_id=st.session_state.session_id)
+            deltas = None
+            if local_answer is not None:
+                trace.attributes["intent"] = local_answer["intent"]
+                deltas = iter([local_answer["text"]])
+            elif conversation.messages[-1]["content"] in st.session_state.quick_replies:
+                # A clicked quick reply may already be answered, or on its way
+                deltas = take_prefetched_response(
+                    st.session_state.session_id, conversation, st.session_state.api_provider, st.session_state.model
+                )
+                trace.attributes["prefetched"] = deltas is not None
+            if deltas is None:
+                trace.attributes["routed_model"] = model
+                deltas = get_chat_response(
+                    conversation_history=history,
+                    api_provider=st.session_state.api_provider,
+                    model=model,
+                    on_usage=trace.usage_recorder("chat")
+                )
+            bot_response, turn_metrics = stream_chat_response(st.empty(), deltas)
+        conversation.append("assistant", bot_response)
+        demo_booked = local_answer is not None and "booking" in local_answer
+        if demo_booked:
+            demo_request = {
+                "message": history[-1]["content"],
+                "conversation_id": conversation.id,
+                "status": local_answer["booking"]["status"],
+                "requested_at": time.time()
+            }
+            if "booking_id" in local_answer["booking"]:
+                demo_request["booking_id"] = local_answer["booking"]["booking_id"]
+            st.session_state.demo_requests.append(demo_request)
+            if conversation_store is not None:
+                conversation_store.add_demo_request(st.session_state.session_id, demo_request)
+        metrics.observe("miachat_time_to_first_token_seconds", turn_metrics["ttft"], provider=st.session_state.api_provider)
         
-        # Rerun the app
-        st.rerun()
+        # Swap in the new suggestions once they arrive and keep them with the chat
+        with trace.span("quick_replies_wait"):
+            st.session_state.quick_replies = quick_replies_future.result()
+        conversation.quick_replies = st.session_state.quick_replies
+        
+        with trace.span("history_save"):
+            new_chat = save_current_chat()
+            commit_session_state()
+        prefetch_quick_replies()
+        
+        trace.attributes.update(ttft_ms=round(turn_metrics["ttft"] * 1000, 3), tokens_per_sec=round(turn_metrics["tokens_per_sec"], 2))
+        record = trace.finish()
+        turn_metrics["spans"] = {span["name"]: span["duration_ms"] for span in record["spans"]}
+        turn_metrics["usage"] = record["usage"]
+        st.session_state.turn_metrics.append(turn_metrics)
+        
+        # A chat that is new to the history, a new demo request or an open
+        # performance panel also needs the sidebar repainted
+        if new_chat or demo_booked or st.session_state.get("show_performance"):
+            st.rerun()
+        rerun_chat_area()
 
-# Handle manual message input from send button
-if send_button and input_message.strip():
-    handle_message(input_message)
+chat_area()
@@ -0,0 +1,256 @@
+"""
+Offline batch evaluation: replay a JSONL file of conversations through the
+chat core and record each reply with its latency and token usage.
+
+    python batch_eval.py conversations.jsonl --output results.jsonl --concurrency 16
+    python batch_eval.py conversations.jsonl --output results.csv --provider claude --model claude-3-5-haiku-latest
+
+Each input line is a conversation, {"id": ..., "messages": [...]} with
+OpenAI-format messages, or {"id": ..., "question": "..."} for a single turn.
+The reply to the last user message is generated; when the transcript goes
+on with an assistant message, that message is kept as "expected" so prompt
+or model changes can be compared against it. A line that is not such a
+conversation is recorded as an error row rather than stopping the run.
+
+Results are appended to the output file (JSONL or CSV, by extension) as each
+conversation finishes. Rerunning with the same output skips conversations
+that already succeeded, so an interrupted or partly failed run resumes
+where it stopped. Calls go through the same response cache, single-flight
+and rate limiter as the app (see the MIACHAT_* settings in chat_core).
+Demo requests answered by the intent router are not committed to the
+booking outbox.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import statistics
+import sys
+import time
+
+from conversation import Conversation
+from chat_core import (
+    PROVIDER_MODELS,
+    aget_chat_response,
+    answer_locally,
+    get_context_manager,
+    get_system_prompt_tokens
+)
+
+RESULT_FIELDS = [
+    "id", "provider", "model", "intent", "reply", "expected",
+    "latency_s", "ttft_s", "prompt_tokens", "completion_tokens", "error"
+]
+
+
+def load_conversations(path):
+    """
+    Parse the input file into (id, messages, expected) tuples, where
+    messages end with the user turn to reply to, and (id, error) pairs for
+    the lines that are not conversations
+    """
+    conversations = []
+    invalid = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            conversation_id = str(line_number)
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise TypeError(f"a JSON {type(record).__name__} is not an object")
+                conversation_id = str(record.get("id", line_number))
+                messages = record.get("messages") or [{"role": "user", "content": record["question"]}]
+                messages = [{"role": message["role"], "content": message["content"]} for message in messages]
+            except (ValueError, KeyError, TypeError) as e:
+                invalid.append((conversation_id, f"Invalid input line {line_number}: expected \"messages\" or \"question\" ({e})"))
+                continue
+
+            last_user = max((idx for idx, message in enumerate(messages) if message["role"] == "user"), default=None)
+            if last_user is None:
+                invalid.append((conversation_id, f"Invalid input line {line_number}: conversation has no user message"))
+                continue
+            following = messages[last_user + 1:last_user + 2]
+            expected = following[0]["content"] if following and following[0]["role"] == "assistant" else ""
+            conversations.append((conversation_id, messages[:last_user + 1], expected))
+    return conversations, invalid
+
+
+def load_results(path):
+    """
+    Rows already written to the output file, latest per conversation id
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    return {row["id"]: row for row in rows}
+
+
+class ResultWriter:
+    """
+    Append result rows to a JSONL or CSV file, flushing each one so an
+    interrupted run loses nothing it finished
+    """
+
+    def __init__(self, path):
+        self.csv = path.endswith(".csv")
+        write_header = self.csv and (not os.path.exists(path) or os.path.getsize(path) == 0)
+        self.file = open(path, "a", encoding="utf-8", newline="")
+        if self.csv:
+            self.writer = csv.DictWriter(self.file, fieldnames=RESULT_FIELDS)
+            if write_header:
+                self.writer.writeheader()
+
+    def write(self, row):
+        if self.csv:
+            self.writer.writerow(row)
+        else:
+            self.file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def new_row(conversation_id, provider, model, expected=""):
+    """
+    An empty result row for a conversation
+    """
+    row = dict.fromkeys(RESULT_FIELDS, "")
+    row.update(id=conversation_id, provider=provider, model=model, expected=expected, prompt_tokens=0, completion_tokens=0)
+    return row
+
+
+async def replay(conversation_id, messages, expected, provider, model, model_only):
+    """
+    Generate the reply to one conversation, returning its result row
+    """
+    row = new_row(conversation_id, provider, model, expected)
+    history = get_context_manager().window(
+        Conversation(messages), model, reserved_tokens=get_system_prompt_tokens(), refresh_summary=False
+    )
+
+    start = time.perf_counter()
+    # Demo requests get their reply but are never booked from a batch run
+    local_answer = None if model_only else answer_locally(history, book=False)
+    if local_answer is not None:
+        row.update(intent=local_answer["intent"], reply=local_answer["text"])
+        row["latency_s"] = row["ttft_s"] = round(time.perf_counter() - start, 4)
+        return row
+
+    usage = {}
+    chunks = []
+    try:
+        async for delta in aget_chat_response(history, provider, model, on_usage=usage.update, raise_errors=True):
+            if not chunks:
+                row["ttft_s"] = round(time.perf_counter() - start, 4)
+            chunks.append(delta)
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["latency_s"] = round(time.perf_counter() - start, 4)
+    row["reply"] = "".join(chunks)
+    row["prompt_tokens"] = usage.get("prompt_tokens", 0)
+    row["completion_tokens"] = usage.get("completion_tokens", 0)
+    return row
+
+
+async def run(conversations, writer, provider, model, concurrency, model_only):
+    """
+    Replay conversations with at most `concurrency` in flight, writing each
+    row as it completes
+    """
+    queue = asyncio.Queue()
+    for conversation in conversations:
+        queue.put_nowait(conversation)
+    done = 0
+
+    async def worker():
+        nonlocal done
+        while not queue.empty():
+            conversation_id, messages, expected = queue.get_nowait()
+            writer.write(await replay(conversation_id, messages, expected, provider, model, model_only))
+            done += 1
+            if done % 100 == 0 or done == len(conversations):
+                print(f"{done}/{len(conversations)} conversations replayed", file=sys.stderr)
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(conversations)))))
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else None
+
+
+def summarize(rows, elapsed):
+    """
+    Latency, token and error statistics over the latest row per conversation
+    """
+    succeeded = [row for row in rows if not row["error"]]
+    model_rows = [row for row in succeeded if not row["intent"]]
+    latencies = sorted(float(row["latency_s"]) for row in model_rows)
+    ttfts = sorted(float(row["ttft_s"]) for row in model_rows if row["ttft_s"] != "")
+    return {
+        "conversations": len(rows),
+        "errors": len(rows) - len(succeeded),
+        "answered_locally": len(succeeded) - len(model_rows),
+        "latency_s": {
+            "mean": round(statistics.fmean(latencies), 4) if latencies else None,
+            "p50": _percentile(latencies, 0.5),
+            "p90": _percentile(latencies, 0.9),
+            "p99": _percentile(latencies, 0.99)
+        },
+        "ttft_s": {"p50": _percentile(ttfts, 0.5), "p90": _percentile(ttfts, 0.9)},
+        "prompt_tokens": sum(int(row["prompt_tokens"] or 0) for row in succeeded),
+        "completion_tokens": sum(int(row["completion_tokens"] or 0) for row in succeeded),
+        "elapsed_s": round(elapsed, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay conversations through the MiaChat chat core")
+    parser.add_argument("input", help="JSONL file of conversations")
+    parser.add_argument("--output", required=True, help="Results file, .jsonl or .csv; resumed if it exists")
+    parser.add_argument("--provider", default="gpt", choices=list(PROVIDER_MODELS))
+    parser.add_argument("--model", help="Defaults to the provider's first model")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--model-only", action="store_true", help="Send every message to the model, skipping the intent router")
+    parser.add_argument("--stats", help="Also write the summary statistics to this JSON file")
+    args = parser.parse_args()
+
+    model = args.model or PROVIDER_MODELS[args.provider][0]
+    if model not in PROVIDER_MODELS[args.provider]:
+        parser.error(f"--model must be one of {', '.join(PROVIDER_MODELS[args.provider])}")
+
+    conversations, invalid = load_conversations(args.input)
+    finished = {conversation_id for conversation_id, row in load_results(args.output).items() if not row["error"]}
+    pending = [conversation for conversation in conversations if conversation[0] not in finished]
+    print(f"{len(pending)} of {len(conversations)} conversations to replay", file=sys.stderr)
+
+    start = time.perf_counter()
+    writer = ResultWriter(args.output)
+    try:
+        for conversation_id, error in invalid:
+            row = new_row(conversation_id, args.provider, model)
+            row["error"] = error
+            writer.write(row)
+        asyncio.run(run(pending, writer, args.provider, model, max(1, args.concurrency), args.model_only))
+    finally:
+        writer.close()
+
+    ids = {conversation[0] for conversation in conversations} | {conversation_id for conversation_id, _ in invalid}
+    rows = [row for conversation_id, row in load_results(args.output).items() if conversation_id in ids]
+    stats = summarize(rows, time.perf_counter() - start)
+    if args.stats:
+        with open(args.stats, "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=2)
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark chat history search: save a session's worth of synthetic chats
+(thousands of conversations) one turn at a time, as the app does, then time
+searches with the in-memory HistoryIndex and the conversation store's FTS5
+index. Reports the cost of indexing each appended message in memory and the
+search latency percentiles. The vocabulary is small, so common words match
+far more messages than in real chats.
+
+    python benchmarks/chat_search.py --conversations 5000 --turns 4
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from conversation import Conversation
+from conversation_store import ConversationStore
+from history_search import HistoryIndex
+
+WORDS = (
+    "salesforce hubspot zendesk freshdesk whatsapp messenger instagram telegram voice email sms webhook api "
+    "pricing plan demo onboarding analytics dashboard campaign broadcast template agent handoff workflow "
+    "intent training multilingual translation sentiment survey ticket order refund shipping payment invoice "
+    "login password integration sync migration sandbox production deploy latency error retry timeout"
+).split()
+FILLER = "the a to of and in for with my our how can i do we is it on".split()
+QUERIES = ["salesforce sync", "whatsapp pricing", "refund", "agent handoff", "migra", "webhook timeout", "dashb"]
+
+
+def message(rng, length):
+    return " ".join(rng.choice(WORDS) if rng.random() < 0.4 else rng.choice(FILLER) for _ in range(length))
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def latency_report(samples):
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3)
+    }
+
+
+def run(conversations, turns, searches, seed):
+    rng = random.Random(seed)
+    index = HistoryIndex()
+    with tempfile.TemporaryDirectory() as workdir:
+        store = ConversationStore(os.path.join(workdir, "history.sqlite3"))
+        index_ms = 0.0
+        messages = 0
+        for number in range(conversations):
+            conversation = Conversation()
+            for _ in range(turns):
+                conversation.append("user", message(rng, rng.randint(5, 20)))
+                conversation.append("assistant", message(rng, rng.randint(20, 60)))
+                _, elapsed = timed(index.add, conversation.id, conversation.messages)
+                index_ms += elapsed
+                store.save_conversation("benchmark", conversation, f"Chat {number}")
+                messages += 2
+        store.flush()
+
+        memory_ms = []
+        store_ms = []
+        for idx in range(searches):
+            query = QUERIES[idx % len(QUERIES)]
+            memory_ms.append(timed(index.search, query, limit=8)[1])
+            store_ms.append(timed(store.search, "benchmark", query, limit=8)[1])
+
+    return {
+        "conversations": conversations,
+        "messages": messages,
+        "history_index_add_us_per_message": round(index_ms * 1000 / messages, 2),
+        "history_index_search": latency_report(memory_ms),
+        "store_fts_search": latency_report(store_ms)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chat history search")
+    parser.add_argument("--conversations", type=int, default=5000)
+    parser.add_argument("--turns", type=int, default=4, help="User and assistant message pairs per conversation")
+    parser.add_argument("--searches", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    print(json.dumps(run(args.conversations, args.turns, args.searches, args.seed), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Local stand-in for the OpenAI chat completions API.
+
+Serves POST /v1/chat/completions in both streaming (SSE) and non-streaming
+form with configurable latency and error injection, so the app can be load
+tested without network access or API spend.
+
+    python benchmarks/fake_openai_server.py --port 8765 --first-token-latency 0.3
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake streamlit run app.py
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUICK_REPLY_TEXT = "1. Mia, how do I connect Salesforce?\n2. I'd like to book a demo with you\n3. Can you explain Orch LLM?"
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        settings = self.server.settings
+        self.server.record_request()
+
+        if random.random() < settings["error_rate"]:
+            self._send_json(503, {"error": {"message": "Injected error", "type": "server_error"}})
+            return
+
+        time.sleep(settings["first_token_latency"])
+        words = self._reply_words(body)
+        if body.get("stream"):
+            usage = self._usage(body, words) if (body.get("stream_options") or {}).get("include_usage") else None
+            self._stream(body["model"], words, usage)
+        else:
+            time.sleep(settings["token_latency"] * max(0, len(words) - 1))
+            self._send_json(200, {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                    "finish_reason": "stop"
+                }],
+                "usage": self._usage(body, words)
+            })
+
+    def _reply_words(self, body):
+        """
+        Quick reply prompts get three numbered suggestions, everything else a
+        filler answer of the configured length
+        """
+        last_message = body["messages"][-1]["content"] if body.get("messages") else ""
+        if "quick replies" in last_message:
+            return QUICK_REPLY_TEXT.split(" ")
+        tokens = min(self.server.settings["reply_tokens"], body.get("max_tokens") or 150)
+        return [f"word{idx}" for idx in range(tokens)]
+
+    def _usage(self, body, words):
+        prompt_tokens = sum(len(message["content"]) // 4 + 4 for message in body.get("messages", []))
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": len(words), "total_tokens": prompt_tokens + len(words)}
+
+    def _stream(self, model, words, usage=None):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for idx, word in enumerate(words):
+            if idx:
+                time.sleep(self.server.settings["token_latency"])
+            self._write_event({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word if idx == 0 else " " + word}, "finish_reason": None}]
+            })
+        if usage:
+            self._write_event({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [],
+                "usage": usage
+            })
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_event(self, event):
+        self._write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, first_token_latency=0.0, token_latency=0.0, reply_tokens=40, error_rate=0.0):
+        super().__init__(address, FakeOpenAIHandler)
+        self.settings = {
+            "first_token_latency": first_token_latency,
+            "token_latency": token_latency,
+            "reply_tokens": reply_tokens,
+            "error_rate": error_rate
+        }
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+
+    def record_request(self):
+        with self._count_lock:
+            self.request_count += 1
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections is expected under load
+        pass
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def start_server(host="127.0.0.1", port=0, **settings):
+    """
+    Start a fake server on a background thread and return it
+    """
+    server = FakeOpenAIServer((host, port), **settings)
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(
+        (args.host, args.port),
+        first_token_latency=args.first_token_latency,
+        token_latency=args.token_latency,
+        reply_tokens=args.reply_tokens,
+        error_rate=args.error_rate
+    )
+    print(f"Fake OpenAI API listening on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
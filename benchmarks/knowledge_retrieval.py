@@ -0,0 +1,100 @@
+"""
+Benchmark knowledge retrieval: BM25 query latency and the system prompt
+tokens sent per call compared with the full static prompt.
+
+Queries the index built from YELLOW_AI_CONFIG (and MIACHAT_KNOWLEDGE_DIR if
+set), then again with --synthetic extra snippets to show how lookups scale
+with a larger docs directory.
+
+    python benchmarks/knowledge_retrieval.py --synthetic 20000
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import chat_core
+from context_window import count_tokens
+from knowledge_index import BM25Index, config_snippets
+
+QUERIES = [
+    "Hi Mia, tell me about Yellow.ai",
+    "Which CRM systems do you integrate with?",
+    "Can I deploy my bot on WhatsApp and Instagram?",
+    "Can you explain how Orch LLM works?",
+    "I'd like to book a demo with you",
+    "Do you support Zendesk or Freshdesk for ticketing?",
+    "How does the live agent handoff work?",
+    "What analytics do I get on bot performance?"
+]
+
+
+def time_queries(index, queries, repeat):
+    """
+    Per-query latencies in microseconds
+    """
+    latencies = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query, k=chat_core.KNOWLEDGE_TOP_K)
+            latencies.append((time.perf_counter() - start) * 1e6)
+    latencies.sort()
+    return {
+        "p50_us": round(statistics.median(latencies), 1),
+        "p99_us": round(latencies[int(len(latencies) * 0.99) - 1], 1),
+        "max_us": round(latencies[-1], 1)
+    }
+
+
+def synthetic_snippets(count, seed=0):
+    """
+    Filler paragraphs drawn from the config's vocabulary plus noise words
+    """
+    rng = random.Random(seed)
+    words = " ".join(config_snippets(chat_core.YELLOW_AI_CONFIG) + chat_core.YELLOW_AI_CAPABILITIES).split()
+    words += [f"term{idx}" for idx in range(5000)]
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(30, 120))) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BM25 knowledge retrieval")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--synthetic", type=int, default=20000, help="Extra snippets for the scaling run")
+    args = parser.parse_args()
+
+    index = chat_core.get_knowledge_index() or BM25Index(config_snippets(chat_core.YELLOW_AI_CONFIG) + chat_core.YELLOW_AI_CAPABILITIES)
+    static_tokens = count_tokens(chat_core.YELLOW_AI_PROMPT)
+    prompt_tokens = [count_tokens(chat_core.build_system_prompt([{"role": "user", "content": query}])) for query in QUERIES]
+
+    start = time.perf_counter()
+    large_index = BM25Index(index.snippets + synthetic_snippets(args.synthetic))
+    build_ms = (time.perf_counter() - start) * 1000
+
+    report = {
+        "snippets": len(index),
+        "query_latency": time_queries(index, QUERIES, args.repeat),
+        "system_prompt_tokens": {
+            "static": static_tokens,
+            "retrieved_mean": round(statistics.fmean(prompt_tokens), 1),
+            "retrieved_max": max(prompt_tokens),
+            "saved_per_call": round(static_tokens - statistics.fmean(prompt_tokens), 1)
+        },
+        "scaled": {
+            "snippets": len(large_index),
+            "build_ms": round(build_ms, 1),
+            "query_latency": time_queries(large_index, QUERIES, max(1, args.repeat // 10))
+        }
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Load test that simulates many concurrent MiaChat sessions.
+
+Each simulated session drives app.py headlessly through Streamlit's AppTest:
+it types messages (handle_message), clicks quick-reply buttons, starts a new
+chat and reopens the previous one from the sidebar history. Model calls go to
+a local fake OpenAI-compatible server with configurable latency. Results are
+printed as JSON so runs can be compared over time.
+
+AppTest drives a process-global Streamlit runtime, so concurrent sessions run
+in separate worker processes that all share the one fake server. They run in
+a scratch directory, so the conversation store, booking outbox and traces
+start empty and nothing is left behind, and with the intent router off, so
+every turn is a model call.
+
+    python benchmarks/load_test.py --sessions 50 --concurrency 16 --turns 4
+"""
+
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from streamlit.testing.v1 import AppTest
+
+from fake_openai_server import start_server
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of a list of numbers
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def summarize(values):
+    """
+    p50/p95/p99 and max of a list of seconds, in milliseconds
+    """
+    if not values:
+        return {}
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "max_ms": round(max(values) * 1000, 2),
+        "mean_ms": round(statistics.fmean(values) * 1000, 2)
+    }
+
+
+def find_button(at, label):
+    for button in at.button:
+        if button.label == label:
+            return button
+    raise LookupError(f"No button labelled {label!r}")
+
+
+def find_chat_input(at):
+    """
+    The message box, as opposed to the sidebar's history search box
+    """
+    for text_input in at.text_input:
+        if text_input.key != "history_query":
+            return text_input
+    raise LookupError("No message input")
+
+
+def run_session(app_path, turns, timeout):
+    """
+    Drive one session through typed messages, quick replies and the sidebar
+    history, returning its turn and rerun timings
+    """
+    timings = {"turn": [], "rerun": [], "history": [], "errors": 0}
+    at = AppTest.from_file(app_path, default_timeout=timeout)
+    at.run()
+
+    def timed(bucket, action):
+        start = time.perf_counter()
+        action()
+        timings[bucket].append(time.perf_counter() - start)
+        if at.exception:
+            timings["errors"] += 1
+
+    for turn in range(turns):
+        if turn % 2 == 0:
+            timed("turn", lambda: find_chat_input(at).input(f"Question {turn}: how do I connect Salesforce?").run())
+        else:
+            timed("turn", lambda: at.button(key="quick_reply_0").click().run())
+        # A no-op rerun is what every other interaction on the page pays
+        timed("rerun", lambda: at.run())
+
+    timed("history", lambda: find_button(at, "New Chat").click().run())
+    timed("history", lambda: at.button(key="history_0").click().run())
+    return timings, at
+
+
+def run_worker_session(session_args):
+    """
+    Process pool entry point; the AppTest itself cannot be sent back
+    """
+    return run_session(*session_args)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test concurrent MiaChat sessions against a fake LLM")
+    parser.add_argument("--app", default=os.path.join(ROOT, "app.py"))
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--first-token-latency", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.005)
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--memory-sessions", type=int, default=5, help="Sessions replayed under tracemalloc to estimate memory per session")
+    parser.add_argument("--cache", action="store_true", help="Leave the response cache enabled")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+    app_path = os.path.abspath(args.app)
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    server = start_server(
+        first_token_latency=args.first_token_latency,
+        token_latency=args.token_latency,
+        reply_tokens=args.reply_tokens,
+        error_rate=args.error_rate
+    )
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+    if not args.cache:
+        os.environ["MIACHAT_RESPONSE_CACHE"] = "0"
+    os.environ["MIACHAT_INTENT_ROUTER"] = "0"
+
+    # AppTest swaps out __main__ inside the workers, so the entry point is
+    # referenced through its importable module name
+    import load_test
+
+    workdir = tempfile.TemporaryDirectory()
+    # Workers are started after this, so they share the scratch directory
+    os.chdir(workdir.name)
+    with ProcessPoolExecutor(max_workers=args.concurrency) as pool:
+        # One untimed session per worker pays for imports and cold caches
+        list(pool.map(load_test.run_worker_session, [(app_path, 1, args.timeout)] * args.concurrency))
+        warm_up_requests = server.request_count
+
+        start = time.perf_counter()
+        results = list(pool.map(load_test.run_worker_session, [(app_path, args.turns, args.timeout)] * args.sessions))
+        elapsed = time.perf_counter() - start
+        llm_requests = server.request_count - warm_up_requests
+
+    # Memory is measured separately since tracemalloc slows everything down
+    run_session(app_path, 1, args.timeout)
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    kept_sessions = [run_session(app_path, args.turns, args.timeout)[1] for _ in range(args.memory_sessions)]
+    gc.collect()
+    per_session = (tracemalloc.get_traced_memory()[0] - baseline) / max(1, len(kept_sessions))
+    tracemalloc.stop()
+    os.chdir(ROOT)
+    workdir.cleanup()
+
+    turn_latencies = [value for timings in results for value in timings["turn"]]
+    report = {
+        "config": {
+            "sessions": args.sessions,
+            "concurrency": args.concurrency,
+            "turns": args.turns,
+            "first_token_latency": args.first_token_latency,
+            "token_latency": args.token_latency,
+            "reply_tokens": args.reply_tokens,
+            "error_rate": args.error_rate,
+            "cache": args.cache
+        },
+        "turn_latency": summarize(turn_latencies),
+        "rerun_render": summarize([value for timings in results for value in timings["rerun"]]),
+        "history_navigation": summarize([value for timings in results for value in timings["history"]]),
+        "throughput_turns_per_sec": round(len(turn_latencies) / elapsed, 2),
+        "elapsed_sec": round(elapsed, 2),
+        "memory_per_session_kb": round(per_session / 1024, 1),
+        "llm_requests": llm_requests,
+        "session_errors": sum(timings["errors"] for timings in results)
+    }
+    server.shutdown()
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if output_path:
+        with open(output_path, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark shared session state across worker processes: N processes serve
+turns for a pool of sessions with no stickiness, each turn going through the
+same conversation store steps as the app (version check, reload when another
+process moved the session on, save, optimistic commit). The model call is a
+fixed sleep, so the numbers show how far the shared store lets throughput
+scale with the worker count.
+
+    python benchmarks/session_scaling.py --workers 1 2 4 8 --seconds 5
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from conversation import Conversation
+from conversation_store import ConversationStore
+
+
+def serve_turns(path, sessions, seconds, model_latency, seed, results):
+    """
+    One worker process: pick a random session per turn until time runs out
+    """
+    rng = random.Random(seed)
+    store = ConversationStore(path)
+    loaded = {}
+    turns = reloads = conflicts = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        session_id = f"session-{rng.randrange(sessions)}"
+        version, conversation = loaded.get(session_id, (None, None))
+        if version != store.session_version(session_id):
+            session = store.load_session(session_id)
+            conversation = store.load_conversation(session["conversation_id"]) if session else Conversation()
+            version = session["version"] if session else 0
+            reloads += 1
+
+        conversation.append("user", f"question {turns}")
+        time.sleep(model_latency)
+        conversation.append("assistant", f"answer {turns}")
+        store.save_conversation(session_id, conversation, "Benchmark chat")
+        new_version = store.commit_session(session_id, conversation.id, "Benchmark chat", version).result()
+        if new_version is None:
+            conflicts += 1
+            loaded.pop(session_id, None)
+        else:
+            loaded[session_id] = (new_version, conversation)
+        turns += 1
+    results.put({"turns": turns, "reloads": reloads, "conflicts": conflicts})
+
+
+def run(workers, sessions, seconds, model_latency):
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "sessions.sqlite3")
+        ConversationStore(path)
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=serve_turns, args=(path, sessions, seconds, model_latency, seed, results))
+            for seed in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        totals = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    turns = sum(total["turns"] for total in totals)
+    return {
+        "workers": workers,
+        "turns_per_sec": round(turns / seconds, 1),
+        "reload_rate": round(sum(total["reloads"] for total in totals) / max(1, turns), 3),
+        "conflict_rate": round(sum(total["conflicts"] for total in totals) / max(1, turns), 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark shared session state across worker processes")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--model-latency", type=float, default=0.05, help="Seconds each simulated model call takes")
+    args = parser.parse_args()
+
+    report = [run(workers, args.sessions, args.seconds, args.model_latency) for workers in args.workers]
+    baseline = report[0]["turns_per_sec"] / report[0]["workers"]
+    for row in report:
+        row["scaling_efficiency"] = round(row["turns_per_sec"] / (baseline * row["workers"]), 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark app start-up: cold start of a fresh process (imports plus the
+first script run) and the cost of a no-op rerun, the full-script rerun
+Streamlit does on every widget interaction.
+
+Runs app.py headlessly with streamlit's AppTest against the mock provider,
+in a scratch directory so the response cache and conversation store start
+empty.
+
+    python benchmarks/startup.py --runs 5 --reruns 50
+"""
+
+import argparse
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Child process for one cold start: time the imports the script pulls in and
+# the first run, then report the modules loaded before any model call
+COLD_START = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+app = AppTest.from_file(sys.argv[1], default_timeout=60).run()
+assert not app.exception, app.exception
+done = time.perf_counter()
+print(json.dumps({
+    "streamlit_import_ms": (imported - start) * 1000,
+    "first_run_ms": (done - imported) * 1000,
+    "heavy_modules": sorted(name for name in ("numpy", "openai", "anthropic", "tiktoken") if name in sys.modules)
+}))
+"""
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(samples), 1),
+        # Nearest rank, so it is never below the median
+        "p90_ms": round(samples[min(len(samples) - 1, math.ceil(len(samples) * 0.9) - 1)], 1),
+        "min_ms": round(samples[0], 1)
+    }
+
+
+def cold_starts(runs, workdir, env):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", COLD_START, os.path.join(ROOT, "app.py")],
+            cwd=workdir, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        "streamlit_import": summarize([result["streamlit_import_ms"] for result in results]),
+        "first_run": summarize([result["first_run_ms"] for result in results]),
+        "heavy_modules_loaded": results[-1]["heavy_modules"]
+    }
+
+
+def noop_reruns(reruns, workdir):
+    """
+    Rerun the app with no input in this process, after one warm-up run
+    """
+    from streamlit.testing.v1 import AppTest
+
+    os.chdir(workdir)
+    app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60).run()
+    samples = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MiaChat cold start and no-op reruns")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes for the cold start")
+    parser.add_argument("--reruns", type=int, default=50)
+    args = parser.parse_args()
+
+    os.environ["MIACHAT_OFFLINE"] = "1"
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    sys.path.insert(0, ROOT)
+    with tempfile.TemporaryDirectory() as workdir:
+        report = {
+            "cold_start": cold_starts(args.runs, workdir, env),
+            "noop_rerun": noop_reruns(args.reruns, workdir)
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark the rerun cost of the chat page with a long conversation loaded.
+
+Runs app.py headlessly through Streamlit's AppTest with a synthetic
+conversation in session state and times no-op reruns, which is what every
+keystroke-triggered interaction pays. Point --app at an older checkout of
+app.py to get a before/after comparison; an app.py from before the
+Conversation class is seeded with its list of sender/text dicts instead.
+Runs in a scratch directory, so the conversation store and booking outbox
+start empty and nothing is left behind. A run that raises aborts the
+benchmark rather than timing the error page.
+
+    python benchmarks/transcript_render.py --messages 500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.testing.v1 import AppTest
+
+from conversation import Conversation
+
+
+def build_conversation(message_count, legacy=False):
+    """
+    Build a synthetic conversation alternating user and assistant turns, as
+    a list of {"sender", "text"} dicts when `legacy` is set
+    """
+    conversation = [] if legacy else Conversation()
+    for idx in range(message_count):
+        if idx % 2 == 0:
+            role, content = "user", f"Question {idx}: how do I connect Salesforce to my bot?"
+        else:
+            role, content = "assistant", f"Answer {idx}: Yellow.ai integrates with Salesforce through its CRM connector. " * 3
+        if legacy:
+            conversation.append({"sender": role, "text": content})
+        else:
+            conversation.append(role, content)
+    return conversation
+
+
+def timed_run(at):
+    """
+    Run the app once, returning the seconds it took; exits if it raised
+    """
+    start = time.perf_counter()
+    at.run()
+    elapsed = time.perf_counter() - start
+    if at.exception:
+        sys.exit(f"The app raised an exception: {at.exception[0].message}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--app", default=os.path.join(ROOT, "app.py"))
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--reruns", type=int, default=20)
+    args = parser.parse_args()
+    app_path = os.path.abspath(args.app)
+    with open(app_path, encoding="utf-8") as f:
+        legacy = "from conversation import" not in f.read()
+
+    os.environ["MIACHAT_RESPONSE_CACHE"] = "0"
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        at = AppTest.from_file(app_path, default_timeout=60)
+        at.session_state["conversation"] = build_conversation(args.messages, legacy=legacy)
+        try:
+            first_run = timed_run(at)
+            timings = [timed_run(at) for _ in range(args.reruns)]
+        finally:
+            os.chdir(ROOT)
+
+    print(json.dumps({
+        "app": args.app,
+        "messages": args.messages,
+        "markdown_elements": len(at.markdown),
+        "first_run_ms": round(first_run * 1000, 2),
+        "rerun_p50_ms": round(statistics.median(timings) * 1000, 2),
+        "rerun_max_ms": round(max(timings) * 1000, 2)
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
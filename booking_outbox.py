@@ -0,0 +1,262 @@
+"""
+Durable outbox for demo bookings. Bookings are committed to a local SQLite
+table when the user asks for a demo and delivered to the booking system
+(a CRM, or a file/HTTP stand-in) in batches by a background worker, with
+retries and backoff, so a slow or failing CRM never holds up the chat.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from providers import backoff_delay
+from singleflight import request_key
+
+# Delivery states of an outbox entry
+STATUS_PENDING = "pending"
+STATUS_DELIVERED = "delivered"
+STATUS_FAILED = "failed"
+
+
+class DeliveryError(Exception):
+    """
+    Error raised by a sink when a batch could not be delivered
+    """
+
+
+class FileSink:
+    """
+    Append delivered bookings to a JSONL file; a local stand-in for the CRM
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def deliver(self, bookings):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for booking in bookings:
+                f.write(json.dumps(booking, ensure_ascii=False) + "\n")
+
+
+class HttpSink:
+    """
+    POST each batch as {"bookings": [...]} to a booking endpoint. Every
+    booking carries its idempotency_key, so the receiver can drop repeats
+    of a batch that was retried after a lost response.
+    """
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def deliver(self, bookings):
+        body = json.dumps({"bookings": bookings}, ensure_ascii=False).encode("utf-8")
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+        except (urllib.error.URLError, OSError) as e:
+            raise DeliveryError(f"Delivery to {self.url} failed: {e}") from e
+
+
+def make_sink(spec):
+    """
+    Build a sink from a "file:<path>" or "http(s)://..." setting
+    """
+    if spec.startswith(("http://", "https://")):
+        return HttpSink(spec)
+    if spec.startswith("file:"):
+        return FileSink(spec[len("file:"):])
+    raise ValueError(f"Unknown booking sink {spec!r}; use file:<path> or an http(s) URL")
+
+
+def booking_key(session_id, booking):
+    """
+    Default idempotency key: the same booking submitted twice in a session
+    (a double click, a rerun) is only delivered once
+    """
+    return request_key("demo_booking", session_id, booking)
+
+
+class BookingOutbox:
+    """
+    Bookings are committed to SQLite before enqueue() returns, keyed by
+    idempotency key. One worker thread delivers due entries in batches of
+    up to `batch_size`. A batch is claimed before it is sent by pushing its
+    next attempt `lease_seconds` ahead, so workers in other processes
+    sharing the database skip it, and a worker that dies mid-delivery only
+    delays it. When a batch fails, its bookings are sent one at a time so
+    one bad booking does not hold back the rest; those that still fail are
+    retried with jittered exponential backoff, and entries that fail
+    `max_attempts` times are marked failed.
+    """
+
+    def __init__(self, path, sink, batch_size=50, max_attempts=8, backoff_base=1.0, backoff_cap=300.0, poll_interval=5.0,
+                 lease_seconds=300.0):
+        self.path = path
+        self.sink = sink
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self.stats = {"enqueued": 0, "duplicates": 0, "delivered": 0, "batches": 0, "retries": 0, "failed": 0}
+
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS booking_outbox ("
+            "idempotency_key TEXT PRIMARY KEY, session_id TEXT NOT NULL, payload TEXT NOT NULL, "
+            "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL, "
+            "last_error TEXT, created_at REAL NOT NULL, delivered_at REAL)"
+        )
+        self._connect().execute("CREATE INDEX IF NOT EXISTS booking_outbox_due ON booking_outbox (status, next_attempt_at)")
+        threading.Thread(target=self._deliver_loop, name="miachat-booking-outbox", daemon=True).start()
+
+    def _connect(self):
+        """
+        Return this thread's SQLite connection, opening it on first use
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, session_id, booking, idempotency_key=None):
+        """
+        Durably record a booking and return its idempotency key. A key that
+        is already in the outbox is left as it is.
+        """
+        key = idempotency_key or booking_key(session_id, booking)
+        now = time.time()
+        cursor = self._connect().execute(
+            "INSERT OR IGNORE INTO booking_outbox (idempotency_key, session_id, payload, status, next_attempt_at, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, session_id, json.dumps(booking, ensure_ascii=False), STATUS_PENDING, now, now)
+        )
+        with self._lock:
+            self.stats["enqueued" if cursor.rowcount else "duplicates"] += 1
+        self._wake.set()
+        return key
+
+    def status(self, keys):
+        """
+        Map each known idempotency key to {"status", "attempts", "last_error"}
+        """
+        keys = list(keys)
+        if not keys:
+            return {}
+        rows = self._connect().execute(
+            f"SELECT idempotency_key, status, attempts, last_error FROM booking_outbox "
+            f"WHERE idempotency_key IN ({', '.join('?' * len(keys))})",
+            keys
+        ).fetchall()
+        return {key: {"status": status, "attempts": attempts, "last_error": last_error} for key, status, attempts, last_error in rows}
+
+    def pending_count(self):
+        (count,) = self._connect().execute(
+            "SELECT COUNT(*) FROM booking_outbox WHERE status = ?", (STATUS_PENDING,)
+        ).fetchone()
+        return count
+
+    def _claim(self):
+        """
+        Lease up to batch_size due entries to this worker in one statement
+        """
+        now = time.time()
+        return self._connect().execute(
+            "UPDATE booking_outbox SET next_attempt_at = ? WHERE idempotency_key IN ("
+            "SELECT idempotency_key FROM booking_outbox WHERE status = ? AND next_attempt_at <= ? "
+            "ORDER BY next_attempt_at LIMIT ?) "
+            "RETURNING idempotency_key, session_id, payload, attempts, created_at",
+            (now + self.lease_seconds, STATUS_PENDING, now, self.batch_size)
+        ).fetchall()
+
+    def deliver_due(self):
+        """
+        Claim and deliver one batch of due entries, returning how many were
+        attempted
+        """
+        rows = self._claim()
+        if not rows:
+            return 0
+
+        bookings = [
+            {"idempotency_key": key, "session_id": session_id, "requested_at": created_at, **json.loads(payload)}
+            for key, session_id, payload, _, created_at in rows
+        ]
+        error = self._send(bookings)
+        if error is None:
+            errors = [None] * len(rows)
+            with self._lock:
+                self.stats["batches"] += 1
+        elif len(rows) == 1:
+            errors = [error]
+        else:
+            # Find the bookings that fail on their own
+            errors = [self._send([booking]) for booking in bookings]
+        self._finish(rows, errors)
+        return len(rows)
+
+    def _send(self, bookings):
+        """
+        Deliver bookings to the sink, returning the error text or None
+        """
+        try:
+            self.sink.deliver(bookings)
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"
+        return None
+
+    def _finish(self, rows, errors):
+        """
+        Record the outcome of claimed entries: delivered where the error is
+        None, else rescheduled with backoff or marked failed. Entries no
+        longer pending (delivered by a worker that took over an expired
+        lease) are left alone.
+        """
+        now = time.time()
+        updates = []
+        delivered = failed = 0
+        for (key, _, _, attempts, _), error in zip(rows, errors):
+            attempts += 1
+            if error is None:
+                updates.append((STATUS_DELIVERED, attempts, now, None, now, key, STATUS_PENDING))
+                delivered += 1
+            elif attempts >= self.max_attempts:
+                updates.append((STATUS_FAILED, attempts, now, error, None, key, STATUS_PENDING))
+                failed += 1
+            else:
+                delay = backoff_delay(attempts, self.backoff_base, self.backoff_cap)
+                updates.append((STATUS_PENDING, attempts, now + delay, error, None, key, STATUS_PENDING))
+        conn = self._connect()
+        conn.execute("BEGIN")
+        conn.executemany(
+            "UPDATE booking_outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, delivered_at = ? "
+            "WHERE idempotency_key = ? AND status = ?",
+            updates
+        )
+        conn.execute("COMMIT")
+        with self._lock:
+            self.stats["delivered"] += delivered
+            self.stats["retries"] += len(rows) - delivered - failed
+            self.stats["failed"] += failed
+
+    def _deliver_loop(self):
+        while True:
+            self._wake.clear()
+            try:
+                delivered = self.deliver_due()
+            except sqlite3.Error:
+                delivered = 0
+            if delivered < self.batch_size:
+                # Nothing more is due: sleep until a new booking or the next poll
+                self._wake.wait(self.poll_interval)
@@ -0,0 +1,1124 @@
+"""
+Chat core shared by the Streamlit app and the HTTP API server: platform
+configuration, process-wide resources and the chat, quick reply and
+Yellow.ai helper functions
+"""
+
+import asyncio
+import os
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from dotenv import load_dotenv
+
+from booking_outbox import BookingOutbox, make_sink
+from context_window import ContextManager, count_tokens
+from conversation_store import ConversationStore
+from hedging import Hedger
+from intent_router import IntentRouter
+from knowledge_index import BM25Index, config_snippets, integration_label, load_doc_snippets
+from metrics import MetricsRegistry, TraceSink, start_metrics_server
+from model_router import ModelRouter
+from prefetch import Prefetcher
+from providers import ClaudeProvider, MockProvider, OpenAIProvider
+from rate_limiter import PRIORITY_BACKGROUND, RateLimiter, RateLimitExceeded, estimate_tokens
+from response_cache import ResponseCache, make_cache_key, normalize_prompt
+from singleflight import SingleFlight, request_key
+
+# Load environment variables before the settings below are read
+load_dotenv()
+
+# Yellow.ai Platform Configuration
+YELLOW_AI_CONFIG = {
+    "channels": [
+        "WhatsApp",
+        "Facebook Messenger",
+        "Instagram",
+        "Web Chat",
+        "IVR",
+        "SMS"
+    ],
+    "features": {
+        "customer_support": {
+            "name": "Customer Support Automation",
+            "description": "AI-driven customer support with intelligent routing"
+        },
+        "sales_automation": {
+            "name": "Sales Automation",
+            "description": "Lead generation and sales process automation"
+        },
+        "hr_automation": {
+            "name": "HR Process Automation",
+            "description": "Streamline HR workflows and employee engagement"
+        },
+        "demo_booking": {
+            "name": "Demo Booking",
+            "description": "Schedule product demonstrations and sales calls"
+        }
+    },
+    "integrations": {
+        "crm": ["Salesforce", "HubSpot"],
+        "erp": ["SAP", "Oracle"],
+        "ticketing": ["Zendesk", "Freshdesk"],
+        "communication": ["Twilio", "MessageBird"]
+    }
+}
+
+# Prompt token budgets per model, leaving room for the reply
+MODEL_TOKEN_BUDGETS = {
+    "gpt-3.5-turbo": 3000,
+    "gpt-4": 7000
+}
+
+# Tokens of turns outside the window that trigger a summary refresh
+SUMMARY_REFRESH_THRESHOLD = 500
+
+# Models offered per provider in the sidebar
+PROVIDER_MODELS = {
+    "gpt": ["gpt-3.5-turbo", "gpt-4"],
+    "claude": ["claude-3-5-haiku-latest", "claude-sonnet-4-0"]
+}
+
+# The "auto" model sends each message to its provider's first (fast) model
+# or, when it scores at least MIACHAT_AUTO_MODEL_THRESHOLD, to the second
+# (strong) one, unless the strong model's recent p90 time to first token is
+# above MIACHAT_AUTO_MODEL_TTFT_SLO seconds
+AUTO_MODEL = "auto"
+AUTO_MODEL_THRESHOLD = int(os.getenv("MIACHAT_AUTO_MODEL_THRESHOLD", "3"))
+AUTO_MODEL_TTFT_SLO = float(os.getenv("MIACHAT_AUTO_MODEL_TTFT_SLO", "3.0"))
+
+# Provider call settings; MIACHAT_OFFLINE=1 routes every call to the local
+# mock provider, with MIACHAT_MOCK_* controlling its latency and errors
+PROVIDER_TIMEOUT = float(os.getenv("MIACHAT_PROVIDER_TIMEOUT", "30"))
+PROVIDER_MAX_RETRIES = int(os.getenv("MIACHAT_PROVIDER_MAX_RETRIES", "2"))
+OFFLINE_MODE = os.getenv("MIACHAT_OFFLINE", "0") == "1"
+
+# Environment variable holding each provider's API key
+PROVIDER_API_KEYS = {
+    "gpt": "OPENAI_API_KEY",
+    "claude": "ANTHROPIC_API_KEY"
+}
+
+# Hedged chat calls: a call without a first token after the
+# MIACHAT_HEDGE_PERCENTILE of recent first-token times (kept between the min
+# and max delay) is also sent to MIACHAT_HEDGE_TARGET, and a call that fails
+# before its first token is sent there at once. Targets are "provider" (the
+# other provider's model of the same tier, when its API key is set, else a
+# duplicate), "model" (the provider's other model) or "duplicate". Set
+# MIACHAT_HEDGE=0 to disable.
+HEDGE_ENABLED = os.getenv("MIACHAT_HEDGE", "1") == "1"
+HEDGE_TARGET = os.getenv("MIACHAT_HEDGE_TARGET", "provider")
+HEDGE_PERCENTILE = float(os.getenv("MIACHAT_HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_DELAY = float(os.getenv("MIACHAT_HEDGE_MIN_DELAY", "0.5"))
+HEDGE_MAX_DELAY = float(os.getenv("MIACHAT_HEDGE_MAX_DELAY", "8"))
+HEDGE_INITIAL_DELAY = float(os.getenv("MIACHAT_HEDGE_INITIAL_DELAY", "3"))
+
+# Response cache settings; set MIACHAT_RESPONSE_CACHE=0 to disable
+RESPONSE_CACHE_ENABLED = os.getenv("MIACHAT_RESPONSE_CACHE", "1") == "1"
+RESPONSE_CACHE_PATH = os.getenv("MIACHAT_RESPONSE_CACHE_PATH", "miachat_cache.sqlite3")
+RESPONSE_CACHE_TTL = int(os.getenv("MIACHAT_RESPONSE_CACHE_TTL", str(24 * 60 * 60)))
+
+# Identical in-flight model calls from concurrent sessions share one upstream
+# request; set MIACHAT_SINGLEFLIGHT=0 to disable. Sessions joining a call
+# give up after MIACHAT_SINGLEFLIGHT_TIMEOUT seconds without progress.
+SINGLEFLIGHT_ENABLED = os.getenv("MIACHAT_SINGLEFLIGHT", "1") == "1"
+SINGLEFLIGHT_TIMEOUT = float(os.getenv("MIACHAT_SINGLEFLIGHT_TIMEOUT", str(PROVIDER_TIMEOUT * (PROVIDER_MAX_RETRIES + 1))))
+
+# Account rate limits per model, shared by every session. Chat replies wait
+# up to RATE_LIMIT_TIMEOUT seconds for budget; quick replies and summaries
+# are shed instead once the budget drops to RATE_LIMIT_BACKGROUND_RESERVE.
+# Set MIACHAT_RATE_LIMITS=0 to disable.
+MODEL_RATE_LIMITS = {
+    "gpt-3.5-turbo": {"rpm": 3500, "tpm": 160000},
+    "gpt-4": {"rpm": 500, "tpm": 10000},
+    "claude-3-5-haiku-latest": {"rpm": 50, "tpm": 50000},
+    "claude-sonnet-4-0": {"rpm": 50, "tpm": 30000}
+}
+RATE_LIMITS_ENABLED = os.getenv("MIACHAT_RATE_LIMITS", "1") == "1"
+RATE_LIMIT_TIMEOUT = float(os.getenv("MIACHAT_RATE_LIMIT_TIMEOUT", "15"))
+RATE_LIMIT_BACKGROUND_RESERVE = float(os.getenv("MIACHAT_RATE_LIMIT_BACKGROUND_RESERVE", "0.2"))
+
+# Tracing and metrics; set MIACHAT_TRACE_PATH to an empty string to stop
+# writing traces and MIACHAT_METRICS_PORT to serve /metrics
+TRACE_PATH = os.getenv("MIACHAT_TRACE_PATH", "miachat_traces.jsonl")
+METRICS_PORT = os.getenv("MIACHAT_METRICS_PORT")
+
+# Durable chat history; set MIACHAT_CONVERSATION_STORE_PATH to an empty string
+# to keep chats in memory only. Chats left idle for MIACHAT_SESSION_IDLE_TIMEOUT
+# seconds are unloaded from memory until the user returns.
+CONVERSATION_STORE_PATH = os.getenv("MIACHAT_CONVERSATION_STORE_PATH", "miachat_conversations.sqlite3")
+SESSION_IDLE_TIMEOUT = float(os.getenv("MIACHAT_SESSION_IDLE_TIMEOUT", str(15 * 60)))
+
+# Demo bookings go to a SQLite outbox and are delivered in the background to
+# MIACHAT_BOOKING_SINK, "file:<path>" or an http(s) URL of the booking system.
+# Leave MIACHAT_BOOKING_OUTBOX_PATH empty to accept bookings without delivery.
+BOOKING_OUTBOX_PATH = os.getenv("MIACHAT_BOOKING_OUTBOX_PATH", "miachat_bookings.sqlite3")
+BOOKING_SINK = os.getenv("MIACHAT_BOOKING_SINK", "file:miachat_bookings.jsonl")
+BOOKING_BATCH_SIZE = int(os.getenv("MIACHAT_BOOKING_BATCH_SIZE", "50"))
+BOOKING_MAX_ATTEMPTS = int(os.getenv("MIACHAT_BOOKING_MAX_ATTEMPTS", "8"))
+
+# Knowledge retrieval: the system prompt carries only the KNOWLEDGE_TOP_K
+# snippets most relevant to the latest user message, drawn from
+# YELLOW_AI_CONFIG, YELLOW_AI_CAPABILITIES and the .md/.txt files under
+# MIACHAT_KNOWLEDGE_DIR. Set MIACHAT_KNOWLEDGE=0 to send the full static prompt.
+KNOWLEDGE_ENABLED = os.getenv("MIACHAT_KNOWLEDGE", "1") == "1"
+KNOWLEDGE_DIR = os.getenv("MIACHAT_KNOWLEDGE_DIR", "")
+KNOWLEDGE_TOP_K = int(os.getenv("MIACHAT_KNOWLEDGE_TOP_K", "3"))
+KNOWLEDGE_MAX_TOKENS = int(os.getenv("MIACHAT_KNOWLEDGE_MAX_TOKENS", "120"))
+
+# Demo booking, integration and feature questions recognized with at least
+# this confidence are answered from YELLOW_AI_CONFIG without a model call;
+# set MIACHAT_INTENT_ROUTER=0 to send every message to the model
+INTENT_ROUTER_ENABLED = os.getenv("MIACHAT_INTENT_ROUTER", "1") == "1"
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("MIACHAT_INTENT_CONFIDENCE_THRESHOLD", "0.75"))
+
+# Speculative prefetch (opt-in): after each reply the answers to the quick
+# replies on screen are generated in the background, within a global and a
+# per-session token budget per minute, so clicking one streams at once
+PREFETCH_ENABLED = os.getenv("MIACHAT_PREFETCH", "0") == "1"
+PREFETCH_MAX_INFLIGHT = int(os.getenv("MIACHAT_PREFETCH_MAX_INFLIGHT", "4"))
+PREFETCH_GLOBAL_TOKENS_PER_MINUTE = int(os.getenv("MIACHAT_PREFETCH_GLOBAL_TOKENS_PER_MINUTE", "20000"))
+PREFETCH_SESSION_TOKENS_PER_MINUTE = int(os.getenv("MIACHAT_PREFETCH_SESSION_TOKENS_PER_MINUTE", "6000"))
+
+# Number of trailing messages that key memoized quick replies
+QUICK_REPLY_TAIL_MESSAGES = 4
+
+# A demo is only booked once the user has given an email to confirm it to
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+
+# Reply to a demo request without an email; a reply with one books the demo
+DEMO_CONTACT_PROMPT = (
+    "I'd be happy to book a Yellow.ai demo for you! Please share your work email, "
+    "and your name and company if you like, and I'll send the request to our team."
+)
+
+# Quick replies shown when suggestions cannot be generated
+FALLBACK_QUICK_REPLIES = [
+    "Mia, tell me more about the features",
+    "Help me set up integrations",
+    "I'd like to schedule a demo"
+]
+
+# Quick replies for the most common opening messages, keyed by the
+# normalized first user message
+PRECOMPUTED_QUICK_REPLIES = {
+    normalize_prompt(message): replies for message, replies in {
+        "Hi Mia, tell me about Yellow.ai": [
+            "Mia, which channels can I deploy on?",
+            "I'd like to book a demo with you",
+            "Can you explain how Orch LLM works?"
+        ],
+        "I'd like to book a demo with you": [
+            "Mia, what will the demo cover?",
+            "Can you show me the integration options?",
+            "Help me understand the live agent handoff"
+        ],
+        "Can you show me the integration options?": [
+            "Mia, how do I connect Salesforce?",
+            "Do you integrate with Zendesk or Freshdesk?",
+            "I'd like to book a demo with you"
+        ],
+        "Mia, tell me more about the features": [
+            "Can you explain the AI-powered analytics?",
+            "Help me understand omnichannel support",
+            "I'd like to schedule a demo"
+        ],
+        "Help me set up integrations": [
+            "Mia, which CRMs do you support?",
+            "How do I connect my ticketing system?",
+            "I'd like to schedule a demo"
+        ],
+        "I'd like to schedule a demo": [
+            "Mia, what will the demo cover?",
+            "Tell me more about the features first",
+            "Help me set up integrations"
+        ]
+    }.items()
+}
+
+# System Prompt
+YELLOW_AI_PROMPT = """You are MiaChat, an AI assistant specifically trained for Yellow.ai platform support.
+
+Key Capabilities:
+1. Provide comprehensive information about Yellow.ai's products and services
+2. Guide users through Yellow.ai's features and capabilities:
+   - Conversational AI Bots
+   - Omnichannel Support
+   - Orch LLM (Proprietary orchestration engine)
+   - Customer Experience Automation
+   - Live Agent Handoff
+   - AI-Powered Analytics
+   - Enterprise System Integrations
+   - Generative AI Capabilities
+
+3. Assist with demo booking and platform inquiries
+4. Explain technical concepts in an accessible manner
+5. Provide integration guidance
+6. Share analytics and reporting capabilities
+
+Guidelines:
+- Maintain a professional and helpful tone
+- Provide accurate platform information
+- Guide users through demo booking process
+- Explain technical features clearly
+- Handle complex queries with detailed responses
+- Facilitate smooth handoffs when needed
+
+Remember: You are Mia, an expert in Yellow.ai's platform and should focus on helping users understand and utilize its capabilities effectively. Always introduce yourself as Mia and maintain a friendly, professional demeanor."""
+
+# Persona and guidelines sent with retrieved knowledge instead of the full
+# capability list in YELLOW_AI_PROMPT
+YELLOW_AI_BASE_PROMPT = """You are MiaChat, an AI assistant specifically trained for Yellow.ai platform support. You help users with Yellow.ai's products and services, demo booking, integrations, analytics and technical questions.
+
+Guidelines:
+- Maintain a professional and helpful tone
+- Provide accurate platform information
+- Guide users through demo booking process
+- Explain technical features clearly
+- Handle complex queries with detailed responses
+- Facilitate smooth handoffs when needed
+
+Remember: You are Mia, an expert in Yellow.ai's platform and should focus on helping users understand and utilize its capabilities effectively. Always introduce yourself as Mia and maintain a friendly, professional demeanor."""
+
+# Capabilities from YELLOW_AI_PROMPT as retrievable snippets
+YELLOW_AI_CAPABILITIES = [
+    "Conversational AI Bots: Yellow.ai builds and runs conversational AI chatbots and voice bots.",
+    "Omnichannel Support: one assistant serves customers across chat, messaging, voice and SMS channels.",
+    "Orch LLM: Yellow.ai's proprietary orchestration engine for large language models.",
+    "Customer Experience Automation: automate customer and employee experience journeys end to end.",
+    "Live Agent Handoff: conversations can be handed off smoothly to human agents.",
+    "AI-Powered Analytics: analytics and reporting capabilities for conversations and bot performance.",
+    "Enterprise System Integrations: integration guidance for CRM, ERP, ticketing and communication systems.",
+    "Generative AI Capabilities: generative AI for answering questions and automating conversations."
+]
+
+# Instruction sent with the transcript to generate quick replies
+QUICK_REPLY_PROMPT = """Based on the conversation above about Yellow.ai platform, generate 3 likely follow-up questions or actions from the user's perspective in first person (using I, my, me).
+        The assistant's name is Mia, so include personal addressing where appropriate.
+
+        Focus on Yellow.ai's key features:
+        - Conversational AI capabilities
+        - Omnichannel support
+        - Integration options
+        - Demo booking
+        - Platform features
+        
+        Generate 3 short, specific quick replies in first person that a user would naturally say. Examples:
+        - "Mia, can you tell me more about..."
+        - "I'd like your help with..."
+        - "Could you explain to me..."
+        - "Show me how to..."
+        - "Help me understand..."
+        
+        Make responses conversational and personal, addressing Mia directly where appropriate.
+        """
+
+
+# ----------------------------
+# Process-wide Resources
+# ----------------------------
+
+_resource_lock = threading.RLock()
+
+
+def process_resource(factory):
+    """
+    Build a resource once per process and argument tuple, like
+    st.cache_resource but usable from any thread and outside Streamlit
+    """
+    instances = {}
+
+    @wraps(factory)
+    def get(*args):
+        with _resource_lock:
+            if args not in instances:
+                instances[args] = factory(*args)
+            return instances[args]
+    return get
+
+
+@process_resource
+def get_provider(name):
+    """
+    Process-wide provider with one pooled client, shared by every session
+    """
+    settings = {"timeout": PROVIDER_TIMEOUT, "max_retries": PROVIDER_MAX_RETRIES, "rate_limiter": get_rate_limiter()}
+    if OFFLINE_MODE or name == "mock":
+        return MockProvider(
+            first_token_latency=float(os.getenv("MIACHAT_MOCK_FIRST_TOKEN_LATENCY", "0")),
+            token_latency=float(os.getenv("MIACHAT_MOCK_TOKEN_LATENCY", "0")),
+            error_rate=float(os.getenv("MIACHAT_MOCK_ERROR_RATE", "0")),
+            **settings
+        )
+    if name == "claude":
+        return ClaudeProvider(api_key=os.getenv(PROVIDER_API_KEYS["claude"]), **settings)
+    return OpenAIProvider(api_key=os.getenv(PROVIDER_API_KEYS["gpt"]), base_url=os.getenv("OPENAI_BASE_URL"), **settings)
+
+
+@process_resource
+def get_rate_limiter():
+    """
+    Process-wide RPM/TPM budgets, or None when rate limiting is off
+    """
+    if not RATE_LIMITS_ENABLED:
+        return None
+    return RateLimiter(MODEL_RATE_LIMITS, timeout=RATE_LIMIT_TIMEOUT, background_reserve=RATE_LIMIT_BACKGROUND_RESERVE)
+
+
+@process_resource
+def get_background_executor():
+    """
+    Process-wide thread pool for model calls kept off the critical path
+    """
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="miachat-bg")
+
+
+@process_resource
+def get_context_manager():
+    """
+    Process-wide context window manager enforcing MODEL_TOKEN_BUDGETS
+    """
+    return ContextManager(
+        budgets=MODEL_TOKEN_BUDGETS,
+        summarize=partial(summarize_conversation, provider=get_provider("gpt")),
+        executor=get_background_executor(),
+        summary_threshold=SUMMARY_REFRESH_THRESHOLD
+    )
+
+
+@process_resource
+def get_response_cache():
+    """
+    Process-wide response cache, or None when disabled
+    """
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    return ResponseCache(RESPONSE_CACHE_PATH, ttl=RESPONSE_CACHE_TTL)
+
+
+@process_resource
+def get_singleflight():
+    """
+    Process-wide registry of in-flight model calls, or None when disabled
+    """
+    if not SINGLEFLIGHT_ENABLED:
+        return None
+    return SingleFlight(timeout=SINGLEFLIGHT_TIMEOUT)
+
+
+@process_resource
+def get_metrics():
+    """
+    Process-wide metrics registry, also served on METRICS_PORT when set
+    """
+    registry = MetricsRegistry()
+    cache = get_response_cache()
+    if cache is not None:
+        registry.register_collector(lambda: [
+            ("miachat_response_cache_events_total", {"event": event}, count) for event, count in cache.stats.items()
+        ])
+    store = get_conversation_store()
+    if store is not None:
+        registry.register_collector(lambda: [
+            ("miachat_conversation_store_events_total", {"event": event}, count) for event, count in store.stats.items()
+        ])
+    outbox = get_booking_outbox()
+    if outbox is not None:
+        registry.register_collector(lambda: [
+            ("miachat_booking_outbox_events_total", {"event": event}, count) for event, count in outbox.stats.items()
+        ])
+    limiter = get_rate_limiter()
+    if limiter is not None:
+        registry.register_collector(lambda: [
+            ("miachat_rate_limiter_calls_total", {"outcome": outcome}, count) for outcome, count in limiter.stats.items()
+        ])
+    router = get_intent_router()
+    if router is not None:
+        registry.register_collector(lambda: [
+            ("miachat_intent_routing_total", {"outcome": outcome}, count) for outcome, count in router.stats.items()
+        ])
+    model_router = get_model_router()
+    registry.register_collector(lambda: [
+        ("miachat_model_routing_total", {"decision": decision}, count) for decision, count in model_router.stats.items()
+    ])
+    prefetcher = get_prefetcher()
+    if prefetcher is not None:
+        token_stats = ("used_tokens", "wasted_tokens")
+        registry.register_collector(lambda: [
+            ("miachat_prefetch_events_total", {"event": event}, count)
+            for event, count in prefetcher.stats.items() if event not in token_stats
+        ] + [
+            ("miachat_prefetch_tokens_total", {"kind": kind.split("_")[0]}, prefetcher.stats[kind]) for kind in token_stats
+        ])
+    hedger = get_hedger()
+    if hedger is not None:
+        registry.register_collector(lambda: [
+            ("miachat_hedge_events_total", {"event": event}, count) for event, count in hedger.stats.items()
+        ])
+        registry.register_collector(lambda: [
+            ("miachat_hedge_rate", {}, round(hedger.hedge_rate(), 4)),
+            ("miachat_hedge_p99_saved_seconds", {}, round(hedger.p99_saved(), 4))
+        ], kind="gauge")
+    flights = get_singleflight()
+    if flights is not None:
+        # Followers are the upstream calls that were collapsed into another
+        registry.register_collector(lambda: [
+            ("miachat_singleflight_calls_total", {"role": role}, count) for role, count in flights.stats.items()
+        ])
+    if METRICS_PORT:
+        start_metrics_server(registry, int(METRICS_PORT))
+    return registry
+
+
+@process_resource
+def get_conversation_store():
+    """
+    Process-wide conversation store, or None when chats are kept in memory
+    """
+    if not CONVERSATION_STORE_PATH:
+        return None
+    return ConversationStore(CONVERSATION_STORE_PATH, idle_timeout=SESSION_IDLE_TIMEOUT)
+
+
+@process_resource
+def get_booking_outbox():
+    """
+    Process-wide demo booking outbox and its delivery worker, or None when
+    bookings are not delivered
+    """
+    if not BOOKING_OUTBOX_PATH:
+        return None
+    return BookingOutbox(
+        BOOKING_OUTBOX_PATH, make_sink(BOOKING_SINK), batch_size=BOOKING_BATCH_SIZE, max_attempts=BOOKING_MAX_ATTEMPTS
+    )
+
+
+@process_resource
+def get_trace_sink():
+    """
+    Process-wide JSONL trace file, or None when tracing to disk is off
+    """
+    return TraceSink(TRACE_PATH) if TRACE_PATH else None
+
+
+@process_resource
+def get_knowledge_index():
+    """
+    Process-wide BM25 index of Yellow.ai knowledge, or None when knowledge
+    retrieval is off
+    """
+    if not KNOWLEDGE_ENABLED:
+        return None
+    snippets = config_snippets(YELLOW_AI_CONFIG) + YELLOW_AI_CAPABILITIES
+    if KNOWLEDGE_DIR:
+        snippets += load_doc_snippets(KNOWLEDGE_DIR)
+    return BM25Index(snippets)
+
+
+@process_resource
+def get_intent_router():
+    """
+    Process-wide intent router, or None when every message goes to the model
+    """
+    if not INTENT_ROUTER_ENABLED:
+        return None
+    return IntentRouter(YELLOW_AI_CONFIG, threshold=INTENT_CONFIDENCE_THRESHOLD)
+
+
+@process_resource
+def get_hedger():
+    """
+    Process-wide hedger of chat calls, or None when hedging is off
+    """
+    if not HEDGE_ENABLED:
+        return None
+    return Hedger(
+        percentile=HEDGE_PERCENTILE,
+        min_delay=HEDGE_MIN_DELAY,
+        max_delay=HEDGE_MAX_DELAY,
+        initial_delay=HEDGE_INITIAL_DELAY
+    )
+
+
+@process_resource
+def get_model_router():
+    """
+    Process-wide router behind the "auto" model option
+    """
+    return ModelRouter(
+        {provider: tuple(models[:2]) for provider, models in PROVIDER_MODELS.items()},
+        integrations=[name for names in YELLOW_AI_CONFIG["integrations"].values() for name in names],
+        threshold=AUTO_MODEL_THRESHOLD,
+        latency_slo=AUTO_MODEL_TTFT_SLO
+    )
+
+
+@process_resource
+def get_prefetcher():
+    """
+    Process-wide quick reply prefetcher, or None when prefetching is off
+    """
+    if not PREFETCH_ENABLED:
+        return None
+    return Prefetcher(
+        max_inflight=PREFETCH_MAX_INFLIGHT,
+        global_tokens_per_minute=PREFETCH_GLOBAL_TOKENS_PER_MINUTE,
+        session_tokens_per_minute=PREFETCH_SESSION_TOKENS_PER_MINUTE
+    )
+
+
+@process_resource
+def get_system_prompt_tokens():
+    """
+    Upper bound of the system prompt's tokens, reserved out of every chat
+    budget. Worked out from the prompt text alone, so the knowledge index
+    is not built before the first chat reply needs it.
+    """
+    if not KNOWLEDGE_ENABLED:
+        return count_tokens(YELLOW_AI_PROMPT)
+    return count_tokens(YELLOW_AI_BASE_PROMPT) + KNOWLEDGE_MAX_TOKENS
+
+
+# ----------------------------
+# Chat Functions
+# ----------------------------
+
+
+def resolve_model(api_provider, model, text, record=True):
+    """
+    The model to call for a message: `model` itself, or the model router's
+    pick when it is "auto"
+    """
+    if model != AUTO_MODEL:
+        return model
+    return get_model_router().choose(api_provider, text, record=record)[0]
+
+
+def record_model_latency(model, ttft):
+    """
+    Feed a model reply's time to first token to the "auto" model's latency
+    window. get_chat_response and aget_chat_response call this for the
+    replies the model itself produced.
+    """
+    get_model_router().observe(model, ttft)
+
+
+def answer_locally(conversation_history, session_id="", book=True):
+    """
+    Answer the latest user message with get_integration_info,
+    get_feature_info or handle_demo_booking (booked for `session_id`) when
+    the intent router is confident. Returns a dict with the intent, its confidence and the reply
+    text (plus the booking result for demo requests), or None when the
+    message should go to get_chat_response. A demo request is only booked
+    with an email in it; otherwise the reply asks for one, and the user's
+    answer to that books the demo. With book=False a demo request gets the
+    same reply but nothing is committed to the booking outbox.
+    """
+    router = get_intent_router()
+    if router is None or not conversation_history or conversation_history[-1]["role"] != "user":
+        return None
+    message = conversation_history[-1]["content"]
+    email = EMAIL_PATTERN.search(message)
+    if (email and len(conversation_history) >= 3 and conversation_history[-2]["role"] == "assistant"
+            and conversation_history[-2]["content"] == DEMO_CONTACT_PROMPT):
+        request = conversation_history[-3]["content"] if conversation_history[-3]["role"] == "user" else message
+        return {"intent": "demo_booking", "confidence": 1.0, **_book_demo(request, message, email.group(), session_id, book)}
+    match = router.route(message)
+    if match is None:
+        return None
+    
+    answer = {"intent": match.intent, "confidence": match.confidence}
+    if match.intent == "demo_booking":
+        if email is None:
+            answer["text"] = DEMO_CONTACT_PROMPT
+        else:
+            answer.update(_book_demo(message, message, email.group(), session_id, book))
+    elif match.intent == "integration":
+        categories = [match.slot] if match.slot else list(YELLOW_AI_CONFIG["integrations"])
+        lines = [f"- {integration_label(category)}: {', '.join(get_integration_info(category))}" for category in categories]
+        answer["text"] = "Yellow.ai integrates with these systems:\n" + "\n".join(lines) + "\n\nWould you like help connecting one of them, or a demo of how it works?"
+    else:
+        names = [match.slot] if match.slot else list(YELLOW_AI_CONFIG["features"])
+        lines = [f"- {feature['name']}: {feature['description']}" for feature in map(get_feature_info, names)]
+        answer["text"] = "Here's what Yellow.ai offers:\n" + "\n".join(lines) + "\n\nWould you like to see any of these in a demo?"
+    return answer
+
+
+def _book_demo(request, contact, email, session_id, book):
+    """
+    Book the demo asked for in `request` for the user who gave `email` in
+    `contact`, returning the booking result and the reply text
+    """
+    booking = handle_demo_booking({"message": request, "contact": contact, "email": email}, session_id=session_id, enqueue=book)
+    return {"booking": booking, "text": booking["message"] + "\n\n" + "\n".join(f"- {step}" for step in booking["next_steps"])}
+
+
+def build_system_prompt(conversation_history):
+    """
+    The system prompt for a chat reply: YELLOW_AI_PROMPT, or with knowledge
+    retrieval the base prompt plus the snippets most relevant to the latest
+    user message, capped at KNOWLEDGE_MAX_TOKENS
+    """
+    index = get_knowledge_index()
+    if index is None:
+        return YELLOW_AI_PROMPT
+    
+    query = next((message["content"] for message in reversed(conversation_history) if message["role"] == "user"), "")
+    facts = []
+    budget = KNOWLEDGE_MAX_TOKENS
+    for _, snippet in index.search(query, k=KNOWLEDGE_TOP_K):
+        cost = count_tokens(snippet) + 2
+        if cost > budget:
+            break
+        facts.append(f"- {snippet}")
+        budget -= cost
+    if not facts:
+        return YELLOW_AI_BASE_PROMPT
+    return YELLOW_AI_BASE_PROMPT + "\n\nRelevant Yellow.ai facts:\n" + "\n".join(facts)
+
+
+def _chat_request(conversation_history, api_provider, model):
+    """
+    The messages sent for a chat reply, its response cache key (None when
+    caching is off) and its single-flight key. The cache key names the
+    provider that answers, so mock replies in offline mode never stand in
+    for the real provider's.
+    """
+    messages = [{"role": "system", "content": build_system_prompt(conversation_history)}, *conversation_history]
+    cache_key = None
+    if get_response_cache() is not None and conversation_history:
+        cache_key = make_cache_key(get_provider(api_provider).name, model, conversation_history[-1]["content"], messages[:-1])
+    return messages, cache_key, request_key("chat", api_provider, model, messages, 0.7, 150)
+
+
+def _hedge_target(api_provider, model):
+    """
+    The (provider, model) a late or failed chat call is also sent to
+    """
+    models = PROVIDER_MODELS[api_provider]
+    if HEDGE_TARGET == "provider":
+        tier = models.index(model) if model in models else 0
+        for name, other_models in PROVIDER_MODELS.items():
+            if name != api_provider and (OFFLINE_MODE or os.getenv(PROVIDER_API_KEYS[name])):
+                return name, other_models[min(tier, len(other_models) - 1)]
+    elif HEDGE_TARGET == "model":
+        for other_model in models:
+            if other_model != model:
+                return api_provider, other_model
+    return api_provider, model
+
+
+def _open_chat_stream(messages, api_provider, model, winner, asynchronous=False):
+    """
+    A callable opening the chat call's delta stream, open_stream(on_usage=...),
+    hedged when hedging is on. The (provider, model) whose reply is
+    streamed is appended to the `winner` list, and on_usage only gets that
+    call's usage.
+    """
+    hedger = get_hedger()
+    targets = [(api_provider, model)]
+    if hedger is not None:
+        targets.append(_hedge_target(api_provider, model))
+    attempts = []
+    for name, target_model in targets:
+        provider = get_provider(name)
+        stream = provider.astream if asynchronous else provider.stream
+        attempts.append(((name, target_model), partial(stream, messages, target_model, temperature=0.7, max_tokens=150)))
+    if hedger is None:
+        winner.append(targets[0])
+        open_stream = attempts[0][1]
+    else:
+        open_stream = partial(hedger.astream if asynchronous else hedger.stream, attempts, on_winner=winner.append)
+    observe = _aobserve_first_token if asynchronous else _observe_first_token
+    return partial(observe, open_stream, targets[0], winner)
+
+
+def _observe_first_token(open_stream, primary, winner, on_usage=None):
+    """
+    Open the stream, recording its time to first token for the primary
+    (provider, model) when the primary itself produced that token. Only the
+    caller that opens the call gets here: cache hits and single-flight
+    followers are never timed, nor is a race won by the hedge target.
+    """
+    start = time.perf_counter()
+    stream = open_stream(on_usage=on_usage)
+    try:
+        for delta in stream:
+            if start is not None:
+                if winner == [primary]:
+                    record_model_latency(primary[1], time.perf_counter() - start)
+                start = None
+            yield delta
+    finally:
+        if hasattr(stream, "close"):
+            stream.close()
+
+
+async def _aobserve_first_token(open_stream, primary, winner, on_usage=None):
+    """
+    Async counterpart of _observe_first_token
+    """
+    start = time.perf_counter()
+    stream = open_stream(on_usage=on_usage)
+    try:
+        async for delta in stream:
+            if start is not None:
+                if winner == [primary]:
+                    record_model_latency(primary[1], time.perf_counter() - start)
+                start = None
+            yield delta
+    finally:
+        if hasattr(stream, "aclose"):
+            await stream.aclose()
+
+def get_chat_response(conversation_history, api_provider, model, on_usage=None):
+    """
+    Stream response from OpenAI API or Claude API with Yellow.ai context,
+    yielding text deltas as they arrive. The history is an OpenAI-format
+    message list ending with the current user message. Completed replies
+    are cached and served back verbatim for identical requests, and
+    identical requests already in flight share the same stream. When the
+    first token is late, or the call fails before it, the request is also
+    sent to the hedge target (see HEDGE_TARGET) and the first to answer is
+    streamed; an error only ends the reply once both calls failed. A reply
+    from the hedge target is not cached, as the key names the primary.
+    """
+    messages, cache_key, flight_key = _chat_request(conversation_history, api_provider, model)
+    response_cache = get_response_cache()
+    
+    if cache_key is not None:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+    
+    singleflight = get_singleflight()
+    winner = []
+    open_stream = _open_chat_stream(messages, api_provider, model, winner)
+    if singleflight is not None:
+        deltas = singleflight.stream(flight_key, open_stream, on_usage=on_usage)
+    else:
+        deltas = open_stream(on_usage=on_usage)
+    
+    chunks = []
+    try:
+        for delta in deltas:
+            chunks.append(delta)
+            yield delta
+    except Exception as e:
+        get_metrics().inc("miachat_errors_total", stage="chat_response", provider=api_provider)
+        yield f"Error: {str(e)}"
+        return
+    finally:
+        # A reader that stops early (a rerun closing this generator) lets
+        # the shared call be cancelled once no one else reads it
+        deltas.close()
+    
+    # Only the primary's reply is cached; a single-flight follower, which
+    # never sees the race, leaves caching to the caller that opened it
+    if cache_key is not None and chunks and winner == [(api_provider, model)]:
+        response_cache.set(cache_key, "".join(chunks))
+
+
+async def aget_chat_response(conversation_history, api_provider, model, on_usage=None, raise_errors=False):
+    """
+    Async counterpart of get_chat_response for the API server and batch
+    evaluation, using the provider's async client. Errors end the reply
+    with an "Error: ..." chunk, or are raised with raise_errors=True.
+    """
+    messages, cache_key, flight_key = _chat_request(conversation_history, api_provider, model)
+    response_cache = get_response_cache()
+    
+    if cache_key is not None:
+        cached = await response_cache.aget(cache_key)
+        if cached is not None:
+            yield cached
+            return
+    
+    singleflight = get_singleflight()
+    winner = []
+    open_stream = _open_chat_stream(messages, api_provider, model, winner, asynchronous=True)
+    if singleflight is not None:
+        deltas = singleflight.astream(flight_key, open_stream, on_usage=on_usage)
+    else:
+        deltas = open_stream(on_usage=on_usage)
+    
+    chunks = []
+    try:
+        async for delta in deltas:
+            chunks.append(delta)
+            yield delta
+    except Exception as e:
+        get_metrics().inc("miachat_errors_total", stage="chat_response", provider=api_provider)
+        if raise_errors:
+            raise
+        yield f"Error: {str(e)}"
+        return
+    finally:
+        await deltas.aclose()
+    
+    if cache_key is not None and chunks and winner == [(api_provider, model)]:
+        await response_cache.aset(cache_key, "".join(chunks))
+
+
+def _prefetch_key(conversation_id, user_index, message, api_provider, model):
+    return request_key("prefetch", conversation_id, user_index, message.strip(), api_provider, model)
+
+
+def prefetch_chat_responses(session_id, conversation, replies, api_provider, model):
+    """
+    Start generating the answers to the quick replies on screen in the
+    background, cancelling the session's prefetches for earlier ones.
+    Suggestions the intent router answers locally are skipped. With the
+    "auto" model each suggestion goes to the model it would be routed to,
+    keyed by "auto" as the click will be. Returns the number of prefetches
+    started; 0 when prefetching is off.
+    """
+    prefetcher = get_prefetcher()
+    if prefetcher is None:
+        return 0
+    router = get_intent_router()
+    provider = get_provider(api_provider)
+    requests = []
+    for reply in replies:
+        if router is not None and router.classify(reply).confidence >= router.threshold:
+            continue
+        # The window the click will send: this conversation plus the reply
+        fork = conversation.fork()
+        fork.append("user", reply)
+        reply_model = resolve_model(api_provider, model, reply, record=False)
+        history = get_context_manager().window(fork, reply_model, reserved_tokens=get_system_prompt_tokens(), refresh_summary=False)
+        messages = _chat_request(history, api_provider, reply_model)[0]
+        open_stream = partial(
+            provider.stream, messages, reply_model, temperature=0.7, max_tokens=150, priority=PRIORITY_BACKGROUND
+        )
+        requests.append((
+            _prefetch_key(conversation.id, len(conversation), reply, api_provider, model),
+            estimate_tokens(messages, 150),
+            lambda on_usage, open_stream=open_stream: open_stream(on_usage=on_usage)
+        ))
+    return prefetcher.prefetch(session_id, requests)
+
+
+def take_prefetched_response(session_id, conversation, api_provider, model):
+    """
+    Stream the prefetched answer to the conversation's last message, a
+    clicked quick reply, or return None to fall back to get_chat_response
+    """
+    prefetcher = get_prefetcher()
+    if prefetcher is None or not conversation.messages or conversation.messages[-1]["role"] != "user":
+        return None
+    user_index = len(conversation) - 1
+    deltas = prefetcher.take(
+        session_id, _prefetch_key(conversation.id, user_index, conversation.messages[-1]["content"], api_provider, model)
+    )
+    if deltas is None:
+        return None
+    return _prefetched_deltas(deltas, api_provider)
+
+
+def _prefetched_deltas(deltas, api_provider):
+    try:
+        yield from deltas
+    except Exception as e:
+        get_metrics().inc("miachat_errors_total", stage="chat_response", provider=api_provider)
+        yield f"Error: {str(e)}"
+
+
+def _quick_reply_request(conversation_context):
+    """
+    Resolve quick replies that need no model call, returning (replies,
+    messages, cache_key). Replies are None when the model must be asked
+    with the returned messages.
+    """
+    if not conversation_context:
+        # Initial quick replies for new chat in first person
+        return [
+            "Hi Mia, tell me about Yellow.ai",
+            "I'd like to book a demo with you",
+            "Can you show me the integration options?"
+        ], None, None
+    
+    # Common opening messages are answered from the precomputed table
+    if len(conversation_context) == 1 and conversation_context[0]["role"] == "user":
+        precomputed = PRECOMPUTED_QUICK_REPLIES.get(normalize_prompt(conversation_context[0]["content"]))
+        if precomputed:
+            return list(precomputed), None, None
+    
+    # Suggestions for a transcript tail that was seen before are reused
+    cache_key = None
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        tail = conversation_context[-QUICK_REPLY_TAIL_MESSAGES:]
+        cache_key = make_cache_key(f"quick_replies:{get_provider('gpt').name}", "gpt-3.5-turbo", tail[-1]["content"], tail[:-1])
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return json.loads(cached), None, None
+    
+    messages = [
+        {"role": "system", "content": "You are an AI that generates first-person quick reply suggestions from the user's perspective, addressing the AI assistant named Mia."},
+        *conversation_context,
+        {"role": "user", "content": QUICK_REPLY_PROMPT}
+    ]
+    return None, messages, cache_key
+
+
+def _parse_quick_replies(response, cache_key):
+    """
+    Split the model's reply into at most three suggestions and memoize them
+    """
+    suggestions = response.strip().split("\n")
+    quick_replies = [s.strip().strip('123.-*') for s in suggestions if s.strip()][:3]
+    if cache_key is not None and quick_replies:
+        get_response_cache().set(cache_key, json.dumps(quick_replies))
+    return quick_replies
+
+
+def generate_quick_replies(conversation_context, on_usage=None):
+    """
+    Generate contextual quick replies based on Yellow.ai platform features in first person.
+    The context is an OpenAI-format message list of the conversation so far.
+    """
+    quick_replies, messages, cache_key = _quick_reply_request(conversation_context)
+    if quick_replies is not None:
+        return quick_replies
+    
+    try:
+        complete = partial(
+            get_provider("gpt").complete, messages,
+            model="gpt-3.5-turbo", temperature=0.7, max_tokens=100, priority=PRIORITY_BACKGROUND
+        )
+        singleflight = get_singleflight()
+        if singleflight is not None:
+            response = singleflight.do(
+                request_key("quick_replies", "gpt", "gpt-3.5-turbo", messages, 0.7, 100), complete, on_usage=on_usage
+            )
+        else:
+            response = complete(on_usage=on_usage)
+        return _parse_quick_replies(response, cache_key)
+        
+    except RateLimitExceeded:
+        # Shed so chat replies keep the remaining budget
+        return list(FALLBACK_QUICK_REPLIES)
+    except Exception as e:
+        get_metrics().inc("miachat_errors_total", stage="quick_replies", provider="gpt")
+        return list(FALLBACK_QUICK_REPLIES)
+
+
+async def agenerate_quick_replies(conversation_context, on_usage=None):
+    """
+    Async counterpart of generate_quick_replies for the API server. The
+    response cache is read and written on worker threads, off the loop.
+    """
+    quick_replies, messages, cache_key = await asyncio.to_thread(_quick_reply_request, conversation_context)
+    if quick_replies is not None:
+        return quick_replies
+    
+    try:
+        complete = partial(
+            get_provider("gpt").acomplete, messages,
+            model="gpt-3.5-turbo", temperature=0.7, max_tokens=100, priority=PRIORITY_BACKGROUND
+        )
+        singleflight = get_singleflight()
+        if singleflight is not None:
+            response = await singleflight.ado(
+                request_key("quick_replies", "gpt", "gpt-3.5-turbo", messages, 0.7, 100), complete, on_usage=on_usage
+            )
+        else:
+            response = await complete(on_usage=on_usage)
+        return await asyncio.to_thread(_parse_quick_replies, response, cache_key)
+        
+    except RateLimitExceeded:
+        return list(FALLBACK_QUICK_REPLIES)
+    except Exception as e:
+        get_metrics().inc("miachat_errors_total", stage="quick_replies", provider="gpt")
+        return list(FALLBACK_QUICK_REPLIES)
+
+
+def summarize_conversation(previous_summary, messages, provider):
+    """
+    Fold older turns into the running summary of a conversation
+    """
+    summary_context = []
+    if previous_summary:
+        summary_context.append({"role": "system", "content": f"Summary so far: {previous_summary}"})
+    
+    response = provider.complete(
+        [
+            {"role": "system", "content": "You summarize conversations between a user and Mia, the Yellow.ai assistant. Keep the facts, requests and decisions the assistant will need later."},
+            *summary_context,
+            *messages,
+            {"role": "user", "content": "Update the summary so far with the conversation above in a short paragraph."}
+        ],
+        model="gpt-3.5-turbo",
+        temperature=0.3,
+        max_tokens=200,
+        priority=PRIORITY_BACKGROUND
+    )
+    return response.strip()
+
+
+def handle_demo_booking(user_info, session_id="", idempotency_key=None, enqueue=True):
+    """
+    Handle Yellow.ai platform demo booking requests. The booking is committed
+    to the outbox and confirmed straight away; delivery to the booking system
+    happens in the background; see get_booking_status. enqueue=False only
+    builds the confirmation, for dry runs. An email confirmation is only
+    promised when user_info has an email.
+    """
+    try:
+        next_steps = ["Our team will contact you shortly to schedule the demo"]
+        if user_info.get("email"):
+            next_steps.append(f"You'll receive an email confirmation at {user_info['email']}")
+        next_steps.append("Feel free to ask any questions about Yellow.ai while you wait")
+        result = {
+            "status": "success",
+            "message": "Thank you for your interest in Yellow.ai! Your demo request has been received.",
+            "next_steps": next_steps
+        }
+        outbox = get_booking_outbox() if enqueue else None
+        if outbox is not None:
+            result["booking_id"] = outbox.enqueue(session_id, user_info, idempotency_key)
+            result["delivery_status"] = outbox.status([result["booking_id"]])[result["booking_id"]]["status"]
+        return result
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"Error booking demo: {str(e)}",
+            "next_steps": [
+                "Please try again later",
+                "Contact our support team for assistance"
+            ]
+        }
+
+
+def get_booking_status(booking_ids):
+    """
+    Delivery state of demo bookings by booking id: {"status", "attempts",
+    "last_error"}, where status is pending, delivered or failed
+    """
+    outbox = get_booking_outbox()
+    if outbox is None:
+        return {}
+    return outbox.status(booking_ids)
+
+
+def get_integration_info(integration_type):
+    """
+    Provide information about Yellow.ai's integration capabilities
+    """
+    return YELLOW_AI_CONFIG["integrations"].get(integration_type, [])
+
+
+def get_feature_info(feature_name):
+    """
+    Get detailed information about Yellow.ai platform features
+    """
+    return YELLOW_AI_CONFIG["features"].get(feature_name, {
+        "name": "Feature not found",
+        "description": "Information not available"
+    })
@@ -0,0 +1,138 @@
+"""
+Token-budgeted context window with a rolling summary of older turns
+"""
+
+import threading
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+# Every chat message carries a few tokens of role/formatting overhead
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+
+
+def count_tokens(text):
+    """
+    Count tokens with tiktoken when it is installed, otherwise estimate
+    roughly four characters per token
+    """
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def count_message_tokens(message):
+    """
+    Count the tokens a single OpenAI-format message adds to a prompt
+    """
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ContextManager:
+    """
+    Fit a conversation into a per-model token budget. The most recent turns
+    are sent verbatim and older turns are folded into a running summary that
+    is refreshed in the background once enough of them have piled up. The
+    summary is shared by every window of a conversation, so it only covers
+    turns that fell out of all of them: a refresh never moves it past the
+    start of any window built for the latest message. Windows of earlier
+    messages no longer count, so a model that is not used again cannot hold
+    the summary back.
+    """
+
+    def __init__(self, budgets, summarize, executor, default_budget=3000, summary_threshold=500):
+        self.budgets = budgets
+        self.summarize = summarize
+        self.executor = executor
+        self.default_budget = default_budget
+        self.summary_threshold = summary_threshold
+        self._lock = threading.Lock()
+
+    def token_counts(self, conversation):
+        """
+        Return the per-message token counts, counting only messages added
+        since the last call
+        """
+        counts = conversation.token_counts
+        for message in conversation.messages[len(counts):]:
+            counts.append(count_message_tokens(message))
+        return counts
+
+    def window(self, conversation, model, reserved_tokens=0, refresh_summary=True):
+        """
+        Build the message list to send for a conversation: the running
+        summary (if any) followed by as many recent messages as the model's
+        budget allows. The latest message is always included. Windows that
+        should not move the summary, like quick replies or transcripts that
+        are not kept, pass refresh_summary=False to be trimmed without
+        scheduling one.
+        """
+        counts = self.token_counts(conversation)
+        with self._lock:
+            summary, summary_upto, summary_tokens = (
+                conversation.summary, conversation.summary_upto, conversation.summary_tokens
+            )
+        budget = self.budgets.get(model, self.default_budget) - reserved_tokens - summary_tokens
+
+        start = len(counts)
+        used = 0
+        while start > summary_upto:
+            cost = counts[start - 1]
+            if used + cost > budget and start < len(counts):
+                break
+            used += cost
+            start -= 1
+
+        if refresh_summary:
+            length = len(counts)
+            with self._lock:
+                window_starts = {
+                    key: (upto, window_start)
+                    for key, (upto, window_start) in conversation.window_starts.items() if upto == length
+                }
+                window_starts[(model, reserved_tokens)] = (length, start)
+                conversation.window_starts = window_starts
+                summary_end = min(window_start for _, window_start in window_starts.values())
+            self._maybe_refresh_summary(conversation, summary, summary_upto, summary_end)
+
+        messages = conversation.messages[start:]
+        if summary:
+            return [{"role": "system", "content": f"Summary of the earlier conversation: {summary}"}, *messages]
+        return messages
+
+    def _maybe_refresh_summary(self, conversation, previous_summary, upto, window_start):
+        """
+        Schedule a background summary refresh when the turns that fell out of
+        every window since the last refresh cross the threshold
+        """
+        if sum(conversation.token_counts[upto:window_start]) < self.summary_threshold:
+            return
+        with self._lock:
+            if conversation.summary_pending:
+                return
+            conversation.summary_pending = True
+
+        older_messages = conversation.messages[upto:window_start]
+
+        def refresh():
+            try:
+                summary = self.summarize(previous_summary, older_messages)
+                summary_tokens = count_tokens(summary) + MESSAGE_OVERHEAD_TOKENS
+                with self._lock:
+                    conversation.summary = summary
+                    conversation.summary_upto = window_start
+                    conversation.summary_tokens = summary_tokens
+            except Exception:
+                # Keep the previous summary; the next turn will try again
+                pass
+            finally:
+                conversation.summary_pending = False
+
+        self.executor.submit(refresh)
@@ -0,0 +1,63 @@
+"""
+Structured chat transcript shared by the chat helpers and the UI
+"""
+
+import uuid
+
+
+class Conversation:
+    """
+    Chat transcript kept as an OpenAI-format message list so it can be sent
+    to the model as-is and updated with one append per turn
+    """
+
+    def __init__(self, messages=None, conversation_id=None):
+        self.messages = list(messages) if messages else []
+        # Stable identity and a content version bumped on every change
+        self.id = conversation_id or uuid.uuid4().hex
+        self.version = len(self.messages)
+        # Per-message token counts, filled in lazily by the context manager
+        self.token_counts = []
+        # Running summary of the turns before summary_upto
+        self.summary = ""
+        self.summary_upto = 0
+        self.summary_tokens = 0
+        self.summary_pending = False
+        # Transcript length and start of the summary-refreshing windows of
+        # each (model, reserved tokens) for the latest message; the summary
+        # never moves past the earliest
+        self.window_starts = {}
+        # Quick replies last shown for this transcript
+        self.quick_replies = None
+        # Per-message chat bubble HTML, filled in lazily by the UI
+        self.rendered_html = []
+        # Messages already queued to the conversation store, and whether the
+        # messages are in memory or were unloaded while the chat sat idle
+        self.saved_upto = 0
+        self.resident = True
+
+    def append(self, role, content):
+        """
+        Add a message to the end of the transcript
+        """
+        self.messages.append({"role": role, "content": content})
+        self.version += 1
+
+    def fork(self):
+        """
+        Copy of the transcript with its summary, to window a possible next
+        turn without changing this conversation
+        """
+        fork = Conversation(self.messages, conversation_id=self.id)
+        fork.version = self.version
+        fork.token_counts = list(self.token_counts)
+        fork.summary = self.summary
+        fork.summary_upto = self.summary_upto
+        fork.summary_tokens = self.summary_tokens
+        return fork
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __iter__(self):
+        return iter(self.messages)
@@ -0,0 +1,432 @@
+"""
+Durable chat history in SQLite, written behind the UI by a background queue,
+with idle conversations unloaded from memory and reloaded on demand. The
+same database holds a versioned record per session, so any worker process
+can pick up a session where another left it, and a full-text index of every
+saved message.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+
+from context_window import MESSAGE_OVERHEAD_TOKENS, count_tokens
+from conversation import Conversation
+from history_search import MATCH_END, MATCH_START, SNIPPET_WORDS, fts_query
+
+logger = logging.getLogger("miachat.store")
+
+
+class ConversationStore:
+    """
+    Saved chats and demo requests per session. Writes are queued and applied
+    in batches by one writer thread, so callers never wait on disk; reads
+    flush the queue first so they see every write accepted so far. A batch
+    that fails is retried `write_retries` times with backoff; if it still
+    fails it is dropped, and the messages in it are queued again by the
+    next save_conversation() of their conversation.
+
+    Conversations passed to touch() are tracked, and once one has not been
+    touched for `idle_timeout` seconds its messages are dropped from memory.
+    The next touch() reloads them.
+
+    Each session also has a record of its open conversation with a version
+    number. A process commits a change only if the version is still the one
+    it loaded and none of its messages collided with another process's
+    (optimistic concurrency); otherwise another process got there first and
+    its state should be reloaded. Commits go through the write queue too.
+
+    Messages are added to an FTS5 index by a trigger as they are written,
+    so search() never rebuilds anything; unlike the other reads it does not
+    flush the queue.
+    """
+
+    def __init__(self, path, idle_timeout=15 * 60, sweep_interval=60, batch_size=256, write_retries=3, retry_delay=0.1):
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self.batch_size = batch_size
+        self.write_retries = write_retries
+        self.retry_delay = retry_delay
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._resident = weakref.WeakValueDictionary()
+        self._last_used = {}
+        # Conversations with a message another process appended first; only
+        # used by the writer thread
+        self._collided = set()
+        # First message of each conversation dropped with a failed batch
+        self._unsaved = {}
+        self.stats = {
+            "writes": 0, "batches": 0, "write_errors": 0, "evictions": 0, "rehydrations": 0,
+            "session_commits": 0, "session_conflicts": 0
+        }
+
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "id TEXT PRIMARY KEY, session_id TEXT NOT NULL, title TEXT NOT NULL, version INTEGER NOT NULL, "
+            "quick_replies TEXT, summary TEXT NOT NULL DEFAULT '', summary_upto INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS conversations_session ON conversations (session_id, created_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "conversation_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, "
+            "created_at REAL NOT NULL, PRIMARY KEY (conversation_id, seq))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS demo_requests ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, payload TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, conversation_id TEXT NOT NULL, title TEXT NOT NULL, "
+            "version INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+        indexed = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, content='messages', content_rowid='rowid')")
+        conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN "
+            "INSERT INTO messages_fts (rowid, content) VALUES (new.rowid, new.content); END"
+        )
+        if not indexed:
+            # Index the messages of a database created before the index was
+            conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+        threading.Thread(target=self._write_loop, name="miachat-store-writer", daemon=True).start()
+        threading.Thread(target=self._sweep_loop, name="miachat-store-sweeper", daemon=True).start()
+        atexit.register(self.flush)
+
+    def _connect(self):
+        """
+        Return this thread's SQLite connection, opening it on first use
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # Writes
+
+    def save_conversation(self, session_id, conversation, title):
+        """
+        Queue the conversation's new messages, one append each, and its
+        metadata. Call from the thread that appends to the conversation.
+        """
+        now = time.time()
+        with self._lock:
+            start = min(conversation.saved_upto, self._unsaved.pop(conversation.id, conversation.saved_upto))
+        for seq in range(start, len(conversation.messages)):
+            message = conversation.messages[seq]
+            self._queue.put((self._append_message, (conversation.id, seq, message["role"], message["content"], now), None))
+        conversation.saved_upto = len(conversation.messages)
+        self._queue.put((
+            "INSERT INTO conversations "
+            "(id, session_id, title, version, quick_replies, summary, summary_upto, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET title = excluded.title, version = excluded.version, "
+            "quick_replies = excluded.quick_replies, summary = excluded.summary, "
+            "summary_upto = excluded.summary_upto, updated_at = excluded.updated_at",
+            (
+                conversation.id, session_id, title, conversation.version,
+                json.dumps(conversation.quick_replies) if conversation.quick_replies is not None else None,
+                conversation.summary, conversation.summary_upto, now, now
+            ),
+            None
+        ))
+
+    def add_demo_request(self, session_id, request):
+        """
+        Queue a demo request for the session
+        """
+        self._queue.put((
+            "INSERT INTO demo_requests (session_id, payload, created_at) VALUES (?, ?, ?)",
+            (session_id, json.dumps(request, ensure_ascii=False), time.time()),
+            None
+        ))
+
+    def flush(self):
+        """
+        Wait until every queued write has been applied
+        """
+        self._queue.join()
+
+    def _append_message(self, conn, conversation_id, seq, role, content, created_at):
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO messages (conversation_id, seq, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+            (conversation_id, seq, role, content, created_at)
+        )
+        if cursor.rowcount == 0:
+            existing = conn.execute(
+                "SELECT role, content FROM messages WHERE conversation_id = ? AND seq = ?", (conversation_id, seq)
+            ).fetchone()
+            # The same message again is a retry; another one means another
+            # process appended its own message at this position
+            if existing != (role, content):
+                self._collided.add(conversation_id)
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            results = []
+            try:
+                results = self._write_batch(conn, batch)
+            except Exception:
+                logger.exception("Dropped a batch of %d conversation store writes", len(batch))
+                self._requeue_messages(batch)
+                with self._lock:
+                    self.stats["write_errors"] += len(batch)
+            finally:
+                for idx, (_, _, future) in enumerate(batch):
+                    if future is not None and not future.done():
+                        future.set_result(results[idx] if idx < len(results) else None)
+                    self._queue.task_done()
+
+    def _write_batch(self, conn, batch):
+        """
+        Apply a batch in one transaction, retrying it with backoff. Writes
+        are SQL statements or methods run in the transaction; a write with
+        a future gets its result once it is committed.
+        """
+        for attempt in range(self.write_retries + 1):
+            collided = set(self._collided)
+            try:
+                conn.execute("BEGIN")
+                results = [
+                    statement(conn, *params) if callable(statement) else conn.execute(statement, params)
+                    for statement, params, _ in batch
+                ]
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                # Collisions seen or cleared by the rolled back writes are redone
+                self._collided = collided
+                if attempt == self.write_retries:
+                    raise
+                time.sleep(self.retry_delay * 2 ** attempt)
+                continue
+            with self._lock:
+                self.stats["writes"] += len(batch)
+                self.stats["batches"] += 1
+            return results
+
+    def _requeue_messages(self, batch):
+        """
+        Roll back the saved position of each conversation with a message in
+        a dropped batch, so its next save queues them again
+        """
+        with self._lock:
+            for statement, params, _ in batch:
+                if statement == self._append_message:
+                    conversation_id, seq = params[0], params[1]
+                    self._unsaved[conversation_id] = min(seq, self._unsaved.get(conversation_id, seq))
+
+    # Reads
+
+    def load_history(self, session_id):
+        """
+        Saved chats of a session in the order they were started, keyed by
+        conversation id, without their messages
+        """
+        self.flush()
+        rows = self._connect().execute(
+            "SELECT id, title, version FROM conversations WHERE session_id = ? ORDER BY created_at, rowid",
+            (session_id,)
+        ).fetchall()
+        return {conversation_id: {"timestamp": title, "version": version} for conversation_id, title, version in rows}
+
+    def load_conversation(self, conversation_id):
+        """
+        Rebuild a saved conversation, or return None if it is unknown
+        """
+        self.flush()
+        row = self._connect().execute(
+            "SELECT version, quick_replies, summary, summary_upto FROM conversations WHERE id = ?",
+            (conversation_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        version, quick_replies, summary, summary_upto = row
+        conversation = Conversation(self._load_messages(conversation_id), conversation_id=conversation_id)
+        conversation.version = version
+        conversation.saved_upto = len(conversation.messages)
+        conversation.quick_replies = json.loads(quick_replies) if quick_replies is not None else None
+        if summary:
+            conversation.summary = summary
+            conversation.summary_upto = min(summary_upto, len(conversation.messages))
+            conversation.summary_tokens = count_tokens(summary) + MESSAGE_OVERHEAD_TOKENS
+        return conversation
+
+    def load_demo_requests(self, session_id):
+        self.flush()
+        rows = self._connect().execute(
+            "SELECT payload FROM demo_requests WHERE session_id = ? ORDER BY id",
+            (session_id,)
+        ).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def search(self, session_id, query, limit=10):
+        """
+        Saved chats of a session with a message matching every word of the
+        query (the last as a prefix), best first, as {"conversation_id",
+        "score", "snippet"} hits for their best matching message. Runs on
+        every keystroke, so it searches what is already written rather than
+        waiting for the queue; the last turn can be missing for a moment.
+        """
+        match = fts_query(query)
+        if match is None:
+            return []
+        # Pick each conversation's best message first; snippet() is only
+        # allowed in a plain full-text query, run for those messages alone
+        rows = self._connect().execute(
+            "WITH best AS (SELECT message_id, conversation_id, rank FROM ("
+            "SELECT messages_fts.rowid AS message_id, m.conversation_id, messages_fts.rank AS rank, "
+            "ROW_NUMBER() OVER (PARTITION BY m.conversation_id ORDER BY messages_fts.rank) AS position "
+            "FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid "
+            "JOIN conversations c ON c.id = m.conversation_id "
+            "WHERE messages_fts MATCH ? AND c.session_id = ?"
+            ") WHERE position = 1 ORDER BY rank LIMIT ?) "
+            "SELECT best.conversation_id, best.rank, snippet(messages_fts, 0, ?, ?, '…', ?) "
+            "FROM messages_fts JOIN best ON best.message_id = messages_fts.rowid "
+            "WHERE messages_fts MATCH ? ORDER BY best.rank",
+            (match, session_id, limit, MATCH_START, MATCH_END, SNIPPET_WORDS, match)
+        ).fetchall()
+        # FTS5 ranks by negated BM25, lower is better
+        return [
+            {"conversation_id": conversation_id, "score": round(-rank, 4), "snippet": snippet}
+            for conversation_id, rank, snippet in rows
+        ]
+
+    def _load_messages(self, conversation_id):
+        rows = self._connect().execute(
+            "SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY seq",
+            (conversation_id,)
+        ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    # Shared session state
+
+    def session_version(self, session_id):
+        """
+        The session's committed version, 0 if it has never been committed.
+        One indexed read, cheap enough to check on every script run.
+        """
+        row = self._connect().execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def load_session(self, session_id):
+        """
+        The session's open conversation id, its title and the version, or
+        None for a session that has never been committed
+        """
+        row = self._connect().execute(
+            "SELECT conversation_id, title, version FROM sessions WHERE session_id = ?",
+            (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        conversation_id, title, version = row
+        return {"conversation_id": conversation_id, "title": title, "version": version}
+
+    def commit_session(self, session_id, conversation_id, title, expected_version):
+        """
+        Queue a commit of the session's open conversation, applied after the
+        writes queued before it, so a process that sees the new version also
+        sees the messages behind it. Returns a Future of the new version, or
+        of None when another process committed in between or appended to the
+        conversation before this process's messages landed.
+        """
+        future = Future()
+        self._queue.put((self._commit_session, (session_id, conversation_id, title, expected_version), future))
+        return future
+
+    def _commit_session(self, conn, session_id, conversation_id, title, expected_version):
+        now = time.time()
+        if conversation_id in self._collided:
+            self._collided.discard(conversation_id)
+            with self._lock:
+                self.stats["session_conflicts"] += 1
+            return None
+        if expected_version == 0:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, conversation_id, title, version, updated_at) VALUES (?, ?, ?, 1, ?)",
+                (session_id, conversation_id, title, now)
+            )
+        else:
+            cursor = conn.execute(
+                "UPDATE sessions SET conversation_id = ?, title = ?, version = version + 1, updated_at = ? "
+                "WHERE session_id = ? AND version = ?",
+                (conversation_id, title, now, session_id, expected_version)
+            )
+        committed = cursor.rowcount == 1
+        with self._lock:
+            self.stats["session_commits" if committed else "session_conflicts"] += 1
+        return expected_version + 1 if committed else None
+
+    # Idle eviction
+
+    def touch(self, conversation):
+        """
+        Mark a conversation as in use, reloading its messages if it was
+        unloaded while idle
+        """
+        with self._lock:
+            self._resident[conversation.id] = conversation
+            self._last_used[conversation.id] = time.monotonic()
+            if conversation.resident:
+                return
+        self.flush()
+        conversation.messages = self._load_messages(conversation.id)
+        conversation.token_counts = []
+        conversation.rendered_html = []
+        conversation.resident = True
+        with self._lock:
+            self.stats["rehydrations"] += 1
+
+    def evict_idle(self):
+        """
+        Unload the messages of conversations idle for longer than
+        idle_timeout. Conversations with unsaved messages or a summary
+        refresh in progress are kept.
+        """
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            for conversation_id, last_used in list(self._last_used.items()):
+                conversation = self._resident.get(conversation_id)
+                if conversation is None:
+                    del self._last_used[conversation_id]
+                    continue
+                if last_used > cutoff or conversation.summary_pending:
+                    continue
+                if conversation.saved_upto < len(conversation.messages) or conversation_id in self._unsaved:
+                    continue
+                conversation.resident = False
+                conversation.messages = []
+                conversation.token_counts = []
+                conversation.rendered_html = []
+                del self._last_used[conversation_id]
+                del self._resident[conversation_id]
+                self.stats["evictions"] += 1
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            self.evict_idle()
@@ -0,0 +1,306 @@
+"""
+Hedged chat streams: when the first token of a call is late, a second call
+is sent to an alternate (the other provider, another model or the same
+request again), the first to produce a token is streamed and the other is
+cancelled. A call that fails before its first token fails over to the
+alternate at once.
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from functools import partial
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+class _Race:
+    """
+    One hedged call: its attempts, when each was sent and which one won
+    """
+
+    def __init__(self, hedger, attempts, on_usage, on_winner):
+        self.hedger = hedger
+        self.attempts = attempts
+        self.on_usage = on_usage
+        self.on_winner = on_winner
+        self.usage = {}
+        self.started = time.monotonic()
+        self.launched_at = []
+        self.failed = set()
+        self.cancelled = set()
+        self.winner = None
+        self.hedged_ttft = None
+
+    def first_token(self, idx):
+        """
+        Called by an attempt when its first token arrives (or when it ends
+        without one). The first caller wins and the others are cancelled;
+        a losing primary still reports how long it alone would have taken.
+        """
+        hedger = self.hedger
+        now = time.monotonic()
+        won = False
+        with hedger._lock:
+            hedger._observe(self.attempts[idx][0], now - self.launched_at[idx])
+            if self.winner is None:
+                won = True
+                self.winner = idx
+                self.hedged_ttft = now - self.started
+                if idx == 0:
+                    hedger._outcomes.append((self.hedged_ttft, self.hedged_ttft))
+                else:
+                    hedger.stats["hedge_wins"] += 1
+                for other in range(len(self.launched_at)):
+                    if other != idx and other not in self.failed:
+                        self.cancelled.add(other)
+                        hedger.stats["cancelled"] += 1
+            elif idx == 0:
+                hedger._outcomes.append((self.hedged_ttft, now - self.started))
+        if won:
+            if self.on_winner is not None:
+                self.on_winner(self.attempts[idx][0])
+            if idx in self.usage and self.on_usage is not None:
+                self.on_usage(self.usage.pop(idx))
+
+    def report_usage(self, idx, usage):
+        """
+        Usage callback of attempt `idx`: only the winner's usage is passed
+        on, held back until its first token when it reports earlier
+        """
+        with self.hedger._lock:
+            if self.winner is None:
+                self.usage[idx] = usage
+                return
+            won = idx == self.winner
+        if won and self.on_usage is not None:
+            self.on_usage(usage)
+
+    def next_attempt(self, reason=None):
+        """
+        Claim the next attempt to send, counting it as `reason` ("hedged" or
+        "failovers"), or None once an attempt has answered
+        """
+        with self.hedger._lock:
+            if self.winner is not None:
+                return None
+            if reason is not None:
+                self.hedger.stats[reason] += 1
+            self.launched_at.append(time.monotonic())
+            return len(self.launched_at) - 1
+
+    def fail(self, idx):
+        """
+        Record a failed attempt before any token; returns "launch" when the
+        alternate should be sent now, "raise" when every attempt has failed
+        """
+        with self.hedger._lock:
+            self.failed.add(idx)
+            if len(self.launched_at) < len(self.attempts):
+                return "launch"
+            if len(self.failed) == len(self.launched_at):
+                self.hedger.stats["failed"] += 1
+                return "raise"
+        return "wait"
+
+    def hedge_wait(self):
+        """
+        Seconds until the alternate is due, None once it is sent or a token arrived
+        """
+        if self.winner is not None or len(self.launched_at) == len(self.attempts):
+            return None
+        return max(0.0, self.started + self.hedger.deadline(self.attempts[0][0]) - time.monotonic())
+
+
+class Hedger:
+    """
+    Keeps the recent first-token times of each (provider, model) key and
+    hedges a call once it has waited longer than their `percentile`, bounded
+    by `min_delay` and `max_delay`; `initial_delay` applies until a key has
+    `min_samples` samples. A cancelled attempt stops at its next chunk, so
+    a losing primary still reports its first token: the hedged and the
+    primary-alone time to first token are kept side by side to report the
+    p99 that hedging saved.
+    """
+
+    def __init__(self, percentile=0.95, min_delay=0.5, max_delay=8.0, initial_delay=3.0, min_samples=20, window=200):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self.window = window
+        self._lock = threading.Lock()
+        self._first_tokens = {}
+        self._outcomes = deque(maxlen=window)
+        self.stats = {"requests": 0, "hedged": 0, "failovers": 0, "hedge_wins": 0, "cancelled": 0, "failed": 0}
+
+    def deadline(self, key):
+        """
+        Seconds to wait for the first token of a call to `key` before hedging
+        """
+        with self._lock:
+            samples = list(self._first_tokens.get(key, ()))
+        if len(samples) < self.min_samples:
+            return self.initial_delay
+        return min(self.max_delay, max(self.min_delay, _percentile(samples, self.percentile)))
+
+    def _observe(self, key, seconds):
+        samples = self._first_tokens.get(key)
+        if samples is None:
+            samples = self._first_tokens[key] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def hedge_rate(self):
+        """
+        Fraction of calls that sent a second request, hedge or failover
+        """
+        requests = self.stats["requests"]
+        return (self.stats["hedged"] + self.stats["failovers"]) / requests if requests else 0.0
+
+    def p99_saved(self):
+        """
+        Seconds of p99 time to first token saved by hedging, over the recent
+        calls whose primary answered
+        """
+        with self._lock:
+            outcomes = list(self._outcomes)
+        if not outcomes:
+            return 0.0
+        hedged = _percentile([hedged for hedged, _ in outcomes], 0.99)
+        alone = _percentile([alone for _, alone in outcomes], 0.99)
+        return max(0.0, alone - hedged)
+
+    def _start(self, attempts, on_usage, on_winner):
+        with self._lock:
+            self.stats["requests"] += 1
+        return _Race(self, attempts, on_usage, on_winner)
+
+    def stream(self, attempts, on_usage=None, on_winner=None):
+        """
+        Stream the deltas of the first of `attempts` to produce one. Each
+        attempt is (key, open_stream), open_stream(on_usage=...) returning
+        a delta iterator; the first is the primary and the second is sent
+        when the primary is late or fails. on_winner(key) is called when an
+        attempt wins and on_usage only gets the winner's usage. Errors are
+        raised once every attempt has failed, or when the winner fails
+        mid-stream.
+        """
+        race = self._start(attempts, on_usage, on_winner)
+        events = queue.Queue()
+
+        def run(idx):
+            stream = None
+            try:
+                stream = attempts[idx][1](on_usage=partial(race.report_usage, idx))
+                answered = False
+                for delta in stream:
+                    if not answered:
+                        answered = True
+                        race.first_token(idx)
+                    if idx in race.cancelled:
+                        return
+                    events.put((idx, "delta", delta))
+                if not answered:
+                    race.first_token(idx)
+                events.put((idx, "end", None))
+            except Exception as e:
+                events.put((idx, "error", e))
+            finally:
+                if stream is not None and hasattr(stream, "close"):
+                    stream.close()
+
+        def launch(reason=None):
+            idx = race.next_attempt(reason)
+            if idx is not None:
+                threading.Thread(target=run, args=(idx,), name="miachat-hedge", daemon=True).start()
+
+        launch()
+        try:
+            while True:
+                try:
+                    idx, kind, payload = events.get(timeout=race.hedge_wait())
+                except queue.Empty:
+                    launch("hedged")
+                    continue
+                if kind == "error" and race.winner is None:
+                    action = race.fail(idx)
+                    if action == "launch":
+                        launch("failovers")
+                    elif action == "raise":
+                        raise payload
+                elif idx == race.winner:
+                    if kind == "error":
+                        raise payload
+                    if kind == "end":
+                        return
+                    yield payload
+        finally:
+            # A reader that stops early cancels every attempt
+            race.cancelled.update(range(len(race.launched_at)))
+
+    async def astream(self, attempts, on_usage=None, on_winner=None):
+        """
+        Async stream: attempts open async delta iterators. Tasks still
+        running when the reader stops are cancelled outright, except losers,
+        which stop at their first token.
+        """
+        race = self._start(attempts, on_usage, on_winner)
+        events = asyncio.Queue()
+        tasks = []
+
+        async def run(idx):
+            stream = None
+            answered = False
+            try:
+                stream = attempts[idx][1](on_usage=partial(race.report_usage, idx))
+                async for delta in stream:
+                    if not answered:
+                        answered = True
+                        race.first_token(idx)
+                    if idx in race.cancelled:
+                        return
+                    await events.put((idx, "delta", delta))
+                if not answered:
+                    race.first_token(idx)
+                await events.put((idx, "end", None))
+            except Exception as e:
+                await events.put((idx, "error", e))
+            finally:
+                if stream is not None and hasattr(stream, "aclose"):
+                    await stream.aclose()
+
+        def launch(reason=None):
+            idx = race.next_attempt(reason)
+            if idx is not None:
+                tasks.append(asyncio.create_task(run(idx)))
+
+        launch()
+        try:
+            while True:
+                try:
+                    idx, kind, payload = await asyncio.wait_for(events.get(), race.hedge_wait())
+                except asyncio.TimeoutError:
+                    launch("hedged")
+                    continue
+                if kind == "error" and race.winner is None:
+                    action = race.fail(idx)
+                    if action == "launch":
+                        launch("failovers")
+                    elif action == "raise":
+                        raise payload
+                elif idx == race.winner:
+                    if kind == "error":
+                        raise payload
+                    if kind == "end":
+                        return
+                    yield payload
+        finally:
+            for idx, task in enumerate(tasks):
+                if idx not in race.cancelled:
+                    task.cancel()
@@ -0,0 +1,178 @@
+"""
+Full-text search over saved chats. Chats kept in the conversation store are
+searched with its SQLite FTS5 index; chats kept in memory use HistoryIndex,
+an inverted index updated as messages are saved. Both match every word of
+the query, the last one as a prefix so results follow the user's typing,
+and rank conversations by their best matching message.
+"""
+
+import bisect
+import heapq
+import math
+import re
+from collections import Counter
+
+_WORD = re.compile(r"\w+")
+
+# Markers around matched words in snippets, turned into bold by format_snippet
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+# Words of context in a snippet
+SNIPPET_WORDS = 12
+
+# Shortest last word of a query that is matched as a prefix
+MIN_PREFIX_LENGTH = 3
+
+# Characters with a meaning in markdown button labels
+_MARKDOWN = re.compile(r"([\\`*_\[\]<>#|~$])")
+
+
+def tokenize(text):
+    """
+    Lowercased words of a message or query
+    """
+    return _WORD.findall(text.lower())
+
+
+def query_terms(query):
+    """
+    Split a query into the words matched exactly and the prefix matched by
+    its last word, None when the user has finished typing it
+    """
+    words = tokenize(query)
+    if words and not query[-1:].isspace() and len(words[-1]) >= MIN_PREFIX_LENGTH:
+        return words[:-1], words[-1]
+    return words, None
+
+
+def fts_query(query):
+    """
+    The FTS5 MATCH expression for a query, or None when it has no words
+    """
+    terms, prefix = query_terms(query)
+    if not terms and prefix is None:
+        return None
+    return " ".join([f'"{term}"' for term in terms] + ([f'"{prefix}"*'] if prefix else []))
+
+
+def format_snippet(snippet):
+    """
+    Markdown for a snippet: its text escaped and the matched words in bold
+    """
+    return _MARKDOWN.sub(r"\\\1", snippet).replace(MATCH_START, "**").replace(MATCH_END, "**")
+
+
+class HistoryIndex:
+    """
+    In-memory inverted index over chat messages: postings of each word's
+    messages and counts, plus a sorted vocabulary for prefix lookups.
+    add() indexes only the messages appended since the last call, and a
+    search reads only the postings of the query's words, ranking messages
+    with BM25.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = {}
+        self._vocabulary = []
+        self._messages = []
+        self._indexed = {}
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._messages)
+
+    def add(self, conversation_id, messages):
+        """
+        Index the conversation's messages that are not indexed yet
+        """
+        start = self._indexed.get(conversation_id, 0)
+        for message in messages[start:]:
+            words = tokenize(message["content"])
+            message_id = len(self._messages)
+            self._messages.append((conversation_id, message["content"], len(words)))
+            self._total_length += len(words)
+            for word, count in Counter(words).items():
+                postings = self._postings.get(word)
+                if postings is None:
+                    postings = self._postings[word] = {}
+                    bisect.insort(self._vocabulary, word)
+                postings[message_id] = count
+        self._indexed[conversation_id] = max(start, len(messages))
+
+    def _expand(self, prefix):
+        """
+        Indexed words starting with the prefix
+        """
+        words = []
+        for idx in range(bisect.bisect_left(self._vocabulary, prefix), len(self._vocabulary)):
+            if not self._vocabulary[idx].startswith(prefix):
+                break
+            words.append(self._vocabulary[idx])
+        return words
+
+    def search(self, query, limit=10):
+        """
+        Conversations with a message matching the query, best first, as
+        {"conversation_id", "score", "snippet"} hits
+        """
+        terms, prefix = query_terms(query)
+        groups = [[term] if term in self._postings else [] for term in terms]
+        if prefix is not None:
+            groups.append(self._expand(prefix))
+        if not groups or not all(groups):
+            return []
+
+        # Score messages one query word at a time, rarest first, keeping
+        # only those that matched every word so far
+        count = len(self._messages)
+        average_length = self._total_length / count or 1
+        scores = None
+        for group in sorted(groups, key=lambda words: sum(len(self._postings[word]) for word in words)):
+            group_scores = {}
+            for word in group:
+                postings = self._postings[word]
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for message_id, frequency in postings.items():
+                    if scores is not None and message_id not in scores:
+                        continue
+                    length = self._messages[message_id][2]
+                    norm = frequency + self.k1 * (1 - self.b + self.b * length / average_length)
+                    group_scores[message_id] = group_scores.get(message_id, 0.0) + idf * frequency * (self.k1 + 1) / norm
+            scores = group_scores if scores is None else {
+                message_id: score + group_scores[message_id] for message_id, score in scores.items() if message_id in group_scores
+            }
+
+        best = {}
+        for message_id, score in scores.items():
+            conversation_id = self._messages[message_id][0]
+            if conversation_id not in best or score > best[conversation_id][0]:
+                best[conversation_id] = (score, message_id)
+        matched = set().union(*groups)
+        return [
+            {"conversation_id": conversation_id, "score": round(score, 4), "snippet": self._snippet(message_id, matched)}
+            for conversation_id, (score, message_id) in heapq.nlargest(limit, best.items(), key=lambda item: item[1][0])
+        ]
+
+    def _snippet(self, message_id, matched):
+        """
+        SNIPPET_WORDS words of the message around its first match, matches
+        wrapped in MATCH_START and MATCH_END
+        """
+        content = self._messages[message_id][1]
+        spans = [match.span() for match in _WORD.finditer(content)]
+        hits = {idx for idx, (start, end) in enumerate(spans) if content[start:end].lower() in matched}
+        first = max(0, min(hits, default=0) - SNIPPET_WORDS // 4)
+        last = min(len(spans), first + SNIPPET_WORDS)
+        parts = ["…" if first else ""]
+        position = spans[first][0] if spans else 0
+        for idx in range(first, last):
+            start, end = spans[idx]
+            parts.append(content[position:start])
+            word = content[start:end]
+            parts.append(f"{MATCH_START}{word}{MATCH_END}" if idx in hits else word)
+            position = end
+        parts.append("…" if last < len(spans) else content[position:])
+        return "".join(parts).strip()
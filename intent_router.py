@@ -0,0 +1,254 @@
+"""
+Local intent router that answers demo booking, integration and feature
+questions without a model call. Precompiled rules find the intent and its
+slot; a small Naive Bayes classifier checks the message really is that kind
+of question before the answer is trusted.
+"""
+
+import re
+import threading
+from collections import namedtuple
+
+IntentMatch = namedtuple("IntentMatch", ["intent", "confidence", "slot"])
+
+# Labelled examples for the classifier; "other" covers messages that need
+# the model, such as how-to questions about the same topics
+TRAINING_EXAMPLES = {
+    "demo_booking": [
+        "I'd like to book a demo with you",
+        "I'd like to schedule a demo",
+        "Can I book a demo?",
+        "Schedule a product demo for my team",
+        "Please book me a demo of Yellow.ai",
+        "Please set up a demo call",
+        "Book a demo",
+        "Can we arrange a demo next week?",
+        "I want to schedule a demonstration of the platform",
+        "Sign me up for a demo"
+    ],
+    "integration": [
+        "Can you show me the integration options?",
+        "Which CRMs do you support?",
+        "Do you integrate with Salesforce?",
+        "Do you integrate with Zendesk or Freshdesk?",
+        "What integrations do you have?",
+        "Which ERP systems can Yellow.ai connect to?",
+        "Does Yellow.ai work with HubSpot?",
+        "What ticketing systems do you support?",
+        "Do you support Twilio?",
+        "List your integrations",
+        "Is there an integration with SAP?"
+    ],
+    "feature": [
+        "Mia, tell me more about the features",
+        "What features does Yellow.ai have?",
+        "Tell me about customer support automation",
+        "What is sales automation?",
+        "Do you have HR automation?",
+        "What can the platform do?",
+        "Explain the HR process automation feature",
+        "What does customer support automation include?",
+        "Which features do you offer?",
+        "Tell me about the sales automation feature"
+    ],
+    "other": [
+        "Hi Mia, tell me about Yellow.ai",
+        "How do I connect Salesforce?",
+        "How do I set up the Zendesk integration step by step?",
+        "Help me set up integrations",
+        "Can you explain how Orch LLM works?",
+        "What will the demo cover?",
+        "I want to see a demo of Yellow.ai",
+        "I want to cancel my demo",
+        "I don't want a demo, just tell me pricing",
+        "I'd like to reschedule my demo to Friday",
+        "Can I see a demo video of the WhatsApp bot?",
+        "Please don't book a demo yet",
+        "Can your bot book a demo for my customers on WhatsApp?",
+        "Can the chatbot schedule appointments for our clients?",
+        "How much does it cost?",
+        "What is the pricing of sales automation?",
+        "How much does HR automation cost per month?",
+        "Which plan includes the Salesforce integration?",
+        "Which channels do you support?",
+        "Help me understand the live agent handoff",
+        "Can you explain the AI-powered analytics?",
+        "Which channels can I deploy on?",
+        "Why did my bot stop replying?",
+        "Write me a welcome message for WhatsApp",
+        "How long does onboarding take?",
+        "Help me understand omnichannel support",
+        "Thanks, that's helpful",
+        "How do I configure the CRM sync?",
+        "Compare Yellow.ai with other chatbot platforms"
+    ]
+}
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _features(text):
+    """
+    Unigrams and bigrams of the lowercased text; stopwords are kept since
+    "how do" is what separates a how-to question from a lookup
+    """
+    words = _WORD.findall(text.lower())
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+class NaiveBayesClassifier:
+    """
+    Multinomial Naive Bayes with add-one smoothing over unigram and bigram
+    counts, scored with one vectorized sum per message
+    """
+
+    def __init__(self, examples):
+        # Imported here so loading the app does not pay for numpy
+        import numpy as np
+
+        self.labels = list(examples)
+        self.vocabulary = {}
+        for texts in examples.values():
+            for text in texts:
+                for feature in _features(text):
+                    self.vocabulary.setdefault(feature, len(self.vocabulary))
+
+        counts = np.ones((len(self.labels), len(self.vocabulary)), dtype=np.float64)
+        priors = np.zeros(len(self.labels))
+        for row, label in enumerate(self.labels):
+            priors[row] = len(examples[label])
+            for text in examples[label]:
+                for feature in _features(text):
+                    counts[row, self.vocabulary[feature]] += 1
+        self.log_likelihood = np.log(counts / counts.sum(axis=1, keepdims=True))
+        self.log_prior = np.log(priors / priors.sum())
+
+    def predict(self, text):
+        """
+        Return {label: probability} for a message
+        """
+        import numpy as np
+
+        columns = [self.vocabulary[feature] for feature in _features(text) if feature in self.vocabulary]
+        scores = self.log_prior + self.log_likelihood[:, columns].sum(axis=1)
+        probabilities = np.exp(scores - scores.max())
+        probabilities /= probabilities.sum()
+        return dict(zip(self.labels, probabilities.tolist()))
+
+
+def _keyword_pattern(words):
+    return re.compile(r"\b(?:" + "|".join(re.escape(word) for word in words) + r")s?\b", re.IGNORECASE)
+
+
+class IntentRouter:
+    """
+    Rules plus classifier over YELLOW_AI_CONFIG. A rule hit counts for half
+    the confidence and the classifier's agreement for the rest; without a
+    rule hit the classifier alone is capped at 0.5, below any sensible
+    threshold. Messages under `threshold`, or where the classifier's best
+    label is not the rule's intent, are left to the model.
+    """
+
+    # Booking has a side effect, so it needs an explicit booking verb a few
+    # words before "demo" ("I want to see a demo" is left to the model)
+    DEMO_RULE = re.compile(r"\b(?:book|schedule|arrange|set up|sign (?:me|us) up for)\b(?:\W+\w+){0,3}?\W+demo(?:nstration)?\b", re.IGNORECASE)
+    # A negation before the booking verb, or a change to an existing booking
+    # anywhere in the message, is never booked
+    NEGATION_RULE = re.compile(r"\b(?:not|no|never|don'?t|won'?t|without)\b", re.IGNORECASE)
+    CHANGE_RULE = re.compile(r"\b(?:cancel\w*|reschedul\w*|postpon\w*|move my|change my)\b", re.IGNORECASE)
+    # Asking whether a bot can book demos, or booking them for someone's
+    # customers, is a product question rather than a booking
+    PRODUCT_RULE = re.compile(
+        r"\b(?:can|could|does|do|will|would) (?:your|the|a|my|our) (?:bot|chatbot|assistant|agent)s?\b"
+        r"|\bfor (?:my|our|their|your) (?:customers?|clients?|users?|patients?|visitors?|leads?|shoppers?)\b",
+        re.IGNORECASE
+    )
+    # Topics the canned answers do not cover, even when a feature or
+    # integration is named ("What is the pricing of sales automation?")
+    MODEL_TOPIC_RULE = re.compile(r"\b(?:pric\w*|costs?|plans?|billing|quotes?|how much|channels?|deploy\w*)\b", re.IGNORECASE)
+    INTEGRATION_RULE = re.compile(r"\b(?:integrat\w*|connectors?|connect to|work with|support)\b", re.IGNORECASE)
+    FEATURE_RULE = re.compile(r"\b(?:features?|automation|capabilit\w+|platform do)\b", re.IGNORECASE)
+    # Without a named category or feature, only a request for the whole list
+    # is answered locally ("Do you support WhatsApp?" is left to the model)
+    LIST_RULE = re.compile(r"\b(?:options|which|what|list|all|any|show|more)\b", re.IGNORECASE)
+    # How-to and troubleshooting questions need the model even on these topics
+    HOW_TO_RULE = re.compile(r"\b(?:how (?:do|can|to|does|long)|step by step|set ?up|configure|why|troubleshoot)\b", re.IGNORECASE)
+
+    def __init__(self, config, threshold=0.75, examples=TRAINING_EXAMPLES):
+        self.threshold = threshold
+        self.examples = examples
+        self._classifier = None
+        self._lock = threading.Lock()
+        self.stats = {"bypassed": 0, "llm": 0}
+        # Slot patterns: a category or system name selects an integration
+        # category, words of a feature name select that feature
+        self.integration_slots = [
+            (category, _keyword_pattern([category, *systems]))
+            for category, systems in config["integrations"].items()
+        ]
+        self.feature_slots = [
+            (key, _keyword_pattern([feature["name"].lower(), feature["name"].lower().rsplit(" ", 1)[0], key.replace("_", " ")]))
+            for key, feature in config["features"].items()
+            if key != "demo_booking"
+        ]
+
+    @property
+    def classifier(self):
+        # Trained on the first message rather than when the app starts
+        if self._classifier is None:
+            self._classifier = NaiveBayesClassifier(self.examples)
+        return self._classifier
+
+    def _slot(self, slots, text):
+        for name, pattern in slots:
+            if pattern.search(text):
+                return name
+        return None
+
+    def classify(self, text):
+        """
+        Return the IntentMatch for a message; intent is None when no rule
+        applies
+        """
+        intent = slot = None
+        demo = self.DEMO_RULE.search(text)
+        if demo:
+            if not (self.NEGATION_RULE.search(text, 0, demo.start()) or self.CHANGE_RULE.search(text)
+                    or self.PRODUCT_RULE.search(text)):
+                intent = "demo_booking"
+        elif not (self.HOW_TO_RULE.search(text) or self.CHANGE_RULE.search(text) or self.MODEL_TOPIC_RULE.search(text)):
+            integration = self._slot(self.integration_slots, text)
+            feature = self._slot(self.feature_slots, text)
+            if integration:
+                intent, slot = "integration", integration
+            elif feature:
+                intent, slot = "feature", feature
+            elif self.LIST_RULE.search(text):
+                if self.INTEGRATION_RULE.search(text):
+                    intent = "integration"
+                elif self.FEATURE_RULE.search(text):
+                    intent = "feature"
+
+        probabilities = self.classifier.predict(text)
+        best = max(probabilities, key=probabilities.get)
+        if intent is None or best != intent:
+            return IntentMatch(None, 0.5 * probabilities[best], None)
+        return IntentMatch(intent, 0.5 + 0.5 * probabilities[intent], slot)
+
+    def route(self, text):
+        """
+        Return the IntentMatch when the message can be answered locally,
+        else None, counting it towards the bypass rate either way
+        """
+        match = self.classify(text)
+        routed = match.intent is not None and match.confidence >= self.threshold
+        with self._lock:
+            self.stats["bypassed" if routed else "llm"] += 1
+        return match if routed else None
+
+    def bypass_rate(self):
+        """
+        Fraction of routed messages answered without a model call
+        """
+        total = self.stats["bypassed"] + self.stats["llm"]
+        return self.stats["bypassed"] / total if total else 0.0
@@ -0,0 +1,136 @@
+"""
+Compact BM25 index over Yellow.ai knowledge snippets, so a prompt carries
+only the facts relevant to the current question
+"""
+
+import os
+import re
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from have how i in is it me my of on or our "
+    "please show tell that the this to us we what which with you your".split()
+)
+
+
+def tokenize(text):
+    """
+    Lowercased words without stopwords, with a trailing plural "s" dropped
+    so "integrations" matches "integration"
+    """
+    terms = []
+    for word in _WORD.findall(text.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def integration_label(category):
+    """
+    Display name of an integration category key, e.g. "crm" -> "CRM"
+    """
+    return category.upper() if len(category) <= 3 else category.capitalize()
+
+
+def config_snippets(config):
+    """
+    One snippet per channel list, feature and integration category of
+    YELLOW_AI_CONFIG
+    """
+    snippets = [f"Supported channels: {', '.join(config['channels'])}."]
+    for feature in config["features"].values():
+        snippets.append(f"{feature['name']}: {feature['description']}.")
+    for category, systems in config["integrations"].items():
+        snippets.append(f"{integration_label(category)} integrations: {', '.join(systems)}.")
+    return snippets
+
+
+def load_doc_snippets(directory, max_chars=600):
+    """
+    Paragraphs of the .md and .txt files under a directory, split further
+    when longer than max_chars
+    """
+    snippets = []
+    for root, _, files in sorted(os.walk(directory)):
+        for name in sorted(files):
+            if not name.endswith((".md", ".txt")):
+                continue
+            with open(os.path.join(root, name), encoding="utf-8") as f:
+                text = f.read()
+            for paragraph in re.split(r"\n\s*\n", text):
+                paragraph = " ".join(paragraph.split())
+                while paragraph:
+                    snippets.append(paragraph[:max_chars])
+                    paragraph = paragraph[max_chars:]
+    return snippets
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a list of text snippets. Term weights are computed once
+    at build time and kept as flat postings arrays (one slice per term), so
+    a query is a handful of vectorized adds and a partial sort.
+    """
+
+    def __init__(self, snippets, k1=1.5, b=0.75):
+        # Imported here so loading the app does not pay for numpy
+        import numpy as np
+
+        self.snippets = list(snippets)
+        self.vocabulary = {}
+        doc_terms = [tokenize(snippet) for snippet in self.snippets]
+        lengths = np.array([len(terms) for terms in doc_terms], dtype=np.float32)
+        avg_length = float(lengths.mean()) if len(lengths) and lengths.mean() > 0 else 1.0
+
+        postings = {}
+        for doc_id, terms in enumerate(doc_terms):
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                postings.setdefault(term, []).append((doc_id, count))
+
+        doc_counts = []
+        flat = []
+        for term_id, (term, docs) in enumerate(sorted(postings.items())):
+            self.vocabulary[term] = term_id
+            doc_counts.append(len(docs))
+            flat.extend(docs)
+
+        doc_counts = np.array(doc_counts, dtype=np.float32)
+        self.offsets = np.concatenate(([0], np.cumsum(doc_counts, dtype=np.int64)))
+        flat = np.array(flat, dtype=np.int32).reshape(-1, 2)
+        self.doc_ids = flat[:, 0].copy()
+        tf = flat[:, 1].astype(np.float32)
+        idf = np.log1p((len(self.snippets) - doc_counts + 0.5) / (doc_counts + 0.5))
+        norm = tf + k1 * (1 - b + b * lengths[self.doc_ids] / avg_length)
+        self.weights = (np.repeat(idf, doc_counts.astype(np.int64)) * tf * (k1 + 1) / norm).astype(np.float32)
+
+    def __len__(self):
+        return len(self.snippets)
+
+    def search(self, query, k=3):
+        """
+        Return up to k (score, snippet) pairs matching the query, best first
+        """
+        import numpy as np
+
+        term_ids = {self.vocabulary[term] for term in tokenize(query) if term in self.vocabulary}
+        if not term_ids:
+            return []
+        scores = np.zeros(len(self.snippets), dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            # A term lists each snippet at most once, so plain fancy-index adds are safe
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+
+        k = min(k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[idx]), self.snippets[idx]) for idx in top]
@@ -0,0 +1,227 @@
+"""
+Per-turn tracing and process-wide metrics for the chat pipeline, exported to
+a JSONL trace file and a Prometheus-style text endpoint
+"""
+
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds, in seconds, of the stage duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in pairs) + "}"
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and duration histograms, rendered in the Prometheus
+    text exposition format
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def inc(self, name, value=1, **labels):
+        """
+        Add to a counter
+        """
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        """
+        Record a duration in a histogram
+        """
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(DURATION_BUCKETS), "count": 0, "sum": 0.0}
+            for idx, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    histogram["buckets"][idx] += 1
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+
+    def register_collector(self, collect, kind="counter"):
+        """
+        Add a callable returning (name, labels, value) samples that are read
+        at scrape time, for counters kept elsewhere such as the cache stats
+        (or gauges, with kind="gauge")
+        """
+        with self._lock:
+            self._collectors.append((collect, kind))
+
+    def counter_value(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text format
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, dict(value, buckets=list(value["buckets"]))) for key, value in self._histograms.items())
+            collectors = list(self._collectors)
+
+        lines = []
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for collect, kind in collectors:
+            for name, labels, value in collect():
+                if name not in seen:
+                    lines.append(f"# TYPE {name} {kind}")
+                    seen.add(name)
+                lines.append(f"{name}{_format_labels(_label_key(labels))} {value}")
+
+        for (name, labels), histogram in histograms:
+            if name not in seen:
+                lines.append(f"# TYPE {name} histogram")
+                seen.add(name)
+            for bound, count in zip(DURATION_BUCKETS, histogram["buckets"]):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+class TraceSink:
+    """
+    Append-only JSONL file of finished turn traces
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+class TurnTrace:
+    """
+    Timing spans and token usage for one chat turn. Spans may be recorded
+    from background threads.
+    """
+
+    def __init__(self, registry, sink=None, **attributes):
+        self.registry = registry
+        self.sink = sink
+        self.trace_id = uuid.uuid4().hex
+        self.attributes = attributes
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans = []
+        self.usage = {}
+
+    @contextmanager
+    def span(self, name):
+        """
+        Time a stage of the turn
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.perf_counter())
+
+    def traced(self, name, fn, *args, **kwargs):
+        """
+        Call fn inside a span; handy for work submitted to an executor
+        """
+        with self.span(name):
+            return fn(*args, **kwargs)
+
+    def add_span(self, name, start, end):
+        span = {"name": name, "start_ms": round((start - self._start) * 1000, 3), "duration_ms": round((end - start) * 1000, 3)}
+        with self._lock:
+            self.spans.append(span)
+        self.registry.observe("miachat_stage_duration_seconds", end - start, stage=name)
+
+    def usage_recorder(self, purpose):
+        """
+        Return an on_usage callback that adds provider token usage to the trace
+        """
+        def record(usage):
+            with self._lock:
+                totals = self.usage.setdefault(purpose, {"prompt_tokens": 0, "completion_tokens": 0})
+                for kind in ("prompt_tokens", "completion_tokens"):
+                    totals[kind] += usage.get(kind) or 0
+            for kind in ("prompt_tokens", "completion_tokens"):
+                self.registry.inc("miachat_tokens_total", usage.get(kind) or 0, purpose=purpose, kind=kind.split("_")[0])
+        return record
+
+    def finish(self):
+        """
+        Close the trace, export it and return its record
+        """
+        duration = time.perf_counter() - self._start
+        self.registry.observe("miachat_turn_duration_seconds", duration)
+        self.registry.inc("miachat_turns_total")
+        with self._lock:
+            record = {
+                "trace_id": self.trace_id,
+                "started_at": self.started_at,
+                "duration_ms": round(duration * 1000, 3),
+                **self.attributes,
+                "spans": list(self.spans),
+                "usage": {purpose: dict(totals) for purpose, totals in self.usage.items()}
+            }
+        if self.sink is not None:
+            self.sink.write(record)
+        return record
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(registry, port, host="0.0.0.0"):
+    """
+    Serve GET /metrics for the registry on a daemon thread
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, name="miachat-metrics", daemon=True).start()
+    return server
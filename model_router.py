@@ -0,0 +1,110 @@
+"""
+Model routing for the "auto" model option: a cheap local score of how hard
+a message is picks each provider's fast or strong model, and the strong
+model is skipped while its recent latency breaks the SLO
+"""
+
+import re
+import threading
+import time
+from collections import deque
+
+# Word stems that mark a technical or multi-step question worth the strong
+# model, matched at the start of a word ("configur" covers "configure" and
+# "configuration")
+TECHNICAL_TERMS = (
+    "api", "webhook", "sdk", "oauth", "sso", "saml", "authenticat", "token", "endpoint", "json", "payload",
+    "schema", "database", "sql", "script", "configur", "architect", "deploy", "migrat", "workflow", "pipeline",
+    "sync", "latenc", "scalab", "securi", "complian", "gdpr", "hipaa", "encrypt", "troubleshoot", "debug",
+    "error", "fail", "compar", "trade-off", "tradeoff", "customiz", "multilingual", "fine-tun", "llm", "orchestrat"
+)
+TECHNICAL_PATTERN = re.compile(r"\b(?:" + "|".join(re.escape(term) for term in TECHNICAL_TERMS) + r")", re.IGNORECASE)
+
+# Phrasings that ask for reasoning or a procedure rather than a fact
+REASONING_PATTERN = re.compile(
+    r"\b(?:how (?:do|can|would|should) (?:i|we)|step by step|walk me through|explain why|why (?:does|is|did)|"
+    r"what(?:'s| is) the difference|pros and cons|best way|design|plan)\b",
+    re.IGNORECASE
+)
+
+
+class ModelRouter:
+    """
+    Picks between a provider's fast model and its strong one per message.
+    The score counts length, technical terms, named integrations, reasoning
+    phrasings and multiple questions; messages scoring at least `threshold`
+    escalate. Time to first token of each model is kept over the last
+    `window` calls within `window_seconds`, and the strong model is not used
+    while the p90 of its window is above `latency_slo` seconds. Old samples
+    age out, so the strong model is tried again once the window empties.
+    """
+
+    def __init__(self, tiers, integrations=(), threshold=3, latency_slo=3.0, window=50, window_seconds=300):
+        self.tiers = tiers
+        self.threshold = threshold
+        self.latency_slo = latency_slo
+        self.window = window
+        self.window_seconds = window_seconds
+        self.integration_pattern = re.compile(
+            r"\b(?:" + "|".join(re.escape(name) for name in integrations) + r")\b", re.IGNORECASE
+        ) if integrations else None
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self.stats = {"fast": 0, "strong": 0, "downgraded": 0}
+
+    def score(self, text):
+        """
+        Complexity score of a message; higher means harder
+        """
+        words = len(text.split())
+        score = 0
+        if words > 25:
+            score += 1
+        if words > 60:
+            score += 1
+        score += min(3, len({term.lower() for term in TECHNICAL_PATTERN.findall(text)}))
+        if self.integration_pattern is not None and self.integration_pattern.search(text):
+            score += 1
+        if REASONING_PATTERN.search(text):
+            score += 2
+        if text.count("?") > 1:
+            score += 1
+        return score
+
+    def choose(self, provider, text, record=True):
+        """
+        Return (model, reason) for a message, reason being "simple",
+        "complex" or "slo" when a complex message was kept on the fast model.
+        Speculative calls pass record=False to stay out of the stats.
+        """
+        fast, strong = self.tiers[provider]
+        if self.score(text) < self.threshold:
+            decision, model, reason = "fast", fast, "simple"
+        elif self.latency_p90(strong) > self.latency_slo:
+            decision, model, reason = "downgraded", fast, "slo"
+        else:
+            decision, model, reason = "strong", strong, "complex"
+        if record:
+            with self._lock:
+                self.stats[decision] += 1
+        return model, reason
+
+    def observe(self, model, seconds):
+        """
+        Record a model call's time to first token
+        """
+        with self._lock:
+            samples = self._latencies.setdefault(model, deque(maxlen=self.window))
+            samples.append((time.monotonic(), seconds))
+
+    def latency_p90(self, model):
+        """
+        p90 time to first token of the model's recent calls, 0 without any
+        """
+        cutoff = time.monotonic() - self.window_seconds
+        with self._lock:
+            samples = self._latencies.get(model, ())
+            recent = sorted(seconds for observed_at, seconds in samples if observed_at >= cutoff)
+        if not recent:
+            return 0.0
+        return recent[min(len(recent) - 1, int(len(recent) * 0.9))]
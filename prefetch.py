@@ -0,0 +1,203 @@
+"""
+Speculative prefetch of chat replies: while the user reads a reply, the
+answers to the quick replies on screen are generated in the background, so
+clicking one streams an answer that is already done or under way.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rate_limiter import TokenBucket
+
+
+class _Prefetch:
+    """
+    One speculative reply; readers follow its chunks as they arrive
+    """
+
+    def __init__(self, session_id, estimated_tokens):
+        self.session_id = session_id
+        self.estimated_tokens = estimated_tokens
+        self.created_at = time.monotonic()
+        self.condition = threading.Condition()
+        self.chunks = []
+        self.usage = None
+        self.error = None
+        self.opened = False
+        self.done = False
+        self.taken = False
+        self.cancelled = threading.Event()
+        self.future = None
+
+    def tokens_used(self):
+        """
+        Tokens the call consumed as reported by the API, or the estimate
+        charged for it when the call was stopped before reporting usage
+        """
+        if self.usage:
+            return self.usage["prompt_tokens"] + self.usage["completion_tokens"]
+        return self.estimated_tokens if self.opened else 0
+
+
+class Prefetcher:
+    """
+    Runs speculative replies on a small pool of its own, within a global and
+    a per-session token budget (token buckets refilled every minute), keyed
+    by whatever identifies the request they anticipate.
+
+    Prefetches a session no longer shows are cancelled: queued ones never
+    start and running ones stop at their next chunk, closing the stream. So
+    is a taken prefetch whose reader stops early. Tokens spent on
+    prefetches nobody reads are counted as wasted.
+    """
+
+    def __init__(self, max_inflight=4, global_tokens_per_minute=20000, session_tokens_per_minute=3000, ttl=600):
+        self.global_budget = TokenBucket(global_tokens_per_minute)
+        self.session_tokens_per_minute = session_tokens_per_minute
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="miachat-prefetch")
+        # Reentrant: a future cancelled under the lock runs its callback inline
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._session_budgets = {}
+        self.stats = {
+            "issued": 0, "skipped_budget": 0, "cancelled": 0, "errors": 0,
+            "hits": 0, "joins": 0, "misses": 0, "used_tokens": 0, "wasted_tokens": 0
+        }
+
+    def prefetch(self, session_id, requests):
+        """
+        Replace the session's prefetches with `requests`, a list of
+        (key, estimated_tokens, open_stream) where open_stream(on_usage)
+        returns a delta iterator. Prefetches for keys not in the list are
+        cancelled, ones already running for listed keys are kept. Returns
+        the number of new prefetches started.
+        """
+        keys = {key for key, _, _ in requests}
+        started = []
+        with self._lock:
+            self._expire()
+            for key, entry in list(self._entries.items()):
+                if entry.session_id == session_id and key not in keys and not entry.taken:
+                    self._discard(key, cancelled=True)
+
+            session_budget = self._session_budgets.setdefault(session_id, TokenBucket(self.session_tokens_per_minute))
+            now = time.monotonic()
+            self.global_budget.refill(now)
+            session_budget.refill(now)
+            for key, estimated_tokens, open_stream in requests:
+                if key in self._entries:
+                    continue
+                if self.global_budget.level < estimated_tokens or session_budget.level < estimated_tokens:
+                    self.stats["skipped_budget"] += 1
+                    continue
+                self.global_budget.level -= estimated_tokens
+                session_budget.level -= estimated_tokens
+                entry = _Prefetch(session_id, estimated_tokens)
+                self._entries[key] = entry
+                started.append((entry, open_stream))
+                self.stats["issued"] += 1
+
+        for entry, open_stream in started:
+            entry.future = self._executor.submit(self._run, entry, open_stream)
+        return len(started)
+
+    def _run(self, entry, open_stream):
+        def on_usage(usage):
+            entry.usage = usage
+
+        stream = None
+        try:
+            if entry.cancelled.is_set():
+                return
+            stream = open_stream(on_usage)
+            entry.opened = True
+            for delta in stream:
+                if entry.cancelled.is_set():
+                    break
+                with entry.condition:
+                    entry.chunks.append(delta)
+                    entry.condition.notify_all()
+        except Exception as e:
+            entry.error = e
+            with self._lock:
+                self.stats["errors"] += 1
+        finally:
+            if stream is not None and hasattr(stream, "close"):
+                stream.close()
+            with entry.condition:
+                entry.done = True
+                entry.condition.notify_all()
+
+    def take(self, session_id, key):
+        """
+        Claim the session's prefetch for `key`, returning an iterator over
+        its reply (immediate when finished, following it live when still
+        running), or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.session_id != session_id or entry.taken or entry.error is not None:
+                self.stats["misses"] += 1
+                return None
+            entry.taken = True
+            self.stats["hits" if entry.done else "joins"] += 1
+        return self._follow(key, entry)
+
+    def _follow(self, key, entry):
+        sent = 0
+        try:
+            while True:
+                with entry.condition:
+                    while sent == len(entry.chunks) and not entry.done:
+                        entry.condition.wait()
+                    chunks = entry.chunks[sent:]
+                    done = entry.done
+                sent += len(chunks)
+                yield from chunks
+                if done and sent == len(entry.chunks):
+                    break
+        finally:
+            entry.cancelled.set()
+            with self._lock:
+                self.stats["used_tokens"] += entry.tokens_used()
+                self._entries.pop(key, None)
+        if entry.error is not None:
+            raise entry.error
+
+    def hit_rate(self):
+        """
+        Fraction of lookups served from a prefetch, finished or running
+        """
+        served = self.stats["hits"] + self.stats["joins"]
+        total = served + self.stats["misses"]
+        return served / total if total else 0.0
+
+    def _discard(self, key, cancelled=False):
+        """
+        Drop an untaken prefetch, counting its tokens as wasted. Tokens of a
+        prefetch still running are counted when it stops.
+        """
+        entry = self._entries.pop(key)
+        entry.cancelled.set()
+        if entry.future is not None:
+            entry.future.cancel()
+        if cancelled:
+            self.stats["cancelled"] += 1
+        if entry.done:
+            self.stats["wasted_tokens"] += entry.tokens_used()
+        elif entry.future is not None:
+            entry.future.add_done_callback(lambda _: self._count_waste(entry))
+
+    def _count_waste(self, entry):
+        with self._lock:
+            self.stats["wasted_tokens"] += entry.tokens_used()
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        for key, entry in list(self._entries.items()):
+            if entry.created_at < cutoff and not entry.taken:
+                self._discard(key)
+        for session_id in [session_id for session_id, budget in self._session_budgets.items() if budget.updated < cutoff]:
+            del self._session_budgets[session_id]
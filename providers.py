@@ -0,0 +1,492 @@
+"""
+Chat model providers behind one interface, each with a single pooled client
+(plus an async one for the API server), per-call timeouts and jittered
+retries on rate limits and server errors
+"""
+
+import asyncio
+import random
+import threading
+import time
+
+from rate_limiter import PRIORITY_INTERACTIVE, estimate_tokens
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and 5xx
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class ProviderError(Exception):
+    """
+    Error raised by a provider call, carrying the HTTP status when known
+    """
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def backoff_delay(attempt, base, cap):
+    """
+    Exponential backoff with full jitter for the given retry attempt
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def retry_after_seconds(exc):
+    """
+    Read a Retry-After header off an SDK error, if the server sent one
+    """
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def split_system_messages(messages):
+    """
+    Separate system messages from the chat turns for APIs that take the
+    system prompt as its own parameter, merging consecutive same-role turns
+    """
+    system = []
+    turns = []
+    for message in messages:
+        if message["role"] == "system":
+            system.append(message["content"])
+        elif turns and turns[-1]["role"] == message["role"]:
+            turns[-1] = {"role": message["role"], "content": turns[-1]["content"] + "\n\n" + message["content"]}
+        else:
+            turns.append({"role": message["role"], "content": message["content"]})
+    return "\n\n".join(system), turns
+
+
+def _ignore_usage(usage):
+    pass
+
+
+class ChatProvider:
+    """
+    Base provider. Subclasses implement _open_stream and _complete, and
+    their async counterparts _aopen_stream and _acomplete; retries, timeouts
+    and the shared rate limiter are handled here so every provider behaves
+    the same.
+    """
+
+    name = "base"
+
+    def __init__(self, timeout=30.0, max_retries=2, backoff_base=0.5, backoff_cap=8.0, rate_limiter=None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.rate_limiter = rate_limiter
+        self._client = None
+        self._async_client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """
+        The provider's shared client, created on first use
+        """
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    @property
+    def async_client(self):
+        """
+        The provider's shared async client, created on first use
+        """
+        if self._async_client is None:
+            with self._client_lock:
+                if self._async_client is None:
+                    self._async_client = self._create_async_client()
+        return self._async_client
+
+    def _create_client(self):
+        return None
+
+    def _create_async_client(self):
+        return None
+
+    def is_retryable(self, exc):
+        """
+        Whether a failed call should be retried
+        """
+        status_code = getattr(exc, "status_code", None)
+        if status_code is not None:
+            return status_code in RETRYABLE_STATUS_CODES
+        return type(exc).__name__ in ("APIConnectionError", "APITimeoutError")
+
+    def _with_retries(self, call):
+        """
+        Run a call, retrying retryable failures with jittered backoff
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return call()
+            except Exception as exc:
+                if attempt == self.max_retries or not self.is_retryable(exc):
+                    raise
+                delay = retry_after_seconds(exc)
+                if delay is None:
+                    delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+                time.sleep(min(delay, self.backoff_cap))
+
+    async def _awith_retries(self, call):
+        """
+        Async _with_retries: await call(), backing off without blocking the
+        event loop
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await call()
+            except Exception as exc:
+                if attempt == self.max_retries or not self.is_retryable(exc):
+                    raise
+                delay = retry_after_seconds(exc)
+                if delay is None:
+                    delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+                await asyncio.sleep(min(delay, self.backoff_cap))
+
+    def _admit(self, messages, model, max_tokens, priority, on_usage):
+        """
+        Charge the call against the rate limiter, if any, and return an
+        on_usage callback that hands back the tokens it did not use
+        """
+        on_usage = on_usage or _ignore_usage
+        if self.rate_limiter is None:
+            return on_usage
+        charged = self.rate_limiter.acquire(model, estimate_tokens(messages, max_tokens), priority)
+
+        def settle(usage):
+            used = (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)
+            self.rate_limiter.settle(model, charged, used)
+            on_usage(usage)
+        return settle
+
+    def stream(self, messages, model, temperature=0.7, max_tokens=150, timeout=None, on_usage=None, priority=PRIORITY_INTERACTIVE):
+        """
+        Stream text deltas for an OpenAI-format message list. Only opening
+        the stream is retried; a failure mid-stream is raised to the caller.
+        When the API reports token usage it is passed to on_usage as a dict
+        with prompt_tokens and completion_tokens.
+        """
+        timeout = timeout or self.timeout
+        on_usage = self._admit(messages, model, max_tokens, priority, on_usage)
+        deltas = self._with_retries(lambda: self._open_stream(messages, model, temperature, max_tokens, timeout, on_usage))
+        yield from deltas
+
+    def complete(self, messages, model, temperature=0.7, max_tokens=150, timeout=None, on_usage=None, priority=PRIORITY_INTERACTIVE):
+        """
+        Return the full reply text for an OpenAI-format message list
+        """
+        timeout = timeout or self.timeout
+        on_usage = self._admit(messages, model, max_tokens, priority, on_usage)
+        return self._with_retries(lambda: self._complete(messages, model, temperature, max_tokens, timeout, on_usage))
+
+    async def _aadmit(self, messages, model, max_tokens, priority, on_usage):
+        """
+        _admit for async calls; waiting for rate limit budget happens on a
+        worker thread so the event loop keeps serving other requests
+        """
+        if self.rate_limiter is None:
+            return on_usage or _ignore_usage
+        return await asyncio.to_thread(self._admit, messages, model, max_tokens, priority, on_usage)
+
+    async def astream(self, messages, model, temperature=0.7, max_tokens=150, timeout=None, on_usage=None, priority=PRIORITY_INTERACTIVE):
+        """
+        Async stream: an async iterator of text deltas, otherwise like stream
+        """
+        timeout = timeout or self.timeout
+        on_usage = await self._aadmit(messages, model, max_tokens, priority, on_usage)
+        deltas = await self._awith_retries(lambda: self._aopen_stream(messages, model, temperature, max_tokens, timeout, on_usage))
+        async for delta in deltas:
+            yield delta
+
+    async def acomplete(self, messages, model, temperature=0.7, max_tokens=150, timeout=None, on_usage=None, priority=PRIORITY_INTERACTIVE):
+        """
+        Async complete
+        """
+        timeout = timeout or self.timeout
+        on_usage = await self._aadmit(messages, model, max_tokens, priority, on_usage)
+        return await self._awith_retries(lambda: self._acomplete(messages, model, temperature, max_tokens, timeout, on_usage))
+
+    def _open_stream(self, messages, model, temperature, max_tokens, timeout, on_usage):
+        raise NotImplementedError
+
+    def _complete(self, messages, model, temperature, max_tokens, timeout, on_usage):
+        raise NotImplementedError
+
+    async def _aopen_stream(self, messages, model, temperature, max_tokens, timeout, on_usage):
+        raise NotImplementedError
+
+    async def _acomplete(self, messages, model, temperature, max_tokens, timeout, on_usage):
+        raise NotImplementedError
+
+
+class OpenAIProvider(ChatProvider):
+    """
+    OpenAI chat completions
+    """
+
+    name = "gpt"
+
+    def __init__(self, api_key=None, base_url=None, **kwargs):
+        super().__init__(**kwargs)
+        self.api_key = api_key
+        self.base_url = base_url
+
+    def _create_client(self):
+        import openai
+
+        # Retries are handled by the provider so they share one policy
+        return openai.OpenAI(api_key=self.api_key, base_url=self.base_url, timeout=self.timeout, max_retries=0)
+
+    def _create_async_client(self):
+        import openai
+
+        return openai.AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, timeout=self.timeout, max_retries=0)
+
+    def _stream_request(self, messages, model, temperature, max_tokens, timeout):
+        return {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+            "timeout": timeout
+        }
+
+    def _open_stream(self, messages, model, temperature, max_tokens, timeout, on_usage):
+        stream = self.client.chat.completions.create(**self._stream_request(messages, model, temperature, max_tokens, timeout))
+        return self._deltas(stream, on_usage)
+
+    async def _aopen_stream(self, messages, model, temperature, max_tokens, timeout, on_usage):
+        stream = await self.async_client.chat.completions.create(**self._stream_request(messages, model, temperature, max_tokens, timeout))
+        return self._adeltas(stream, on_usage)
+
+    def _delta(self, chunk, on_usage):
+        # The final chunk carries usage and no choices
+        if getattr(chunk, "usage", None):
+            on_usage({"prompt_tokens": chunk.usage.prompt_tokens, "completion_tokens": chunk.usage.completion_tokens})
+        if chunk.choices and chunk.choices[0].delta.content:
+            return chunk.choices[0].delta.content
+        return None
+
+    def _deltas(self, stream, on_usage):
+        # Closing the stream releases the connection of a reply cut short
+        try:
+            for chunk in stream:
+                delta = self._delta(chunk, on_usage)
+                if delta:
+                    yield delta
+        finally:
+            stream.close()
+
+    async def _adeltas(self, stream, on_usage):
+        try:
+            async for chunk in stream:
+                delta = self._delta(chunk, on_usage)
+                if delta:
+                    yield delta
+        finally:
+            await stream.close()
+
+    def _text(self, response, on_usage):
+        if response.usage:
+            on_usage({"prompt_tokens": response.usage.prompt_tokens, "completion_tokens": response.usage.completion_tokens})
+        return response.choices[0].message.content
+
+    def _complete(self, messages, model, temperature, max_tokens, timeout, on_usage):
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=timeout
+        )
+        return self._text(response, on_usage)
+
+    async def _acomplete(self, messages, model, temperature, max_tokens, timeout, on_usage):
+        response = await self.async_client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=timeout
+        )
+        return self._text(response, on_usage)
+
+
+class ClaudeProvider(ChatProvider):
+    """
+    Anthropic Messages API. System messages are passed as the system prompt.
+    """
+
+    name = "claude"
+
+    def __init__(self, api_key=None, **kwargs):
+        super().__init__(**kwargs)
+        self.api_key = api_key
+
+    def _create_client(self):
+        try:
+            import anthropic
+        except ImportError as exc:
+            raise ProviderError("The anthropic package is required for the Claude provider") from exc
+
+        return anthropic.Anthropic(api_key=self.api_key, timeout=self.timeout, max_retries=0)
+
+    def _create_async_client(self):
+        try:
+            import anthropic
+        except ImportError as exc:
+            raise ProviderError("The anthropic package is required for the Claude provider") from exc
+
+        return anthropic.AsyncAnthropic(api_key=self.api_key, timeout=self.timeout, max_retries=0)
+
+    def _request(self, messages, model, temperature, max_tokens, timeout):
+        system, turns = split_system_messages(messages)
+        request = {
+            "model": model,
+            "messages": turns,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "timeout": timeout
+        }
+        if system:
+            request["system"] = system
+        return request
+
+    def _open_stream(self, messages, model, temperature, max_tokens, timeout, on_usage):
+        events = self.client.messages.create(stream=True, **self._request(messages, model, temperature, max_tokens, timeout))
+        return self._deltas(events, on_usage)
+
+    async def _aopen_stream(self, messages, model, temperature, max_tokens, timeout, on_usage):
+        events = await self.async_client.messages.create(stream=True, **self._request(messages, model, temperature, max_tokens, timeout))
+        return self._adeltas(events, on_usage)
+
+    def _delta(self, event, usage, on_usage):
+        # usage carries the prompt tokens from message_start to message_delta
+        if event.type == "message_start":
+            usage["prompt_tokens"] = event.message.usage.input_tokens
+        elif event.type == "message_delta":
+            on_usage({"prompt_tokens": usage.get("prompt_tokens", 0), "completion_tokens": event.usage.output_tokens})
+        elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+            return event.delta.text
+        return None
+
+    def _deltas(self, events, on_usage):
+        usage = {}
+        try:
+            for event in events:
+                delta = self._delta(event, usage, on_usage)
+                if delta:
+                    yield delta
+        finally:
+            events.close()
+
+    async def _adeltas(self, events, on_usage):
+        usage = {}
+        try:
+            async for event in events:
+                delta = self._delta(event, usage, on_usage)
+                if delta:
+                    yield delta
+        finally:
+            await events.close()
+
+    def _text(self, response, on_usage):
+        on_usage({"prompt_tokens": response.usage.input_tokens, "completion_tokens": response.usage.output_tokens})
+        return "".join(block.text for block in response.content if block.type == "text")
+
+    def _complete(self, messages, model, temperature, max_tokens, timeout, on_usage):
+        response = self.client.messages.create(**self._request(messages, model, temperature, max_tokens, timeout))
+        return self._text(response, on_usage)
+
+    async def _acomplete(self, messages, model, temperature, max_tokens, timeout, on_usage):
+        response = await self.async_client.messages.create(**self._request(messages, model, temperature, max_tokens, timeout))
+        return self._text(response, on_usage)
+
+
+class MockProvider(ChatProvider):
+    """
+    Local provider for offline testing. Echoes the last message back word by
+    word, with configurable time-to-first-token, per-token delay and a rate
+    of injected errors.
+    """
+
+    name = "mock"
+
+    def __init__(self, first_token_latency=0.0, token_latency=0.0, error_rate=0.0, error_status=503, seed=None, **kwargs):
+        super().__init__(**kwargs)
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    def _maybe_fail(self):
+        with self._random_lock:
+            failed = self._random.random() < self.error_rate
+        if failed:
+            raise ProviderError(f"Injected mock error ({self.error_status})", status_code=self.error_status)
+
+    def _reply_words(self, messages, model):
+        message = messages[-1]["content"] if messages else ""
+        return f"[MOCK-{model}] You said: {message}".split(" ")
+
+    def _usage(self, messages, words):
+        prompt_tokens = sum(len(message["content"].split()) for message in messages)
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": len(words)}
+
+    def _open_stream(self, messages, model, temperature, max_tokens, timeout, on_usage):
+        self._maybe_fail()
+        time.sleep(self.first_token_latency)
+        words = self._reply_words(messages, model)[:max_tokens]
+
+        def deltas():
+            for idx, word in enumerate(words):
+                if idx:
+                    time.sleep(self.token_latency)
+                yield word if idx == 0 else " " + word
+            on_usage(self._usage(messages, words))
+
+        return deltas()
+
+    def _complete(self, messages, model, temperature, max_tokens, timeout, on_usage):
+        self._maybe_fail()
+        words = self._reply_words(messages, model)[:max_tokens]
+        time.sleep(self.first_token_latency + self.token_latency * max(0, len(words) - 1))
+        on_usage(self._usage(messages, words))
+        return " ".join(words)
+
+    async def _aopen_stream(self, messages, model, temperature, max_tokens, timeout, on_usage):
+        self._maybe_fail()
+        await asyncio.sleep(self.first_token_latency)
+        words = self._reply_words(messages, model)[:max_tokens]
+
+        async def deltas():
+            for idx, word in enumerate(words):
+                if idx:
+                    await asyncio.sleep(self.token_latency)
+                yield word if idx == 0 else " " + word
+            on_usage(self._usage(messages, words))
+
+        return deltas()
+
+    async def _acomplete(self, messages, model, temperature, max_tokens, timeout, on_usage):
+        self._maybe_fail()
+        words = self._reply_words(messages, model)[:max_tokens]
+        await asyncio.sleep(self.first_token_latency + self.token_latency * max(0, len(words) - 1))
+        on_usage(self._usage(messages, words))
+        return " ".join(words)
@@ -0,0 +1,135 @@
+"""
+Process-wide requests-per-minute and tokens-per-minute budgets for model
+calls, with user-facing calls served ahead of background work
+"""
+
+import threading
+import time
+
+from context_window import count_message_tokens
+
+# Priority lanes, most urgent first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when a call cannot get budget: immediately for background work,
+    after the wait timeout for interactive calls
+    """
+
+
+def estimate_tokens(messages, max_tokens):
+    """
+    Upper bound of the tokens a call will use, charged before it is sent
+    """
+    return sum(count_message_tokens(message) for message in messages) + max_tokens
+
+
+class TokenBucket:
+    """
+    Budget refilled continuously at `per_minute` units a minute, holding at
+    most one minute's worth
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """
+        Seconds until `amount` is available, 0 if it already is
+        """
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+
+class RateLimiter:
+    """
+    Per-model RPM/TPM buckets shared by every session. Interactive calls
+    wait for budget (up to `timeout` seconds) and block background calls
+    while they wait. Background calls never wait: they are shed when the
+    budget would drop below the `background_reserve` fraction kept for
+    interactive calls. Models without configured limits are not limited.
+    """
+
+    def __init__(self, limits, timeout=30.0, background_reserve=0.2):
+        self.limits = limits
+        self.timeout = timeout
+        self.background_reserve = background_reserve
+        self._condition = threading.Condition()
+        self._buckets = {}
+        self._interactive_waiting = {}
+        self.stats = {"admitted": 0, "waited": 0, "shed": 0, "timed_out": 0}
+
+    def _model_buckets(self, model):
+        buckets = self._buckets.get(model)
+        if buckets is None:
+            limits = self.limits[model]
+            buckets = self._buckets[model] = (TokenBucket(limits["rpm"]), TokenBucket(limits["tpm"]))
+        return buckets
+
+    def acquire(self, model, tokens, priority=PRIORITY_INTERACTIVE):
+        """
+        Charge one request and `tokens` tokens against the model's budget,
+        returning the tokens charged (pass them to settle once usage is
+        known) or raising RateLimitExceeded
+        """
+        if model not in self.limits:
+            return 0
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        with self._condition:
+            requests, token_bucket = self._model_buckets(model)
+            tokens = min(tokens, token_bucket.capacity)
+            try:
+                while True:
+                    now = time.monotonic()
+                    requests.refill(now)
+                    token_bucket.refill(now)
+
+                    if priority == PRIORITY_BACKGROUND:
+                        reserve = self.background_reserve
+                        if (self._interactive_waiting.get(model)
+                                or requests.level - 1 < requests.capacity * reserve
+                                or token_bucket.level - tokens < token_bucket.capacity * reserve):
+                            self.stats["shed"] += 1
+                            raise RateLimitExceeded(f"Rate limit reached for {model}; background call shed")
+                    else:
+                        wait = max(requests.wait_time(1), token_bucket.wait_time(tokens))
+                        if wait > 0:
+                            if now + wait > deadline:
+                                self.stats["timed_out"] += 1
+                                raise RateLimitExceeded(f"Rate limit reached for {model}; try again shortly")
+                            if not waited:
+                                waited = True
+                                self.stats["waited"] += 1
+                                self._interactive_waiting[model] = self._interactive_waiting.get(model, 0) + 1
+                            self._condition.wait(wait)
+                            continue
+
+                    requests.level -= 1
+                    token_bucket.level -= tokens
+                    self.stats["admitted"] += 1
+                    return tokens
+            finally:
+                if waited:
+                    self._interactive_waiting[model] -= 1
+
+    def settle(self, model, charged, used):
+        """
+        Return the unused part of an up-front token charge to the budget
+        """
+        if model not in self.limits or used >= charged:
+            return
+        with self._condition:
+            token_bucket = self._model_buckets(model)[1]
+            token_bucket.level = min(token_bucket.capacity, token_bucket.level + charged - used)
+            self._condition.notify_all()
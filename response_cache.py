@@ -0,0 +1,180 @@
+"""
+Exact-match cache for chat responses with an in-process LRU tier in front
+of an on-disk SQLite tier shared by server processes
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_prompt(prompt):
+    """
+    Normalize a user prompt so trivially different spellings share a key
+    """
+    return " ".join(prompt.split()).casefold()
+
+
+def make_cache_key(provider, model, prompt, context):
+    """
+    Build the cache key from the provider, model, normalized prompt and a
+    fingerprint of the context the prompt was sent with
+    """
+    payload = json.dumps(
+        [provider, model, normalize_prompt(prompt), context],
+        ensure_ascii=False,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier response cache with TTL and size-based eviction. Values are
+    stored as-is, so a hit returns exactly the text that was cached.
+    """
+
+    def __init__(self, path, ttl=24 * 60 * 60, max_memory_entries=512, max_disk_entries=10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._connect().execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+
+    def _connect(self):
+        """
+        Return this thread's SQLite connection, opening it on first use
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _get_memory(self, key, now):
+        """
+        Look up the LRU tier only, returning None on a miss
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if now - created_at < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+        return None
+
+    def get(self, key):
+        """
+        Look up a cached response, returning None on a miss
+        """
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None:
+            return value
+        return self._get_disk(key, now)
+
+    async def aget(self, key):
+        """
+        get() for callers on an event loop: LRU hits are served inline and
+        the SQLite tier, which may wait on another process's lock, is read
+        on a worker thread
+        """
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None:
+            return value
+        return await asyncio.to_thread(self._get_disk, key, now)
+
+    def _get_disk(self, key, now):
+        """
+        Look up the SQLite tier, promoting a hit to the LRU tier
+        """
+        row = self._connect().execute(
+            "SELECT value, created_at FROM responses WHERE key = ? AND created_at > ?",
+            (key, now - self.ttl)
+        ).fetchone()
+        if row is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+
+        value, created_at = row
+        self._connect().execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        with self._lock:
+            self._remember(key, value, created_at)
+            self.stats["disk_hits"] += 1
+        return value
+
+    def set(self, key, value):
+        """
+        Store a response in both tiers
+        """
+        now = time.time()
+        self._connect().execute(
+            "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, value, now, now)
+        )
+        with self._lock:
+            self._remember(key, value, now)
+            self.stats["stores"] += 1
+            self._writes += 1
+            should_evict = self._writes % 100 == 1
+        if should_evict:
+            self.evict()
+
+    async def aset(self, key, value):
+        """
+        set() for callers on an event loop, writing on a worker thread
+        """
+        await asyncio.to_thread(self.set, key, value)
+
+    def _remember(self, key, value, created_at):
+        """
+        Insert into the LRU tier, dropping the least recently used entries.
+        Must be called with the lock held.
+        """
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def evict(self):
+        """
+        Remove expired rows and trim the disk tier to its size limit
+        """
+        conn = self._connect()
+        expired = conn.execute("DELETE FROM responses WHERE created_at <= ?", (time.time() - self.ttl,)).rowcount
+        overflow = conn.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,)
+        ).rowcount
+        with self._lock:
+            self.stats["evictions"] += expired + overflow
+
+    def hit_rate(self):
+        """
+        Fraction of lookups served from either tier
+        """
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
@@ -0,0 +1,323 @@
+"""
+Process-wide coalescing of identical in-flight model requests, so a burst of
+sessions sending the same payload shares one upstream call and its result
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+
+
+def request_key(*parts):
+    """
+    Hash a request payload into a single-flight key
+    """
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _copy_error(error):
+    """
+    A copy of a shared call's exception for one caller, so callers never
+    raise (and extend the traceback of) the same instance
+    """
+    clone = type(error).__new__(type(error), *error.args)
+    clone.__dict__.update(getattr(error, "__dict__", {}))
+    return clone
+
+
+class _Flight:
+    """
+    One upstream call, everything it has produced so far and the number of
+    callers still reading it
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.chunks = []
+        self.result = None
+        self.error = None
+        self.usage = None
+        self.done = False
+        self.readers = 1
+        self.cancelled = False
+
+    def set_usage(self, usage):
+        self.usage = usage
+
+    def publish(self, chunk):
+        with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self.condition:
+            self.result = result
+            self.error = error
+            self.done = True
+            self.condition.notify_all()
+
+
+class _AsyncFlight:
+    """
+    _Flight for calls made on an event loop
+    """
+
+    def __init__(self):
+        self.changed = asyncio.Condition()
+        self.chunks = []
+        self.error = None
+        self.usage = None
+        self.done = False
+        self.readers = 1
+        self.cancelled = False
+        self.task = None
+
+    def set_usage(self, usage):
+        self.usage = usage
+
+    async def publish(self, chunk):
+        async with self.changed:
+            self.chunks.append(chunk)
+            self.changed.notify_all()
+
+    async def finish(self, error=None):
+        async with self.changed:
+            self.error = error
+            self.done = True
+            self.changed.notify_all()
+
+
+class SingleFlight:
+    """
+    Collapse concurrent identical requests into one upstream call. Callers
+    that join a call already in flight are followers; they wait at most
+    `timeout` seconds for progress and raise TimeoutError otherwise, without
+    affecting the call or its other waiters. A streamed call is cancelled
+    once every caller has stopped reading it. Calls are made with
+    on_usage=..., and the usage they report is passed to every caller's
+    on_usage, since each caller got the whole reply; errors are raised in
+    each follower as its own copy. The a-prefixed methods do the same for
+    coroutines; their flights are kept apart from the threaded ones.
+    """
+
+    def __init__(self, timeout=60.0):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._async_flights = {}
+        self.stats = {"leaders": 0, "followers": 0, "follower_timeouts": 0, "cancelled": 0}
+
+    def _join(self, key, flights=None, start=_Flight):
+        """
+        Return (flight, is_leader) for a key, starting a flight if none is
+        in progress
+        """
+        flights = self._flights if flights is None else flights
+        with self._lock:
+            flight = flights.get(key)
+            if flight is not None:
+                flight.readers += 1
+                self.stats["followers"] += 1
+                return flight, False
+            flight = flights[key] = start()
+            self.stats["leaders"] += 1
+            return flight, True
+
+    def _land(self, key, flight, flights=None):
+        flights = self._flights if flights is None else flights
+        with self._lock:
+            if flights.get(key) is flight:
+                del flights[key]
+
+    def _leave(self, key, flight, flights=None):
+        """
+        Drop a caller that stopped reading a streamed flight. Returns True
+        when it was the last one and the call is not finished, after
+        marking the flight cancelled so no one else joins it.
+        """
+        flights = self._flights if flights is None else flights
+        with self._lock:
+            flight.readers -= 1
+            if flight.readers or flight.done:
+                return False
+            if flights.get(key) is flight:
+                del flights[key]
+            flight.cancelled = True
+            self.stats["cancelled"] += 1
+            return True
+
+    def _timed_out(self):
+        with self._lock:
+            self.stats["follower_timeouts"] += 1
+        return TimeoutError(f"Timed out after {self.timeout}s waiting for a shared in-flight request")
+
+    def do(self, key, fn, on_usage=None):
+        """
+        Call fn(on_usage=...) once for all concurrent callers with the same
+        key and return its result (or raise its exception) to each of them
+        """
+        flight, is_leader = self._join(key)
+        if is_leader:
+            try:
+                result = fn(on_usage=flight.set_usage)
+            except BaseException as exc:
+                flight.finish(error=exc)
+                raise
+            finally:
+                self._land(key, flight)
+            flight.finish(result=result)
+        else:
+            with flight.condition:
+                if not flight.condition.wait_for(lambda: flight.done, timeout=self.timeout):
+                    raise self._timed_out()
+            if flight.error is not None:
+                raise _copy_error(flight.error) from flight.error
+        if on_usage is not None and flight.usage is not None:
+            on_usage(flight.usage)
+        return flight.result
+
+    def stream(self, key, open_stream, on_usage=None):
+        """
+        Share one streamed call among concurrent callers with the same key.
+        The upstream stream, open_stream(on_usage=...), is drained on its
+        own thread, so a caller that stops reading (for example a Streamlit
+        rerun closing its generator) never stalls the others; every caller
+        receives every delta. When the last caller stops, the upstream
+        stream is closed at its next delta.
+        """
+        flight, is_leader = self._join(key)
+        if is_leader:
+            def pump():
+                stream = None
+                try:
+                    stream = open_stream(on_usage=flight.set_usage)
+                    for chunk in stream:
+                        if flight.cancelled:
+                            break
+                        flight.publish(chunk)
+                except Exception as exc:
+                    flight.finish(error=exc)
+                else:
+                    flight.finish()
+                finally:
+                    if stream is not None and hasattr(stream, "close"):
+                        stream.close()
+                    self._land(key, flight)
+
+            threading.Thread(target=pump, name="miachat-singleflight", daemon=True).start()
+
+        return self._follow(key, flight, None if is_leader else self.timeout, on_usage)
+
+    def _follow(self, key, flight, wait_timeout, on_usage):
+        """
+        Yield a flight's chunks as they arrive. The leader relies on the
+        provider's own timeouts; followers also give up after wait_timeout
+        seconds without progress.
+        """
+        idx = 0
+        try:
+            while True:
+                with flight.condition:
+                    ready = flight.condition.wait_for(
+                        lambda: len(flight.chunks) > idx or flight.done,
+                        timeout=wait_timeout
+                    )
+                    if not ready:
+                        raise self._timed_out()
+                    chunks = flight.chunks[idx:]
+                    done = flight.done
+                for chunk in chunks:
+                    yield chunk
+                idx += len(chunks)
+                if done and idx == len(flight.chunks):
+                    if flight.error is not None:
+                        raise _copy_error(flight.error) from flight.error
+                    if on_usage is not None and flight.usage is not None:
+                        on_usage(flight.usage)
+                    return
+        finally:
+            self._leave(key, flight)
+
+    async def ado(self, key, fn, on_usage=None):
+        """
+        Async do: await fn(on_usage=...) once for all concurrent callers
+        with the same key. The call runs as its own task, so it carries on
+        for the other callers if the one that started it is cancelled.
+        """
+        flight, is_leader = self._join(key, self._async_flights, _AsyncFlight)
+        if is_leader:
+            flight.task = asyncio.ensure_future(fn(on_usage=flight.set_usage))
+            flight.task.add_done_callback(lambda task: self._settle_task(key, flight, task))
+            result = await asyncio.shield(flight.task)
+        else:
+            try:
+                result = await asyncio.wait_for(asyncio.shield(flight.task), self.timeout)
+            except asyncio.TimeoutError:
+                raise self._timed_out() from None
+            except Exception as exc:
+                raise _copy_error(exc) from exc
+        if on_usage is not None and flight.usage is not None:
+            on_usage(flight.usage)
+        return result
+
+    def _settle_task(self, key, flight, task):
+        self._land(key, flight, self._async_flights)
+        if not task.cancelled():
+            # Mark the exception as retrieved in case every caller went away
+            task.exception()
+
+    def astream(self, key, open_stream, on_usage=None):
+        """
+        Async stream: share one async stream of deltas among concurrent
+        callers with the same key, drained by its own task, which is
+        cancelled when the last caller stops reading
+        """
+        flight, is_leader = self._join(key, self._async_flights, _AsyncFlight)
+        if is_leader:
+            async def pump():
+                error = None
+                stream = None
+                try:
+                    stream = open_stream(on_usage=flight.set_usage)
+                    async for chunk in stream:
+                        await flight.publish(chunk)
+                except Exception as exc:
+                    error = exc
+                finally:
+                    if stream is not None and hasattr(stream, "aclose"):
+                        await stream.aclose()
+                    self._land(key, flight, self._async_flights)
+                    await flight.finish(error)
+
+            flight.task = asyncio.ensure_future(pump())
+
+        return self._afollow(key, flight, None if is_leader else self.timeout, on_usage)
+
+    async def _afollow(self, key, flight, wait_timeout, on_usage):
+        idx = 0
+        try:
+            while True:
+                async with flight.changed:
+                    try:
+                        await asyncio.wait_for(
+                            flight.changed.wait_for(lambda: len(flight.chunks) > idx or flight.done),
+                            timeout=wait_timeout
+                        )
+                    except asyncio.TimeoutError:
+                        raise self._timed_out() from None
+                    chunks = flight.chunks[idx:]
+                    done = flight.done
+                for chunk in chunks:
+                    yield chunk
+                idx += len(chunks)
+                if done and idx == len(flight.chunks):
+                    if flight.error is not None:
+                        raise _copy_error(flight.error) from flight.error
+                    if on_usage is not None and flight.usage is not None:
+                        on_usage(flight.usage)
+                    return
+        finally:
+            if self._leave(key, flight, self._async_flights):
+                flight.task.cancel()
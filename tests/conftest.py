@@ -0,0 +1,23 @@
+"""
+Shared test set-up: the repository root on the import path, and the mock
+provider with every SQLite store and log in a scratch directory, set before
+chat_core reads its settings
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_SCRATCH = tempfile.mkdtemp(prefix="miachat-tests-")
+os.environ.update({
+    "MIACHAT_OFFLINE": "1",
+    "MIACHAT_METRICS_PORT": "",
+    "MIACHAT_RESPONSE_CACHE_PATH": os.path.join(_SCRATCH, "cache.sqlite3"),
+    "MIACHAT_TRACE_PATH": os.path.join(_SCRATCH, "traces.jsonl"),
+    "MIACHAT_CONVERSATION_STORE_PATH": os.path.join(_SCRATCH, "conversations.sqlite3"),
+    "MIACHAT_BOOKING_OUTBOX_PATH": os.path.join(_SCRATCH, "bookings.sqlite3"),
+    "MIACHAT_BOOKING_SINK": "file:" + os.path.join(_SCRATCH, "bookings.jsonl")
+})
@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+import api_server
+from api_server import Request, route_label
+
+
+async def call(method, path, payload=None, content_length=None):
+    """
+    Send one request to a server on an ephemeral port, returning the status
+    and the body. content_length overrides the header's value.
+    """
+    server = await asyncio.start_server(api_server.handle_connection, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        length = len(body) if content_length is None else content_length
+        writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: test\r\nConnection: close\r\nContent-Length: {length}\r\n\r\n".encode("latin-1") + body
+        )
+        response = await reader.read()
+        writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split(b" ", 2)[1]), body
+
+
+def test_route_label_is_bounded_to_known_routes():
+    assert route_label(Request("GET", "/v1/integrations/crm", {}, b"")) == "/v1/integrations/"
+    assert route_label(Request("POST", "/v1/chat", {}, b"")) == "/v1/chat"
+    assert route_label(Request("GET", "/v1/random/a/b/c", {}, b"")) == "other"
+    assert route_label(Request("GET", "/v1/chat", {}, b"")) == "other"
+
+
+def test_handler_error_is_a_500(monkeypatch):
+    async def broken(request, writer):
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(api_server.ROUTES, ("GET", "/healthz"), broken)
+    status, body = asyncio.run(call("GET", "/healthz"))
+    assert status == 500
+    assert json.loads(body) == {"error": "Internal server error"}
+
+
+def test_demo_booking_without_an_email_is_a_400():
+    status, body = asyncio.run(call("POST", "/v1/demo-bookings", {"name": "Ana", "company": "Acme"}))
+    assert status == 400 and "email" in json.loads(body)["error"]
+
+
+def test_invalid_content_length_is_a_400():
+    status, body = asyncio.run(call("POST", "/v1/chat", {"messages": []}, content_length="twelve"))
+    assert status == 400
+    assert json.loads(body) == {"error": "Invalid Content-Length"}
+
+
+def test_demo_request_in_chat_is_booked():
+    status, body = asyncio.run(call("POST", "/v1/chat", {
+        "messages": [{"role": "user", "content": "I'd like to book a demo for my team"}],
+        "stream": False,
+        "session_id": "api-test"
+    }))
+    reply = json.loads(body)
+    assert status == 200 and reply["intent"] == "demo_booking" and "booking_id" not in reply
+    status, body = asyncio.run(call("POST", "/v1/chat", {
+        "messages": [
+            {"role": "user", "content": "I'd like to book a demo for my team"},
+            {"role": "assistant", "content": reply["text"]},
+            {"role": "user", "content": "Sure, it's ana@example.com, Acme Corp"}
+        ],
+        "stream": False,
+        "session_id": "api-test"
+    }))
+    reply = json.loads(body)
+    assert status == 200 and reply["intent"] == "demo_booking"
+    status, body = asyncio.run(call("GET", f"/v1/demo-bookings/{reply['booking_id']}"))
+    assert status == 200 and json.loads(body)["booking_id"] == reply["booking_id"]
@@ -0,0 +1,45 @@
+import asyncio
+import json
+import sys
+
+import batch_eval
+from batch_eval import replay
+from chat_core import DEMO_CONTACT_PROMPT, get_booking_outbox
+
+
+def test_replay_answers_demo_requests_without_booking():
+    outbox = get_booking_outbox()
+    submitted = outbox.stats["enqueued"] + outbox.stats["duplicates"]
+    messages = [{"role": "user", "content": "I'd like to book a demo for Friday, I'm ana@example.com"}]
+    row = asyncio.run(replay("demo", messages, "", "gpt", "gpt-4o", model_only=False))
+    assert row["intent"] == "demo_booking"
+    assert "demo request has been received" in row["reply"]
+    assert "email confirmation at ana@example.com" in row["reply"]
+    assert outbox.stats["enqueued"] + outbox.stats["duplicates"] == submitted
+
+
+def test_demo_requests_without_an_email_ask_for_one():
+    messages = [{"role": "user", "content": "I'd like to book a demo for Friday"}]
+    row = asyncio.run(replay("demo", messages, "", "gpt", "gpt-4o", model_only=False))
+    assert row["intent"] == "demo_booking"
+    assert row["reply"] == DEMO_CONTACT_PROMPT
+
+
+def test_lines_that_are_not_conversations_become_error_rows(tmp_path, monkeypatch):
+    source = tmp_path / "conversations.jsonl"
+    source.write_text("\n".join([
+        json.dumps({"id": "ok", "question": "What does Orch LLM do?"}),
+        json.dumps(["not", "an", "object"]),
+        "{not json",
+        json.dumps({"id": "no-user", "messages": [{"role": "assistant", "content": "Hello"}]})
+    ]) + "\n", encoding="utf-8")
+    output = tmp_path / "results.jsonl"
+    monkeypatch.setattr(sys, "argv", ["batch_eval.py", str(source), "--output", str(output), "--model-only"])
+    batch_eval.main()
+
+    rows = {row["id"]: row for row in map(json.loads, output.read_text(encoding="utf-8").splitlines())}
+    assert set(rows) == {"ok", "2", "3", "no-user"}
+    assert not rows["ok"]["error"] and rows["ok"]["reply"]
+    assert "not an object" in rows["2"]["error"]
+    assert rows["3"]["error"].startswith("Invalid input line 3")
+    assert "no user message" in rows["no-user"]["error"]
@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import Counter
+
+from booking_outbox import BookingOutbox, DeliveryError
+
+
+class RecordingSink:
+    """
+    Sink that takes `delay` seconds per batch and rejects bookings named "bad"
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.delivered = []
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def deliver(self, bookings):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if any(booking["name"] == "bad" for booking in bookings):
+            raise DeliveryError("rejected")
+        with self._lock:
+            self.delivered.extend(booking["name"] for booking in bookings)
+
+
+class StalledSink:
+    """
+    Sink of a worker that hangs mid-delivery
+    """
+
+    def __init__(self):
+        self.called = threading.Event()
+
+    def deliver(self, bookings):
+        self.called.set()
+        threading.Event().wait(10)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_workers_sharing_an_outbox_deliver_each_booking_once(tmp_path):
+    path = str(tmp_path / "bookings.sqlite3")
+    sinks = [RecordingSink(delay=0.05), RecordingSink(delay=0.05)]
+    outboxes = [BookingOutbox(path, sink, batch_size=3, poll_interval=0.01) for sink in sinks]
+    keys = [outboxes[0].enqueue("s1", {"name": f"booking {idx}"}) for idx in range(12)]
+    wait_for(lambda: all(status["status"] == "delivered" for status in outboxes[1].status(keys).values()))
+    counts = Counter(name for sink in sinks for name in sink.delivered)
+    assert len(counts) == 12 and set(counts.values()) == {1}
+
+
+def test_failed_batch_is_retried_per_booking(tmp_path):
+    sink = RecordingSink()
+    outbox = BookingOutbox(str(tmp_path / "bookings.sqlite3"), sink, max_attempts=2, backoff_base=0.01, backoff_cap=0.02, poll_interval=0.01)
+    good = outbox.enqueue("s1", {"name": "good"})
+    bad = outbox.enqueue("s1", {"name": "bad"})
+    other = outbox.enqueue("s1", {"name": "other"})
+    wait_for(lambda: outbox.status([bad])[bad]["status"] == "failed")
+    statuses = outbox.status([good, bad, other])
+    assert statuses[good]["status"] == statuses[other]["status"] == "delivered"
+    assert statuses[bad]["attempts"] == 2 and "rejected" in statuses[bad]["last_error"]
+    assert Counter(sink.delivered) == {"good": 1, "other": 1}
+
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    path = str(tmp_path / "bookings.sqlite3")
+    stalled = BookingOutbox(path, StalledSink(), lease_seconds=0.2, poll_interval=60)
+    key = stalled.enqueue("s1", {"name": "booking"})
+    assert stalled.sink.called.wait(5)
+    sink = RecordingSink()
+    BookingOutbox(path, sink, poll_interval=0.05)
+    wait_for(lambda: stalled.status([key])[key]["status"] == "delivered")
+    assert sink.delivered == ["booking"]
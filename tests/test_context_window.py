@@ -0,0 +1,71 @@
+from context_window import ContextManager, count_message_tokens
+from conversation import Conversation
+
+
+class InlineExecutor:
+    """
+    Executor running each task as soon as it is submitted
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        fn(*args, **kwargs)
+
+
+def make_conversation(turns):
+    conversation = Conversation()
+    for turn in range(turns):
+        conversation.append("user", f"Question {turn} " + "about the platform " * 8)
+        conversation.append("assistant", f"Answer {turn} " + "with some detail " * 8)
+    return conversation
+
+
+def make_manager(summarized):
+    def summarize(previous_summary, messages):
+        summarized.append(len(messages))
+        return "earlier turns"
+
+    message_tokens = count_message_tokens({"content": "Question 0 " + "about the platform " * 8})
+    budgets = {"small": 10 * message_tokens, "large": 60 * message_tokens}
+    return ContextManager(budgets, summarize, InlineExecutor(), summary_threshold=5 * message_tokens)
+
+
+def test_summary_never_passes_the_start_of_a_larger_window_for_the_same_message():
+    summarized = []
+    manager = make_manager(summarized)
+    conversation = make_conversation(25)
+
+    assert len(manager.window(conversation, "large")) == 50
+    assert len(manager.window(conversation, "small")) == 10
+    # The small window alone would have summarized 40 messages
+    assert not summarized
+    assert conversation.summary_upto == 0
+    assert len(manager.window(conversation, "large")) == 50
+
+
+def test_small_window_after_a_large_one_still_gets_a_summary():
+    summarized = []
+    manager = make_manager(summarized)
+    conversation = make_conversation(25)
+
+    assert len(manager.window(conversation, "large")) == 50
+    conversation.append("user", "Question 25 " + "about the platform " * 8)
+
+    # The large window was for an earlier message, so it no longer holds
+    # the summary back
+    manager.window(conversation, "small")
+    assert summarized == [41]
+    assert conversation.summary_upto == 41
+    assert manager.window(conversation, "small")[0]["role"] == "system"
+
+
+def test_windows_without_refresh_leave_the_summary_alone():
+    summarized = []
+    manager = make_manager(summarized)
+    conversation = make_conversation(25)
+
+    manager.window(conversation, "small", refresh_summary=False)
+    assert not summarized
+
+    manager.window(conversation, "small")
+    assert summarized == [40]
+    assert conversation.summary_upto == 40
@@ -0,0 +1,105 @@
+import sqlite3
+
+import pytest
+
+from conversation import Conversation
+from conversation_store import ConversationStore
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "conversations.sqlite3")
+
+
+def start_session(store, session_id):
+    conversation = Conversation()
+    conversation.append("user", "Hi Mia")
+    conversation.append("assistant", "Hello!")
+    store.save_conversation(session_id, conversation, "Chat")
+    assert store.commit_session(session_id, conversation.id, "Chat", 0).result() == 1
+    return conversation
+
+
+def take_turn(store, session_id, conversation, text):
+    conversation.append("user", text)
+    conversation.append("assistant", f"Answer to {text}")
+    store.save_conversation(session_id, conversation, "Chat")
+
+
+def test_commit_is_applied_after_the_messages_queued_before_it(path):
+    store = ConversationStore(path)
+    conversation = start_session(store, "s1")
+    take_turn(store, "s1", conversation, "What is Orch LLM?")
+    commit = store.commit_session("s1", conversation.id, "Chat", 1)
+    assert commit.result() == 2
+    reader = ConversationStore(path)
+    assert reader.session_version("s1") == 2
+    assert len(reader.load_conversation(conversation.id)) == 4
+
+
+def test_stale_version_is_a_conflict(path):
+    first, second = ConversationStore(path), ConversationStore(path)
+    conversation = start_session(first, "s1")
+    other = second.load_conversation(conversation.id)
+    take_turn(second, "s1", other, "From the second process")
+    assert second.commit_session("s1", other.id, "Chat", 1).result() == 2
+    take_turn(first, "s1", conversation, "From the first process")
+    assert first.commit_session("s1", conversation.id, "Chat", 1).result() is None
+
+
+def test_messages_appended_first_by_another_process_are_a_conflict(path):
+    first, second = ConversationStore(path), ConversationStore(path)
+    conversation = start_session(first, "s1")
+    other = second.load_conversation(conversation.id)
+    # The second process's messages land first, then the first process
+    # commits at the version both loaded
+    take_turn(second, "s1", other, "From the second process")
+    second.flush()
+    take_turn(first, "s1", conversation, "From the first process")
+    assert first.commit_session("s1", conversation.id, "Chat", 1).result() is None
+    assert first.stats["session_conflicts"] == 1
+    assert second.commit_session("s1", other.id, "Chat", 1).result() == 2
+    messages = ConversationStore(path).load_conversation(conversation.id).messages
+    assert messages[2]["content"] == "From the second process"
+
+
+def failing_appends(store, failures, error=sqlite3.OperationalError("database is locked")):
+    """
+    Make the store's next `failures` message appends raise `error`
+    """
+    append = store._append_message
+    calls = {"failed": 0}
+
+    def flaky(conn, *params):
+        if calls["failed"] < failures:
+            calls["failed"] += 1
+            raise error
+        return append(conn, *params)
+
+    store._append_message = flaky
+    return calls
+
+
+def test_failed_batch_is_retried(path):
+    store = ConversationStore(path, retry_delay=0)
+    calls = failing_appends(store, 2)
+    conversation = start_session(store, "s1")
+    assert calls["failed"] == 2
+    assert store.stats["write_errors"] == 0
+    assert len(ConversationStore(path).load_conversation(conversation.id)) == 2
+
+
+def test_dropped_messages_are_saved_again_and_the_writer_survives(path):
+    store = ConversationStore(path, write_retries=1, retry_delay=0)
+    failing_appends(store, 2, error=RuntimeError("boom"))
+    conversation = Conversation()
+    conversation.append("user", "Hi Mia")
+    conversation.append("assistant", "Hello!")
+    store.save_conversation("s1", conversation, "Chat")
+    store.flush()
+    assert store.stats["write_errors"] == 3
+    assert ConversationStore(path).load_conversation(conversation.id) is None
+
+    take_turn(store, "s1", conversation, "Still there?")
+    assert store.commit_session("s1", conversation.id, "Chat", 0).result() == 1
+    assert ConversationStore(path).load_conversation(conversation.id).messages == conversation.messages
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import pytest
+
+from hedging import Hedger
+
+
+def attempt(delay, tokens=("hello", " world"), usage=None, error=None):
+    """
+    An attempt whose first token takes `delay` seconds, then reports
+    `usage` once it has streamed every token
+    """
+    def open_stream(on_usage):
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        for token in tokens:
+            yield token
+        on_usage(usage or {"completion_tokens": len(tokens)})
+    return open_stream
+
+
+def async_attempt(delay, tokens=("hello", " world"), usage=None):
+    async def open_stream(on_usage):
+        await asyncio.sleep(delay)
+        for token in tokens:
+            yield token
+        on_usage(usage or {"completion_tokens": len(tokens)})
+    return open_stream
+
+
+def hedger():
+    return Hedger(initial_delay=0.05, min_delay=0.01)
+
+
+def test_fast_primary_is_not_hedged():
+    hedge, usage, winners = hedger(), [], []
+    attempts = [("primary", attempt(0)), ("alternate", attempt(0))]
+    assert "".join(hedge.stream(attempts, on_usage=usage.append, on_winner=winners.append)) == "hello world"
+    assert winners == ["primary"]
+    assert usage == [{"completion_tokens": 2}]
+    assert hedge.stats["hedged"] == 0
+
+
+def test_late_primary_is_hedged_and_only_the_winners_usage_is_reported():
+    hedge, usage, winners = hedger(), [], []
+    attempts = [
+        ("primary", attempt(0.5, tokens=("slow",), usage={"primary": True})),
+        ("alternate", attempt(0, tokens=("fast",), usage={"alternate": True}))
+    ]
+    assert "".join(hedge.stream(attempts, on_usage=usage.append, on_winner=winners.append)) == "fast"
+    assert winners == ["alternate"]
+    assert usage == [{"alternate": True}]
+    # The losing primary stops at its first token and reports its own time
+    deadline = time.monotonic() + 2
+    while not hedge.p99_saved() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert (hedge.stats["hedged"], hedge.stats["hedge_wins"], hedge.stats["cancelled"]) == (1, 1, 1)
+    assert hedge.p99_saved() > 0.3
+    assert usage == [{"alternate": True}]
+
+
+def test_failed_primary_fails_over_at_once():
+    hedge, winners = Hedger(initial_delay=10), []
+    attempts = [("primary", attempt(0, error=RuntimeError("down"))), ("alternate", attempt(0))]
+    start = time.monotonic()
+    assert "".join(hedge.stream(attempts, on_winner=winners.append)) == "hello world"
+    assert time.monotonic() - start < 1
+    assert winners == ["alternate"]
+    assert hedge.stats["failovers"] == 1
+
+
+def test_error_is_raised_once_every_attempt_failed():
+    hedge = Hedger(initial_delay=10)
+    attempts = [("primary", attempt(0, error=RuntimeError("down"))), ("alternate", attempt(0, error=ValueError("also down")))]
+    with pytest.raises((RuntimeError, ValueError)):
+        list(hedge.stream(attempts))
+    assert hedge.stats["failed"] == 1
+
+
+def test_async_late_primary_is_hedged():
+    hedge, usage, winners = hedger(), [], []
+    attempts = [
+        ("primary", async_attempt(0.5, tokens=("slow",), usage={"primary": True})),
+        ("alternate", async_attempt(0, tokens=("fast",), usage={"alternate": True}))
+    ]
+
+    async def collect():
+        return "".join([delta async for delta in hedge.astream(attempts, on_usage=usage.append, on_winner=winners.append)])
+
+    assert asyncio.run(collect()) == "fast"
+    assert winners == ["alternate"]
+    assert usage == [{"alternate": True}]
@@ -0,0 +1,91 @@
+import pytest
+
+from conversation import Conversation
+from conversation_store import ConversationStore
+from history_search import MATCH_END, MATCH_START, HistoryIndex, fts_query, query_terms
+
+CHATS = [
+    ["How do I connect Salesforce to my bot?", "Use the CRM integration and sync contacts."],
+    ["What does WhatsApp pricing look like?", "Pricing depends on the conversation volume."],
+    ["Can the bot hand off to a live agent?", "Yes, agent handoff works on every channel."]
+]
+
+
+def conversations():
+    result = []
+    for messages in CHATS:
+        conversation = Conversation()
+        conversation.append("user", messages[0])
+        conversation.append("assistant", messages[1])
+        result.append(conversation)
+    return result
+
+
+class MemoryBackend:
+    def __init__(self, tmp_path):
+        self.index = HistoryIndex()
+
+    def add(self, conversation):
+        self.index.add(conversation.id, conversation.messages)
+
+    def search(self, query):
+        return self.index.search(query)
+
+
+class StoreBackend:
+    def __init__(self, tmp_path):
+        self.store = ConversationStore(str(tmp_path / "conversations.sqlite3"))
+
+    def add(self, conversation):
+        self.store.save_conversation("s1", conversation, "Chat")
+        self.store.flush()
+
+    def search(self, query):
+        return self.store.search("s1", query)
+
+
+@pytest.fixture(params=[MemoryBackend, StoreBackend], ids=["memory", "fts5"])
+def backend(request, tmp_path):
+    backend = request.param(tmp_path)
+    chats = conversations()
+    for conversation in chats:
+        backend.add(conversation)
+    backend.ids = [conversation.id for conversation in chats]
+    return backend
+
+
+def test_query_terms_match_the_last_word_as_a_prefix():
+    assert query_terms("salesforce sy") == (["salesforce", "sy"], None)
+    assert query_terms("salesforce syn") == (["salesforce"], "syn")
+    assert query_terms("salesforce sync ") == (["salesforce", "sync"], None)
+    assert fts_query("agent hand") == '"agent" "hand"*'
+    assert fts_query("  ") is None
+
+
+def test_every_word_must_match(backend):
+    assert [hit["conversation_id"] for hit in backend.search("salesforce bot")] == [backend.ids[0]]
+    assert backend.search("salesforce pricing") == []
+
+
+def test_prefix_follows_typing(backend):
+    assert [hit["conversation_id"] for hit in backend.search("hando")] == [backend.ids[2]]
+
+
+def test_snippet_marks_matches(backend):
+    (hit,) = backend.search("whatsapp")
+    assert f"{MATCH_START}WhatsApp{MATCH_END}" in hit["snippet"]
+
+
+def test_one_hit_per_conversation(backend):
+    hits = backend.search("bot")
+    assert sorted(hit["conversation_id"] for hit in hits) == sorted([backend.ids[0], backend.ids[2]])
+
+
+def test_index_picks_up_appended_messages(backend):
+    conversation = Conversation(conversation_id=backend.ids[1])
+    for messages in CHATS[1]:
+        conversation.append("user", messages)
+    conversation.saved_upto = len(conversation.messages)
+    conversation.append("user", "Is there a discount for nonprofits?")
+    backend.add(conversation)
+    assert [hit["conversation_id"] for hit in backend.search("nonprofits")] == [backend.ids[1]]
@@ -0,0 +1,55 @@
+import pytest
+
+from chat_core import YELLOW_AI_CONFIG
+from intent_router import IntentRouter
+
+
+@pytest.fixture(scope="module")
+def router():
+    return IntentRouter(YELLOW_AI_CONFIG)
+
+
+@pytest.mark.parametrize("text", [
+    "I'd like to book a demo for Friday",
+    "Can you schedule a demo for our support team?",
+    "Please arrange a product demo next Tuesday"
+])
+def test_explicit_booking_requests_are_booked(router, text):
+    match = router.route(text)
+    assert match is not None and match.intent == "demo_booking"
+
+
+@pytest.mark.parametrize("text", [
+    "I want to cancel my demo",
+    "I don't want a demo, just tell me pricing",
+    "I'd like to reschedule my demo to Friday",
+    "Can I see a demo video of the WhatsApp bot?",
+    "I want to see a demo",
+    "Don't book a demo yet",
+    "Book a demo. Actually, cancel that",
+    "Can you postpone the demo we booked?",
+    "Can your bot book a demo for my customers on WhatsApp?"
+])
+def test_demo_mentions_without_a_booking_request_go_to_the_model(router, text):
+    assert router.route(text) is None
+
+
+@pytest.mark.parametrize("text", [
+    "What is the pricing of sales automation?",
+    "How much does the Salesforce integration cost?",
+    "Which channels do you support?",
+    "Which plan has HR automation?"
+])
+def test_pricing_and_channel_questions_go_to_the_model(router, text):
+    assert router.route(text) is None
+
+
+@pytest.mark.parametrize("text, intent, slot", [
+    ("Do you integrate with Salesforce?", "integration", "crm"),
+    ("Can you show me the integration options?", "integration", None),
+    ("Tell me about sales automation", "feature", "sales_automation"),
+    ("Mia, tell me more about the features", "feature", None)
+])
+def test_lookup_questions_are_answered_locally(router, text, intent, slot):
+    match = router.route(text)
+    assert match is not None and (match.intent, match.slot) == (intent, slot)
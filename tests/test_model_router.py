@@ -0,0 +1,132 @@
+import asyncio
+import threading
+import time
+import uuid
+
+import pytest
+
+import chat_core
+from chat_core import aget_chat_response, get_chat_response
+from hedging import Hedger
+from model_router import ModelRouter
+
+TIERS = {"gpt": ("fast-model", "strong-model")}
+
+
+def make_router(**settings):
+    return ModelRouter(TIERS, integrations=["Salesforce", "Zendesk"], **settings)
+
+
+def test_simple_messages_score_below_technical_multi_step_ones():
+    router = make_router()
+    assert router.score("Hi Mia!") == 0
+    assert router.score("Do you support Zendesk?") == 1
+    # Two technical terms, an integration and a reasoning phrasing
+    assert router.score("How do I configure the Salesforce webhook?") == 5
+    assert router.score("What is a bot? And who uses it?") == 1
+    assert router.score(" ".join(["word"] * 61)) == 2
+
+
+def test_choose_escalates_complex_messages_only():
+    router = make_router(threshold=3)
+    assert router.choose("gpt", "Hi Mia!") == ("fast-model", "simple")
+    assert router.choose("gpt", "How do I configure the Salesforce webhook?") == ("strong-model", "complex")
+    router.choose("gpt", "How do I debug an API error?", record=False)
+    assert router.stats == {"fast": 1, "strong": 1, "downgraded": 0}
+
+
+def test_slow_strong_model_is_downgraded_until_its_samples_age_out():
+    router = make_router(latency_slo=1.0, window_seconds=0.2)
+    question = "How do I configure the Salesforce webhook?"
+    for seconds in [0.5] * 8 + [2.0] * 2:
+        router.observe("strong-model", seconds)
+    # p90 of ten samples is the ninth slowest
+    assert router.latency_p90("strong-model") == 2.0
+    assert router.choose("gpt", question) == ("fast-model", "slo")
+    assert router.stats["downgraded"] == 1
+    # The fast model's own latency does not count against the strong one
+    router.observe("fast-model", 5.0)
+    time.sleep(0.25)
+    assert router.latency_p90("strong-model") == 0.0
+    assert router.choose("gpt", question) == ("strong-model", "complex")
+
+
+class DelayedProvider:
+    """
+    Provider answering with its own name after `delay` seconds
+    """
+
+    def __init__(self, name, delay):
+        self.name = name
+        self.delay = delay
+
+    def stream(self, messages, model, temperature=0.7, max_tokens=150, on_usage=None):
+        time.sleep(self.delay)
+        yield f"{self.name} reply"
+
+    async def astream(self, messages, model, temperature=0.7, max_tokens=150, on_usage=None):
+        await asyncio.sleep(self.delay)
+        yield f"{self.name} reply"
+
+
+@pytest.fixture
+def observed(monkeypatch):
+    providers = {"gpt": DelayedProvider("gpt", 0.01), "claude": DelayedProvider("claude", 0)}
+    latencies = []
+    monkeypatch.setattr(chat_core, "get_provider", providers.get)
+    monkeypatch.setattr(chat_core, "get_hedger", lambda: None)
+    monkeypatch.setattr(chat_core, "record_model_latency", lambda model, ttft: latencies.append((model, ttft)))
+    return providers, latencies
+
+
+def ask(text):
+    return [{"role": "user", "content": f"{text} {uuid.uuid4().hex}"}]
+
+
+def test_first_token_latency_is_recorded_for_the_called_model_only(observed):
+    _, latencies = observed
+    history = ask("Latency question")
+    assert "".join(get_chat_response(history, "gpt", "gpt-4")) == "gpt reply"
+    assert [model for model, _ in latencies] == ["gpt-4"]
+    assert latencies[0][1] >= 0.01
+
+    # A cache hit never reaches the model
+    assert "".join(get_chat_response(history, "gpt", "gpt-4")) == "gpt reply"
+    assert len(latencies) == 1
+
+
+def test_async_first_token_latency_is_recorded(observed):
+    _, latencies = observed
+
+    async def reply():
+        return "".join([delta async for delta in aget_chat_response(ask("Async question"), "gpt", "gpt-4")])
+
+    assert asyncio.run(reply()) == "gpt reply"
+    assert [model for model, _ in latencies] == ["gpt-4"]
+
+
+def test_race_won_by_the_hedge_target_is_not_recorded(observed, monkeypatch):
+    providers, latencies = observed
+    providers["gpt"].delay = 0.5
+    monkeypatch.setattr(chat_core, "get_hedger", lambda: Hedger(initial_delay=0.05))
+    monkeypatch.setattr(chat_core, "get_singleflight", lambda: None)
+    assert "".join(get_chat_response(ask("Hedged question"), "gpt", "gpt-4")) == "claude reply"
+    assert latencies == []
+
+
+def test_single_flight_followers_are_not_recorded(observed):
+    providers, latencies = observed
+    providers["gpt"].delay = 0.2
+    history = ask("Shared question")
+    replies = []
+
+    def read():
+        replies.append("".join(get_chat_response(history, "gpt", "gpt-4")))
+
+    threads = [threading.Thread(target=read) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert replies == ["gpt reply"] * 3
+    assert len(latencies) == 1
@@ -0,0 +1,91 @@
+import threading
+import time
+
+from prefetch import Prefetcher
+
+
+class Upstream:
+    """
+    A streamed reply yielding a delta whenever `step` is set, until it is
+    left waiting for a second, recording when it was opened and closed
+    """
+
+    def __init__(self):
+        self.step = threading.Event()
+        self.opened = threading.Event()
+        self.closed = threading.Event()
+        self.sent = 0
+
+    def __call__(self, on_usage):
+        self.opened.set()
+        try:
+            while self.step.wait(1):
+                self.step.clear()
+                self.sent += 1
+                yield f"d{self.sent} "
+        finally:
+            self.closed.set()
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_replaced_prefetch_stops_at_its_next_chunk_and_closes_its_stream():
+    prefetcher = Prefetcher(max_inflight=2)
+    upstream = Upstream()
+    assert prefetcher.prefetch("s1", [("a", 100, upstream)]) == 1
+    assert upstream.opened.wait(5)
+
+    prefetcher.prefetch("s1", [])
+    upstream.step.set()
+    assert upstream.closed.wait(5)
+    assert upstream.sent == 1
+    assert prefetcher.stats["cancelled"] == 1
+    # Stopped before reporting usage, so the estimate is counted as wasted
+    wait_until(lambda: prefetcher.stats["wasted_tokens"] == 100)
+    assert prefetcher.take("s1", "a") is None
+
+
+def test_cancelled_queued_prefetch_never_starts():
+    prefetcher = Prefetcher(max_inflight=1)
+    running, queued = Upstream(), Upstream()
+    prefetcher.prefetch("s1", [("a", 100, running), ("b", 100, queued)])
+    assert running.opened.wait(5)
+
+    prefetcher.prefetch("s1", [("a", 100, running)])
+    assert prefetcher.stats["cancelled"] == 1
+    running.step.set()
+    prefetcher.prefetch("s1", [])
+    assert running.closed.wait(5)
+    time.sleep(0.05)
+    assert not queued.opened.is_set()
+    assert prefetcher.stats["wasted_tokens"] == 100
+
+
+def test_taken_prefetch_survives_replacement_until_its_reader_stops():
+    prefetcher = Prefetcher(max_inflight=2)
+    mine, theirs = Upstream(), Upstream()
+    prefetcher.prefetch("s1", [("a", 100, mine)])
+    prefetcher.prefetch("s2", [("b", 100, theirs)])
+    deltas = prefetcher.take("s1", "a")
+
+    prefetcher.prefetch("s1", [])
+    assert prefetcher.stats["cancelled"] == 0
+    mine.step.set()
+    assert next(deltas) == "d1 "
+    assert not theirs.closed.is_set()
+
+    # A reader that stops early cancels the prefetch it took
+    deltas.close()
+    mine.step.set()
+    assert mine.closed.wait(5)
+    assert mine.sent == 2
+    wait_until(lambda: prefetcher.stats["used_tokens"] == 100)
+
+    prefetcher.prefetch("s2", [])
+    theirs.step.set()
+    assert theirs.closed.wait(5)
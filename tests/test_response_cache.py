@@ -0,0 +1,100 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+
+import chat_core
+from chat_core import _chat_request, _quick_reply_request, get_chat_response, get_provider, get_response_cache
+from hedging import Hedger
+from response_cache import ResponseCache, make_cache_key
+
+HISTORY = [{"role": "user", "content": "What does Orch LLM do?"}]
+
+
+def test_offline_replies_are_cached_under_the_mock_provider():
+    # The test suite runs with MIACHAT_OFFLINE=1, so "gpt" is answered by the mock
+    assert get_provider("gpt").name == "mock"
+    messages, cache_key, _ = _chat_request(HISTORY, "gpt", "gpt-4o")
+    assert cache_key == make_cache_key("mock", "gpt-4o", HISTORY[-1]["content"], messages[:-1])
+    assert cache_key != make_cache_key("gpt", "gpt-4o", HISTORY[-1]["content"], messages[:-1])
+
+
+def test_async_lookups_keep_the_loop_running_while_sqlite_waits(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    cache.set("key", "value")
+    cache._memory.clear()
+    read_disk = cache._get_disk
+
+    def slow_disk(key, now):
+        # A busy SQLite tier, as when another process holds the write lock
+        time.sleep(0.3)
+        return read_disk(key, now)
+
+    monkeypatch.setattr(cache, "_get_disk", slow_disk)
+
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        value = await cache.aget("key")
+        ticker.cancel()
+        return value, ticks
+
+    value, ticks = asyncio.run(main())
+    assert value == "value"
+    assert ticks >= 10
+    # The disk hit was promoted, so the next lookup never leaves the loop
+    assert asyncio.run(cache.aget("key")) == "value"
+    assert cache.stats["memory_hits"] == 1
+
+
+def test_offline_quick_replies_are_cached_under_the_mock_provider():
+    context = [{"role": "user", "content": "Tell me about omnichannel support"}, {"role": "assistant", "content": "Sure."}]
+    _, _, cache_key = _quick_reply_request(context)
+    assert cache_key == make_cache_key("quick_replies:mock", "gpt-3.5-turbo", context[-1]["content"], context[:-1])
+
+
+class DelayedProvider:
+    """
+    Provider answering with its own name after `delay` seconds
+    """
+
+    def __init__(self, name, delay):
+        self.name = name
+        self.delay = delay
+
+    def stream(self, messages, model, temperature=0.7, max_tokens=150, on_usage=None):
+        time.sleep(self.delay)
+        yield f"{self.name} reply"
+        on_usage({"prompt_tokens": 1, "completion_tokens": 2})
+
+
+@pytest.fixture
+def hedged_providers(monkeypatch):
+    providers = {"gpt": DelayedProvider("gpt", 0), "claude": DelayedProvider("claude", 0)}
+    monkeypatch.setattr(chat_core, "get_provider", providers.get)
+    monkeypatch.setattr(chat_core, "get_hedger", lambda: Hedger(initial_delay=0.05))
+    monkeypatch.setattr(chat_core, "get_singleflight", lambda: None)
+    return providers
+
+
+def test_primary_reply_is_cached(hedged_providers):
+    history = [{"role": "user", "content": f"Primary question {uuid.uuid4().hex}"}]
+    assert "".join(get_chat_response(history, "gpt", "gpt-4o")) == "gpt reply"
+    assert get_response_cache().get(_chat_request(history, "gpt", "gpt-4o")[1]) == "gpt reply"
+
+
+def test_hedged_reply_is_not_cached_under_the_primary(hedged_providers):
+    hedged_providers["gpt"].delay = 0.5
+    history = [{"role": "user", "content": f"Hedged question {uuid.uuid4().hex}"}]
+    usage = []
+    assert "".join(get_chat_response(history, "gpt", "gpt-4o", on_usage=usage.append)) == "claude reply"
+    assert get_response_cache().get(_chat_request(history, "gpt", "gpt-4o")[1]) is None
+    assert usage == [{"prompt_tokens": 1, "completion_tokens": 2}]
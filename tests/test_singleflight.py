@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+class Upstream:
+    """
+    A streamed call yielding `count` deltas `delay` seconds apart (forever
+    when count is None), then reporting usage or raising `error`
+    """
+
+    def __init__(self, count=3, delay=0.01, error=None):
+        self.count = count
+        self.delay = delay
+        self.error = error
+        self.opened = 0
+        self.closed = threading.Event()
+
+    def __call__(self, on_usage):
+        self.opened += 1
+        try:
+            idx = 0
+            while self.count is None or idx < self.count:
+                time.sleep(self.delay)
+                yield f"d{idx} "
+                idx += 1
+            if self.error is not None:
+                raise self.error
+            on_usage({"completion_tokens": idx})
+        finally:
+            self.closed.set()
+
+
+def read_concurrently(flights, key, upstream, readers):
+    results = [None] * readers
+    usage = [[] for _ in range(readers)]
+
+    def read(idx):
+        try:
+            results[idx] = "".join(flights.stream(key, upstream, on_usage=usage[idx].append))
+        except Exception as exc:
+            results[idx] = exc
+
+    threads = [threading.Thread(target=read, args=(idx,)) for idx in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, usage
+
+
+def test_concurrent_callers_share_one_call_and_its_usage():
+    flights, upstream = SingleFlight(), Upstream(delay=0.05)
+    results, usage = read_concurrently(flights, "key", upstream, 4)
+    assert upstream.opened == 1
+    assert results == ["d0 d1 d2 "] * 4
+    assert usage == [[{"completion_tokens": 3}]] * 4
+
+
+def test_each_follower_raises_its_own_copy_of_the_error():
+    flights, upstream = SingleFlight(), Upstream(delay=0.05, error=ValueError("upstream failed"))
+    results, _ = read_concurrently(flights, "key", upstream, 3)
+    assert all(isinstance(result, ValueError) and str(result) == "upstream failed" for result in results)
+    assert len({id(result) for result in results}) == 3
+
+
+def test_call_is_cancelled_when_the_last_reader_stops():
+    flights, upstream = SingleFlight(), Upstream(count=None)
+    first, second = flights.stream("key", upstream), flights.stream("key", upstream)
+    assert next(first) == next(second) == "d0 "
+    first.close()
+    assert not upstream.closed.wait(0.1)
+    second.close()
+    assert upstream.closed.wait(1)
+    assert flights.stats["cancelled"] == 1
+    # A new caller starts a new call rather than joining the cancelled one
+    assert next(flights.stream("key", upstream)) == "d0 "
+    assert upstream.opened == 2
+
+
+def test_async_call_is_cancelled_when_the_last_reader_stops():
+    closed = asyncio.Event()
+
+    async def upstream(on_usage):
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield "delta"
+        finally:
+            closed.set()
+
+    async def run():
+        flights = SingleFlight()
+        deltas = flights.astream("key", upstream)
+        assert await deltas.__anext__() == "delta"
+        await deltas.aclose()
+        await asyncio.wait_for(closed.wait(), 1)
+        return flights.stats["cancelled"]
+
+    assert asyncio.run(run()) == 1
+
+
+def test_do_reports_usage_and_copies_errors_for_followers():
+    flights = SingleFlight()
+    started = threading.Event()
+
+    def complete(on_usage):
+        started.set()
+        time.sleep(0.1)
+        on_usage({"completion_tokens": 5})
+        return "reply"
+
+    usage = []
+    leader = threading.Thread(target=flights.do, args=("key", complete))
+    leader.start()
+    started.wait()
+    assert flights.do("key", complete, on_usage=usage.append) == "reply"
+    leader.join()
+    assert usage == [{"completion_tokens": 5}]
+
+    error = RuntimeError("down")
+
+    def fail(on_usage):
+        started.set()
+        time.sleep(0.1)
+        raise error
+
+    started.clear()
+    leader = threading.Thread(target=lambda: pytest.raises(RuntimeError, flights.do, "key", fail))
+    leader.start()
+    started.wait()
+    with pytest.raises(RuntimeError) as raised:
+        flights.do("key", fail)
+    leader.join()
+    assert raised.value is not error and raised.value.__cause__ is error